@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+from array import array
+import itertools
+
+from traces import OP_READ, OP_WRITE
+
+def as_list(seq):
+    # NumPy arrays and `array`s are converted to lists of plain ints, which are much faster to iterate, hash and index with
+    return seq.tolist() if hasattr(seq, "tolist") else seq
+
+def as_weights(weights):
+    # The weights of a batch of records as a list, or a weight of 1 for every record if the batch is not weighted
+    return as_list(weights) if weights is not None else itertools.repeat(1)
+
+class BatchAccess():
+    '''
+    Batch entry points of the caches, which perform many word accesses in a single call.
+    A batch pays the method dispatch and the lookups of the memory geometry once, instead of once per access.
+
+    The caches mixing this in implement:
+      access_words(ops, addrs, values, report=None, weights=None)
+    which performs the accesses of parallel sequences of operations (OP_WRITE or OP_READ), addresses and values
+    (ignored for reads) in order, and returns an array of the values loaded by the reads.
+    Other operations (OP_INVALID) are skipped. If `report` is given, `report(op, addr, value)` is called right after
+    each access (and for each skipped record), with the loaded value for reads, so an output sink can interleave
+    the accesses with the main memory events they cause.
+    With `weights`, each record stands for that many accesses in a row, all hits but the first (see `run_length_encode`):
+    they are counted, and touch the replacement policy, without being performed again. Weighted records are only
+    supported by the specialized loops of write-back, write-allocate caches, and are not reported one by one.
+    '''
+
+    # The prefetcher and the timing model reported the accesses of a batch, if any (see `prefetch.py` and `timing.py`)
+    prefetcher = None
+    timing = None
+
+    def store_words(self, addrs, values):
+        # Write each value to the word at the matching address
+        self.access_words(itertools.repeat(OP_WRITE), addrs, values)
+
+    def load_words(self, addrs) -> array:
+        # Read the word at each address
+        return self.access_words(itertools.repeat(OP_READ), addrs, itertools.repeat(0))
+
+    def access_each(self, ops, addrs, values, report=None, weights=None) -> array:
+        # Perform a batch of accesses one `store_word` or `load_word` call at a time, for the configurations the
+        # specialized `access_words` loops do not model (see `WritePolicy`), reporting each access to the prefetcher
+        # and then to the timing model, which issues the next access
+        if weights is not None:
+            raise Exception("WEIGHTED RECORDS REQUIRE A WRITE-BACK, WRITE-ALLOCATE CACHE WITHOUT A BUFFER, PREFETCHER OR TIMING MODEL")
+        store_word = self.store_word
+        load_word = self.load_word
+        prefetcher = self.prefetcher
+        timing = self.timing
+        loaded = array('q')
+
+        for op, addr, value in zip(as_list(ops), as_list(addrs), as_list(values)):
+            if op == OP_WRITE or op == OP_READ:
+                misses = self.cache_write_misses + self.cache_read_misses
+                if op == OP_WRITE:
+                    store_word(addr, value)
+                else:
+                    value = load_word(addr)
+                    loaded.append(value)
+                missed = self.cache_write_misses + self.cache_read_misses > misses
+                if prefetcher is not None:
+                    prefetcher.access(addr, missed)
+                if timing is not None:
+                    timing.access(addr, missed)
+            if report is not None:
+                report(op, addr, value)
+        return loaded
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+
+import argparse
+import bisect
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from traces import write_binary_trace, OP_READ, OP_WRITE
+
+# Address space and word size of the traces, as in `Memory`
+MEMORY_SIZE = 65536
+WORD_SIZE   = 4
+BLOCK_SIZE  = 32
+
+# Synthetic access patterns, see `generate`
+PATTERNS = ('sequential', 'strided', 'random', 'zipf', 'loop')
+
+# Cache configurations benchmarked by default: (cache type, sets, ways)
+CONFIGS = (('simple', 1, 1), ('dmc', 16, 1), ('fac', 1, 16), ('sac', 8, 2))
+
+# Environment variable through which a case learns when its process was launched
+LAUNCH_TIME_ENV = "CACHE_BENCH_LAUNCH_TIME"
+
+def block_addresses(pattern, rng, stride, working_set, zipf_s):
+    '''
+    Yields an endless stream of word-aligned addresses following one of the synthetic access patterns:
+      sequential: every word of memory in order, wrapping around
+      strided:    every `stride` bytes, wrapping around
+      random:     uniformly random words
+      zipf:       blocks drawn from a Zipf distribution of exponent `zipf_s` (the hottest blocks are scattered over memory)
+      loop:       the words of the first `working_set` bytes, in order, over and over
+    '''
+    words = MEMORY_SIZE // WORD_SIZE
+    if pattern == "sequential":
+        for i in itertools.count():
+            yield (i % words) * WORD_SIZE
+    elif pattern == "strided":
+        for i in itertools.count():
+            yield (i * stride) % MEMORY_SIZE
+    elif pattern == "random":
+        while True:
+            yield rng.randrange(words) * WORD_SIZE
+    elif pattern == "zipf":
+        # Rank the blocks randomly, then draw ranks by inverting the cumulative distribution
+        blocks = list(range(MEMORY_SIZE // BLOCK_SIZE))
+        rng.shuffle(blocks)
+        cdf = list(itertools.accumulate(1 / (rank ** zipf_s) for rank in range(1, len(blocks) + 1)))
+        total = cdf[-1]
+        while True:
+            rank = min(bisect.bisect_left(cdf, rng.random() * total), len(blocks) - 1)
+            yield blocks[rank] * BLOCK_SIZE + rng.randrange(BLOCK_SIZE // WORD_SIZE) * WORD_SIZE
+    elif pattern == "loop":
+        loop_words = max(working_set // WORD_SIZE, 1)
+        for i in itertools.count():
+            yield (i % loop_words) * WORD_SIZE
+    else:
+        raise Exception(f"UNKNOWN TRACE PATTERN: {pattern}")
+
+def generate(pattern, length, write_ratio=0.3, seed=0, stride=64, working_set=4096, zipf_s=1.0):
+    '''
+    Yields `length` (op, addr, data) trace records of a synthetic access pattern.
+    Each access is a write with probability `write_ratio`, storing a random 32-bit value.
+    The records are produced lazily, so traces of any length are generated in constant memory.
+    '''
+    if stride % WORD_SIZE or not 0 < stride:
+        raise Exception("STRIDE MUST BE A POSITIVE MULTIPLE OF THE WORD SIZE")
+    rng = random.Random(seed)
+    addrs = block_addresses(pattern, rng, stride, working_set, zipf_s)
+    for addr in itertools.islice(addrs, length):
+        if rng.random() < write_ratio:
+            yield OP_WRITE, addr, rng.randrange(-2**31, 2**31)
+        else:
+            yield OP_READ, addr, 0
+
+def peak_rss_bytes():
+    # `ru_maxrss` is reported in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+def run_case(cache_type, sets, ways, trace):
+    '''
+    Benchmarks one cache configuration on one binary trace, in the current process.
+    Startup time covers everything from the process launch (interpreter start, imports, memory image load)
+    until the runner is ready to simulate.
+    '''
+    from runcache import CacheRunner
+    from traces import trace_batches
+
+    runner = CacheRunner(cache_type, ways, sets, trace, 'stats')
+    launched = os.environ.get(LAUNCH_TIME_ENV)
+    startup = time.time() - float(launched) if launched else None
+
+    start = time.perf_counter()
+    for batch in trace_batches(trace):
+        runner.simulate(batch)
+    seconds = time.perf_counter() - start
+
+    accesses = runner.c.cache_write_queries + runner.c.cache_read_queries
+    return {
+        'accesses': accesses,
+        'seconds': seconds,
+        'accesses_per_second': accesses / seconds if seconds else 0,
+        'startup_seconds': startup,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+def spawn_case(cache_type, sets, ways, trace):
+    # Each case runs in a fresh interpreter, so its startup time and peak RSS are its own
+    env = dict(os.environ, **{LAUNCH_TIME_ENV: repr(time.time())})
+    cmd = [sys.executable, os.path.abspath(__file__), '--run-case',
+           '--cachetype', cache_type, '--num_sets', str(sets), '--num_ways', str(ways), '--trace', trace]
+    # `Memory` loads its image relative to the working directory, so run from the repository
+    out = subprocess.run(cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out)
+
+def case_name(pattern, cache_type, sets, ways):
+    return f"{pattern}/{cache_type}-{sets}x{ways}"
+
+def bench(patterns, configs, length, write_ratio, seed, repeat, stride, working_set, zipf_s, workdir):
+    '''
+    Generates one binary trace per pattern and benchmarks every cache configuration on it.
+    Each case is run `repeat` times and its fastest run is kept. Returns the results keyed by case name.
+    '''
+    results = {}
+    for pattern in patterns:
+        trace = os.path.join(workdir, f"{pattern}.trc")
+        write_binary_trace(generate(pattern, length, write_ratio, seed, stride, working_set, zipf_s), trace)
+        for cache_type, sets, ways in configs:
+            runs = [spawn_case(cache_type, sets, ways, trace) for _ in range(repeat)]
+            best = max(runs, key=lambda run: run['accesses_per_second'])
+            # Startup and memory are taken as the best over the runs as well, to filter out noise
+            best['startup_seconds'] = min(run['startup_seconds'] for run in runs)
+            best['peak_rss_bytes'] = min(run['peak_rss_bytes'] for run in runs)
+            results[case_name(pattern, cache_type, sets, ways)] = best
+        os.remove(trace)
+    return results
+
+def compare(results, baseline, threshold):
+    '''
+    Compares the throughput of every case against a baseline.
+    Returns the names of the cases that are more than `threshold` (a fraction) slower than the baseline.
+    '''
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]['accesses_per_second']
+        if result['accesses_per_second'] < expected * (1 - threshold):
+            regressions.append(name)
+    return regressions
+
+def print_results(results, baseline=None):
+    print(f"{'case':<28} {'accesses/s':>12} {'vs base':>8} {'startup (s)':>12} {'peak RSS (MiB)':>15}")
+    for name, result in results.items():
+        change = ""
+        if baseline and name in baseline:
+            change = f"{result['accesses_per_second'] / baseline[name]['accesses_per_second'] - 1:+.1%}"
+        print(f"{name:<28} {result['accesses_per_second']:>12,.0f} {change:>8} "
+              f"{result['startup_seconds']:>12.3f} {result['peak_rss_bytes'] / 2**20:>15.1f}")
+
+# Function to parse command-line arguments passed to the program
+def parse_cli_args():
+
+    parser = argparse.ArgumentParser(description='benchmark the cache classes on synthetic traces')
+
+    # Arguments for specifying the synthetic traces
+    parser.add_argument(
+        '--pattern',
+        nargs='+',
+        choices=PATTERNS,
+        default=list(PATTERNS),
+        help='the access patterns to generate traces for')
+
+    parser.add_argument(
+        '--length',
+        type=float,
+        default=100000,
+        help='the number of accesses per trace (e.g. 1e6, up to 1e8)')
+
+    parser.add_argument(
+        '--write_ratio',
+        type=float,
+        default=0.3,
+        help='the fraction of accesses that are writes')
+
+    parser.add_argument(
+        '--stride',
+        type=int,
+        default=64,
+        help='the stride in bytes of the strided pattern')
+
+    parser.add_argument(
+        '--working_set',
+        type=int,
+        default=4096,
+        help='the working-set size in bytes of the loop pattern')
+
+    parser.add_argument(
+        '--zipf_s',
+        type=float,
+        default=1.0,
+        help='the exponent of the Zipf pattern')
+
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='the random seed of the generators')
+
+    # Arguments for specifying how the cases are run
+    parser.add_argument(
+        '--cachetype',
+        nargs='+',
+        choices=('simple', 'dmc', 'sac', 'fac'),
+        default=None,
+        type=str.lower,
+        help='the cache types to benchmark (defaults to simple, dmc 16, fac 16 and sac 8x2)')
+
+    parser.add_argument(
+        '--num_sets',
+        type=int,
+        default=None,
+        help='the number of sets of the benchmarked caches (with --cachetype)')
+
+    parser.add_argument(
+        '--num_ways',
+        type=int,
+        default=None,
+        help='the number of ways of the benchmarked caches (with --cachetype)')
+
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='the number of runs per case (the fastest is kept)')
+
+    # Arguments for saving and checking baselines
+    parser.add_argument(
+        '--save',
+        type=str,
+        default=None,
+        help='the JSON file to save the results to, as a baseline')
+
+    parser.add_argument(
+        '--compare',
+        type=str,
+        default=None,
+        help='the JSON baseline to compare the results against')
+
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.10,
+        help='the throughput loss (as a fraction) beyond which a case fails the comparison')
+
+    # Internal arguments used to run a single case in a child process
+    parser.add_argument('--run-case', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--trace', type=str, help=argparse.SUPPRESS)
+
+    return parser.parse_args()
+
+def select_configs(cli_args):
+    # Without --cachetype the default configurations are benchmarked, otherwise --num_sets/--num_ways apply to every type
+    if cli_args.cachetype is None:
+        return CONFIGS
+    defaults = {cache_type: (sets, ways) for cache_type, sets, ways in CONFIGS}
+    configs = []
+    for cache_type in cli_args.cachetype:
+        sets, ways = defaults[cache_type]
+        if cache_type in ("dmc", "sac") and cli_args.num_sets is not None:
+            sets = cli_args.num_sets
+        if cache_type in ("fac", "sac") and cli_args.num_ways is not None:
+            ways = cli_args.num_ways
+        configs.append((cache_type, sets, ways))
+    return configs
+
+# Main function to run the benchmarks and check them against a baseline
+def main():
+    cli_args = parse_cli_args()
+
+    if cli_args.run_case:
+        print(json.dumps(run_case(cli_args.cachetype[0], cli_args.num_sets, cli_args.num_ways, cli_args.trace)))
+        return
+
+    length = int(cli_args.length)
+    with tempfile.TemporaryDirectory(prefix="cache-bench-") as workdir:
+        results = bench(cli_args.pattern, select_configs(cli_args), length, cli_args.write_ratio, cli_args.seed,
+                        cli_args.repeat, cli_args.stride, cli_args.working_set, cli_args.zipf_s, workdir)
+
+    baseline = None
+    if cli_args.compare:
+        with open(cli_args.compare) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    if cli_args.save:
+        with open(cli_args.save, "w") as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'length': length,
+                'write_ratio': cli_args.write_ratio,
+                'seed': cli_args.seed,
+                'results': results,
+            }, f, indent=2)
+            f.write("\n")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, cli_args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than the baseline by more than {cli_args.threshold:.0%}:")
+            for name in regressions:
+                print(f"  {name}")
+            sys.exit(1)
+        print(f"\nNo case is slower than the baseline by more than {cli_args.threshold:.0%}")
+
+# Entry point of the script
+if __name__ == '__main__':
+    main()
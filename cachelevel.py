@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+class CacheLevel():
+    '''
+    Lets a cache stand in for main memory behind another cache, as a level of a `CacheHierarchy`.
+    A lower level offers the block interface of `Memory` (`mm_read`, `mm_write` and `mm_write_words`), and counts the block requests
+    it receives in the same query and miss counters as word accesses.
+
+    The caches mixing this in provide the line primitives:
+      find_line(tag)                        the valid line holding a block, or None
+      touch_line(line)                      report a hit to the replacement policy
+      claim_line(tag)                       the line a missing block will be loaded into (an invalid line or a victim)
+      evict_line(line, tag)                 unlink the block of the line claimed for `tag`, writing it back if it is dirty
+      install_line(line, tag, data, dirty)  load a block into a claimed line
+      drop_line(line)                       invalidate a line without writing it back
+
+    The inclusion policy is set on the lower level:
+      inclusive:     blocks read by the level above are also kept here, and evicting one removes it from the levels above
+      exclusive:     a block lives in only one level; this level is filled with the victims of the level above,
+                     and a block read by the level above moves up
+      non-inclusive: blocks read by the level above are kept here, but evictions are independent
+    '''
+
+    # Defaults for a cache that is not part of a hierarchy (or is its first level)
+    upper = None          # The cache above this one
+    inclusion = None      # The inclusion policy of this level with respect to the one above
+    victims_below = False # Whether the level below keeps the clean blocks evicted from this one (exclusive)
+
+    def attach(self, upper, inclusion):
+        '''
+        Places this cache below `upper`, which must have been created with this cache as its `mm`.
+        '''
+        self.upper = upper
+        self.inclusion = inclusion
+        upper.victims_below = inclusion == "exclusive"
+
+        # Tags of blocks that were dirty when they moved up, so they are written back once they come down again
+        self.dirty_above = set()
+
+        # The geometry of main memory, seen by the caches above through this level
+        self.MAIN_MEMORY_START_ADDR = self.mm.MAIN_MEMORY_START_ADDR
+        self.MAIN_MEMORY_BLOCK_SIZE = self.mm.MAIN_MEMORY_BLOCK_SIZE
+        self.MAIN_MEMORY_WORD_SIZE = self.mm.MAIN_MEMORY_WORD_SIZE
+        self.MAIN_MEMORY_WORDS_PER_BLOCK = self.mm.MAIN_MEMORY_WORDS_PER_BLOCK
+
+    # Method to read a block for the level above
+    def mm_read(self, addr):
+        tag = addr // self.MAIN_MEMORY_BLOCK_SIZE
+        self.cache_read_queries += 1
+
+        line = self.find_line(tag)
+        if line is not None:
+            if self.inclusion == "exclusive":
+                # The block moves up, and its dirtiness with it
+                if line.dirty:
+                    self.dirty_above.add(tag)
+                data = line.data
+                self.drop_line(line)
+                return data
+            self.touch_line(line)
+            return line.data[:]  # Hand out a copy, like `Memory`, so the level above cannot modify this one's block
+
+        # Fetch the missing block from the level below, keeping a copy unless this level is exclusive
+        self.cache_read_misses += 1
+        data = self.mm.mm_read(addr)
+        if self.inclusion != "exclusive":
+            self.fill_line(tag, data, False)
+            return data[:]
+        return data
+
+    # Method to write back a dirty block evicted from the level above
+    def mm_write(self, addr, block):
+        tag = addr // self.MAIN_MEMORY_BLOCK_SIZE
+        self.cache_write_queries += 1
+        self.dirty_above.discard(tag)
+        self.put_block(tag, block, True)
+
+    # Method to write some words of a block from the level above (write-through, or stores that do not allocate there)
+    def mm_write_words(self, addr, words):
+        tag = addr // self.MAIN_MEMORY_BLOCK_SIZE
+        self.cache_write_queries += 1
+        line = self.find_line(tag)
+        if line is not None:
+            for index, word in words.items():
+                line.data[index] = word
+            line.dirty = True
+            self.touch_line(line)
+        else:
+            # Lower levels allocate on writes: the rest of the block is read from below
+            self.cache_write_misses += 1
+            data = self.mm.mm_read(addr)
+            for index, word in words.items():
+                data[index] = word
+            self.fill_line(tag, data, True)
+
+    # Method to receive a clean block evicted from the level above (exclusive levels only)
+    def mm_evict(self, addr, block):
+        tag = addr // self.MAIN_MEMORY_BLOCK_SIZE
+        self.cache_write_queries += 1
+        dirty = tag in self.dirty_above
+        self.dirty_above.discard(tag)
+        self.put_block(tag, block, dirty)
+
+    def put_block(self, tag, block, dirty):
+        # Whole blocks are written, so a missing block is allocated without reading it from below
+        line = self.find_line(tag)
+        if line is not None:
+            line.data = block
+            line.dirty = line.dirty or dirty
+            self.touch_line(line)
+        else:
+            self.cache_write_misses += 1
+            self.fill_line(tag, block, dirty)
+
+    def fill_line(self, tag, data, dirty):
+        line = self.claim_line(tag)
+        if line.valid and self.inclusion == "inclusive":
+            # Keep the levels above inclusive: the victim leaves them too, and their dirty copy is the one written back
+            copy = self.upper.back_invalidate(line.tag)
+            if copy is not None:
+                line.data = copy
+                line.dirty = True
+        self.evict_line(line, tag)
+        self.install_line(line, tag, data, dirty)
+
+    def back_invalidate(self, tag):
+        '''
+        Drops a block from this cache, and from the caches above it if they are included in this one.
+        Returns the block's most recent data if any dropped copy was dirty, otherwise None.
+        '''
+        data = None
+        if self.inclusion == "inclusive":
+            data = self.upper.back_invalidate(tag)
+        line = self.find_line(tag)
+        if line is not None:
+            if data is None and line.dirty:
+                data = line.data
+            self.drop_line(line)
+        return data
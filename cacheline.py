@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+
+class CacheLine():
+    '''
+    A single line (block frame) of a cache.
+    The fields live in fixed `__slots__` instead of a per-line dict, which makes lines smaller and attribute access faster.
+    '''
+
+    __slots__ = ('data', 'tag', 'dirty', 'valid', 'last_used', 'way')
+
+    def __init__(self, way=0):
+        self.data = None      # The words of the cached block, or None if nothing was ever loaded
+        self.tag = None       # Block address divided by the block size
+        self.dirty = False    # Whether the block was modified since it was loaded from main memory
+        self.valid = False    # Whether the line holds a block
+        self.last_used = 0    # Access counter value at the last use, for LRU replacement
+        self.way = way        # Index of the line within its set, as seen by the replacement policy
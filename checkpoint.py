@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import os
+import pickle
+import struct
+
+try:
+    import zstandard
+except ImportError:  # Checkpoints are written uncompressed without it
+    zstandard = None
+
+# Checkpoint header: magic, format version and flags
+CHECKPOINT_MAGIC   = b"CCKP"
+CHECKPOINT_VERSION = 1
+CHECKPOINT_HEADER  = struct.Struct("<4sBB")
+FLAG_ZSTD          = 0x01  # The pickled state following the header is a zstd frame
+
+def snapshot(runner, compress=True):
+    '''
+    Serializes the full state of a `CacheRunner` to bytes: its configuration, its cache (lines, replacement state,
+    counters), the overlay of the blocks written to main memory and its offset in the trace.
+    The state is pickled with the binary protocol 5, and compressed with zstd when the zstandard package is available.
+    The shared base memory image and the output sink are not part of the state.
+    '''
+    if runner.engine != "scalar":
+        raise Exception("ONLY THE SCALAR ENGINE CAN BE CHECKPOINTED")
+    state = pickle.dumps(runner, protocol=5)
+    flags = 0
+    if compress and zstandard is not None:
+        state = zstandard.ZstdCompressor().compress(state)
+        flags |= FLAG_ZSTD
+    return CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, flags) + state
+
+def restore(data, output=None):
+    '''
+    Rebuilds a `CacheRunner` from a snapshot, reporting its events with the `output` sink (the snapshot's one by default).
+    A snapshot can be restored any number of times, each time into an independent runner, so a warmed-up cache can be
+    forked into many what-if continuations. Checkpoints are pickles: only restore the ones you trust.
+    '''
+    magic, version, flags = CHECKPOINT_HEADER.unpack_from(data)
+    if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+        raise Exception("INVALID CHECKPOINT HEADER")
+    state = memoryview(data)[CHECKPOINT_HEADER.size:]
+    if flags & FLAG_ZSTD:
+        if zstandard is None:
+            raise Exception("zstd-compressed checkpoints require the zstandard package")
+        state = zstandard.ZstdDecompressor().decompress(state)
+    runner = pickle.loads(state)
+    runner.attach_sink(output or runner.output)
+    return runner
+
+def save_checkpoint(runner, path, compress=True):
+    # Write the snapshot of a runner to a file, through a temporary file so an interrupted save keeps the previous checkpoint
+    data = snapshot(runner, compress)
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+def load_checkpoint(path, output=None):
+    # Restore a runner from a checkpoint file
+    with open(path, "rb") as f:
+        return restore(f.read(), output)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+from collections import Counter
+import itertools
+
+from mainmem import Memory
+from direct import DirectMappedCache
+from fully import FullyAssociativeCache
+from setassoc import SetAssociativeCache
+from sinks import SINKS, NullSink
+from traces import trace_batches, core_trace_batches, OP_READ, OP_WRITE
+
+# Snooping coherence protocols
+PROTOCOLS = ('mesi', 'msi')
+
+# Bus transactions: reads of a block to share it, reads of a block to modify it, and invalidations of shared copies
+BUS_TRANSACTIONS = ('BusRd', 'BusRdX', 'BusUpgr')
+
+def interleave(testfiles, addr_bits=16, quantum=1):
+    '''
+    Interleaves per-core traces deterministically into (core, op, addr, data) records: the cores take turns
+    in order, each performing `quantum` records of its trace per turn, until every trace has ended.
+    '''
+    traces = [itertools.chain.from_iterable(trace_batches(testfile, addr_bits)) for testfile in testfiles]
+    active = list(enumerate(traces))
+    while active:
+        for core, trace in list(active):
+            records = list(itertools.islice(trace, quantum))
+            if len(records) < quantum:
+                active.remove((core, trace))
+            for record in records:
+                yield (core, *record)
+
+class CoherentSystem():
+    '''
+    Private caches of several cores kept coherent over a snooping bus in front of a shared main memory.
+    Each core's DMC, FAC or SAC is driven through its line primitives (see `CacheLevel`), and keeps the state
+    of its lines: Modified is a valid dirty line, Exclusive a valid clean line listed in `exclusive`,
+    Shared any other valid clean line, and Invalid a line that is not valid.
+
+    On a read miss (BusRd), the other caches snoop the block: a Modified copy is supplied cache-to-cache and written
+    back, and every copy becomes Shared; the block is loaded Exclusive if no other cache holds it (MESI only).
+    On a write miss (BusRdX) the other copies are invalidated, a Modified one being supplied cache-to-cache.
+    A write hit on a Shared line invalidates the other copies (BusUpgr), while an Exclusive one is modified silently.
+    The caches write back and allocate on write misses.
+    '''
+
+    def __init__(self, caches, mm, protocol='mesi'):
+        if protocol not in PROTOCOLS:
+            raise Exception(f"UNKNOWN COHERENCE PROTOCOL: {protocol}")
+        self.caches = caches
+        self.mm = mm
+        self.protocol = protocol
+
+        # Tags of the lines of each core in the Exclusive state
+        self.exclusive = [set() for _ in caches]
+
+        # Per-core counters of the lines invalidated by other cores, the misses served by another cache,
+        # and the write hits on Shared lines, and the bus transactions by type
+        self.invalidations = [0] * len(caches)
+        self.transfers = [0] * len(caches)
+        self.upgrades = [0] * len(caches)
+        self.bus = Counter(dict.fromkeys(BUS_TRANSACTIONS, 0))
+
+    def access(self, core, op, addr, value=0):
+        # Perform a word access of a core, returning the loaded value for reads (and the written one for writes)
+        cache = self.caches[core]
+        block_size = self.mm.MAIN_MEMORY_BLOCK_SIZE
+        tag = addr // block_size
+        block_offset = (addr % block_size) // self.mm.MAIN_MEMORY_WORD_SIZE
+        line = cache.find_line(tag)
+
+        if op == OP_WRITE:
+            cache.cache_write_queries += 1
+            if line is None:
+                cache.cache_write_misses += 1
+                line = self.fill(core, tag, True)
+            else:
+                if not line.dirty:
+                    if tag in self.exclusive[core]:
+                        self.exclusive[core].discard(tag)  # Exclusive -> Modified, without a bus transaction
+                    else:
+                        self.upgrades[core] += 1
+                        self.bus['BusUpgr'] += 1
+                        self.invalidate_others(core, tag)
+                cache.touch_line(line)
+            line.data[block_offset] = value
+            line.dirty = True
+            return value
+
+        cache.cache_read_queries += 1
+        if line is None:
+            cache.cache_read_misses += 1
+            line = self.fill(core, tag, False)
+        else:
+            cache.touch_line(line)
+        return line.data[block_offset]
+
+    def invalidate_others(self, core, tag):
+        # Invalidate the copies of a block held by the other cores
+        for other, cache in enumerate(self.caches):
+            if other != core:
+                line = cache.find_line(tag)
+                if line is not None:
+                    cache.drop_line(line)
+                    self.exclusive[other].discard(tag)
+                    self.invalidations[other] += 1
+
+    def fill(self, core, tag, for_write):
+        # Load a missing block into a core's cache, after the other caches snooped the bus transaction
+        addr = tag * self.mm.MAIN_MEMORY_BLOCK_SIZE
+        self.bus['BusRdX' if for_write else 'BusRd'] += 1
+        data = None
+        shared = False
+        for other, cache in enumerate(self.caches):
+            if other == core:
+                continue
+            line = cache.find_line(tag)
+            if line is None:
+                continue
+            self.exclusive[other].discard(tag)
+            if line.dirty:
+                # The Modified copy is supplied cache-to-cache; a read also writes it back, as both copies become Shared
+                data = line.data[:]
+                self.transfers[core] += 1
+                if not for_write:
+                    self.mm.mm_write(addr, line.data)
+                    line.dirty = False
+            if for_write:
+                cache.drop_line(line)
+                self.invalidations[other] += 1
+            else:
+                shared = True
+        if data is None:
+            data = self.mm.mm_read(addr)
+
+        # Replace a line of the requesting cache, which writes back its victim if it is Modified
+        cache = self.caches[core]
+        line = cache.claim_line(tag)
+        if line.valid:
+            self.exclusive[core].discard(line.tag)
+        cache.evict_line(line, tag)
+        cache.install_line(line, tag, data, for_write)
+        if not for_write and not shared and self.protocol == "mesi":
+            self.exclusive[core].add(tag)
+        return line
+
+class MultiCoreRunner():
+    '''
+    Runs a coherent multi-core simulation: either one trace whose lines start with a core id column
+    (see `core_text_patterns`) for `cores` cores, or with `per_core_traces` one trace per core interleaved
+    deterministically (see `interleave`).
+    Each core has a private cache of the same type and geometry, in front of a shared main memory.
+    '''
+
+    def __init__(self, structure, ways, sets, cores, testfiles, output='verbose', hit_time=1, miss_penalty=10, policy='lru',
+                 geometry=None, protocol='mesi', quantum=1, transfer_time=None, per_core_traces=False):
+        if structure not in ("dmc", "fac", "sac"):
+            raise Exception("MULTI-CORE SIMULATIONS REQUIRE DMC, FAC OR SAC CACHES")
+        self.cache_type = structure
+        self.num_sets = 1 if structure == "fac" else sets
+        self.num_ways = 1 if structure == "dmc" else ways
+        if not per_core_traces and (len(testfiles) != 1 or cores is None):
+            raise Exception("A CORE ID TRACE REQUIRES A SINGLE TRACE AND A NUMBER OF CORES")
+        self.testfiles = testfiles  # A single trace with a core id column, or one trace per core
+        self.per_core_traces = per_core_traces
+        self.cores = len(testfiles) if per_core_traces else cores
+        self.quantum = quantum
+        self.geometry = geometry or {}
+        self.addr_bits = self.geometry.get('addr_bits', 16)
+        self.sink = SINKS[output](addr_digits=(self.addr_bits + 3) // 4)
+        self.mm = Memory(self.sink, **self.geometry)
+        self.hit_time = hit_time
+        self.miss_penalty = miss_penalty
+        self.transfer_time = transfer_time if transfer_time is not None else miss_penalty  # Latency of a cache-to-cache transfer
+        self.policy = policy
+
+        if structure == "dmc":
+            caches = [DirectMappedCache(sets, mm=self.mm) for _ in range(self.cores)]
+        elif structure == "fac":
+            caches = [FullyAssociativeCache(ways, policy=policy, mm=self.mm) for _ in range(self.cores)]
+        else:
+            caches = [SetAssociativeCache(sets, ways, policy=policy, mm=self.mm) for _ in range(self.cores)]
+        self.system = CoherentSystem(caches, self.mm, protocol)
+
+        self.descriptor = f"{self.cores}-core {protocol.upper()} system of {self.cache_type} caches with {self.num_sets} set(s) " \
+                          f"and {self.num_ways} way(s)" + ("" if policy == "lru" else f" ({policy} replacement)")
+        self.descriptor += "\n*******************************************"
+
+    def records(self):
+        # The interleaved (core, op, addr, data) records of the run
+        if self.per_core_traces:
+            return interleave(self.testfiles, self.addr_bits, self.quantum)
+        return itertools.chain.from_iterable(core_trace_batches(self.testfiles[0], self.addr_bits))
+
+    def run(self):
+        access = self.system.access
+        report = not isinstance(self.sink, NullSink)
+        for core, op, addr, value in self.records():
+            if op == OP_WRITE or op == OP_READ:
+                if core >= self.cores:
+                    raise Exception(f"CORE ID OUT OF RANGE: {core}")
+                value = access(core, op, addr, value)
+            if report:
+                if op == OP_WRITE:
+                    self.sink.cache_write(f"{self.cache_type}[{core}]", addr, value)
+                elif op == OP_READ:
+                    self.sink.cache_read(f"{self.cache_type}[{core}]", addr, value)
+                else:
+                    self.sink.invalid_line()
+        self.sink.flush()
+        self.print_stats()
+
+    def stats(self) -> list:
+        # The statistics of each core
+        rows = []
+        for core, cache in enumerate(self.system.caches):
+            queries = cache.cache_write_queries + cache.cache_read_queries
+            misses = cache.cache_write_misses + cache.cache_read_misses
+            transfers = self.system.transfers[core]
+            rows.append({
+                'core': core,
+                'queries': queries,
+                'hits': queries - misses,
+                'hit_rate': (queries - misses) / queries * 100 if queries else 0,
+                'transfers': transfers,
+                'invalidations': self.system.invalidations[core],
+                'upgrades': self.system.upgrades[core],
+                # Misses served by another cache take the transfer time instead of the miss penalty
+                'amat': self.hit_time + ((misses - transfers) * self.miss_penalty + transfers * self.transfer_time) / queries
+                        if queries else 0,
+            })
+        return rows
+
+    def print_stats(self):
+        print("\n\n*******************************************")
+        print(self.descriptor)
+        for row in self.stats():
+            print(f"Core {row['core']}: Hit Rate {'{:.2f}'.format(row['hit_rate'])}% ({row['hits']}/{row['queries']}), "
+                  f"{row['transfers']} cache-to-cache transfer(s), {row['invalidations']} invalidation(s) received, "
+                  f"{row['upgrades']} upgrade(s), AMAT {'{:.2f}'.format(row['amat'])} cycles")
+        print("Bus Transactions:   " + ", ".join(f"{name} {count}" for name, count in self.system.bus.items()))
+        print(f"Writes to Main Memory:   {self.mm.write_queries}")
+        print(f"Reads from Main Memory:  {self.mm.read_queries}")
+        print("*******************************************")
@@ -1,15 +1,23 @@
 #!/usr/bin/env python3
 
 from mainmem import Memory
+from cacheline import CacheLine
+from cachelevel import CacheLevel
+from batchaccess import BatchAccess, as_list, as_weights
+from writepolicy import WritePolicy
+from traces import OP_READ, OP_WRITE
+from array import array
 import math
 
-class DirectMappedCache(dict):
+class DirectMappedCache(dict, CacheLevel, BatchAccess, WritePolicy):
     '''
     Implements a direct-mapped cache with a specified number of sets (`num_sets`).
     Each memory block is mapped to a specific cache location using a hash function based on the memory address.
+    Write-back and write-allocate by default, with selectable write policies and an optional write buffer (see `WritePolicy`).
     '''
 
-    def __init__(self, num_sets):
+    def __init__(self, num_sets, sink=None, mm=None, write_policy='write-back', write_miss='write-allocate', write_buffer=0,
+                 drain_interval=10):
         # Initialize counters for cache operations
         self.cache_write_queries = 0
         self.cache_read_queries = 0
@@ -19,15 +27,21 @@ class DirectMappedCache(dict):
         # Set the number of sets in the cache
         self.num_sets = num_sets
         
-        # Create an instance of the main memory
-        self.mm = Memory()
+        # Create an instance of the main memory, reporting its events to the given sink, unless this cache sits in front of another level
+        self.mm = mm if mm is not None else Memory(sink)
+
+        # Set the write policies, and put the write buffer (if any) in front of the memory
+        self.set_write_policy(write_policy, write_miss, write_buffer, drain_interval)
         
         # Initialize the cache structure: a list of cache lines
-        self.cache = [{'data': None, 'dirty': False, 'valid': False} for _ in range(num_sets)]
+        self.cache = [CacheLine() for _ in range(num_sets)]
+
+        # Optional per-set instrumentation (see `HotspotMonitor`)
+        self.monitor = None
 
     def calculate_base_index(self, addr):
-        # Ensure the memory address is aligned to a 4-byte boundary
-        assert (addr % 4 == 0), "Misaligned Memory Address"
+        # Ensure the memory address is aligned to a word boundary
+        assert (addr % self.mm.MAIN_MEMORY_WORD_SIZE == 0), "Misaligned Memory Address"
         
         # Calculate the base address of the block containing the word
         addr_offt = ((addr - self.mm.MAIN_MEMORY_START_ADDR) % self.mm.MAIN_MEMORY_BLOCK_SIZE)
@@ -46,6 +60,35 @@ class DirectMappedCache(dict):
         '''
         return base_addr // self.mm.MAIN_MEMORY_BLOCK_SIZE % self.num_sets
     
+    # Line primitives used when this cache is a level of a hierarchy (see `CacheLevel`)
+    def find_line(self, tag):
+        line = self.cache[tag % self.num_sets]
+        return line if line.valid and line.tag == tag else None
+
+    def touch_line(self, line):
+        pass
+
+    def claim_line(self, tag):
+        return self.cache[tag % self.num_sets]
+
+    def evict_line(self, line, tag):
+        if line.valid:
+            if line.dirty:
+                self.mm.mm_write(line.tag * self.mm.MAIN_MEMORY_BLOCK_SIZE, line.data)
+            elif self.victims_below:
+                self.mm.mm_evict(line.tag * self.mm.MAIN_MEMORY_BLOCK_SIZE, line.data)
+            line.valid = False
+
+    def install_line(self, line, tag, data, dirty):
+        line.data = data
+        line.tag = tag
+        line.valid = True
+        line.dirty = dirty
+
+    def drop_line(self, line):
+        line.valid = False
+        line.dirty = False
+
     def store_word(self, w_addr, w_data):
         # Calculate the cache index and tag from the write address
         index = self.base_addr_to_dmc_index(w_addr)
@@ -57,23 +100,30 @@ class DirectMappedCache(dict):
         # Access the cache line at the calculated index
         cache_line = self.cache[index]
         self.cache_write_queries += 1
+        if self.monitor is not None and self.monitor.sampled[index]:
+            self.monitor.record(index, tag, not (cache_line.valid and cache_line.tag == tag),
+                                cache_line.valid and self.write_allocate, self.write_allocate)
 
-        if cache_line['valid'] and cache_line['tag'] == tag:
+        if cache_line.valid and cache_line.tag == tag:
             # If the block is already in the cache and valid, update the word and mark the line as dirty
-            cache_line['data'][block_offset] = w_data
-            cache_line['dirty'] = True
+            # (or write the word through, leaving the line clean)
+            cache_line.data[block_offset] = w_data
+            if self.write_through:
+                self.write_word_below(tag, block_offset, w_data)
+            else:
+                cache_line.dirty = True
+        elif not self.write_allocate:
+            # Without write allocation, the word is written below and the cache is left unchanged
+            self.write_word_below(tag, block_offset, w_data)
+            self.cache_write_misses += 1
         else:
-            # If the block is not in the cache, or the tags don't match, handle the cache miss
-            if cache_line['valid'] and cache_line['dirty']:
-                # Write the dirty block back to main memory before replacing it
-                self.mm.mm_write(cache_line['tag'] * self.mm.MAIN_MEMORY_BLOCK_SIZE, cache_line['data'])
-            
-            # Load the new block from main memory, update the word, and set the cache line's metadata
-            cache_line['data'] = self.mm.mm_read(tag * self.mm.MAIN_MEMORY_BLOCK_SIZE)
-            cache_line['data'][block_offset] = w_data
-            cache_line['tag'] = tag
-            cache_line['valid'] = True
-            cache_line['dirty'] = True
+            # If the block is not in the cache, or the tags don't match, replace it with the block from main memory
+            # (writing the dirty block back first), then update the word and mark the line as dirty
+            self.replace_line(cache_line, tag)
+            cache_line.data[block_offset] = w_data
+            cache_line.dirty = not self.write_through
+            if self.write_through:
+                self.write_word_below(tag, block_offset, w_data)
             
             # Count the cache miss
             self.cache_write_misses += 1
@@ -89,23 +139,81 @@ class DirectMappedCache(dict):
         # Access the cache line at the calculated index
         cache_line = self.cache[index]
         self.cache_read_queries += 1
+        if self.monitor is not None and self.monitor.sampled[index]:
+            self.monitor.record(index, tag, not (cache_line.valid and cache_line.tag == tag), cache_line.valid)
         
-        if cache_line['valid'] and cache_line['tag'] == tag:
+        if cache_line.valid and cache_line.tag == tag:
             # If the block is already in the cache and valid, return the requested word
-            return cache_line['data'][block_offset]
+            return cache_line.data[block_offset]
         else:
-            # If the block is not in the cache, or the tags don't match, handle the cache miss
-            if cache_line['valid'] and cache_line['dirty']:
-                # Write the dirty block back to main memory before replacing it
-                self.mm.mm_write(cache_line['tag'] * self.mm.MAIN_MEMORY_BLOCK_SIZE, cache_line['data'])
-            
-            # Load the new block from main memory, update the cache line's metadata, and return the requested word
-            cache_line['data'] = self.mm.mm_read(tag * self.mm.MAIN_MEMORY_BLOCK_SIZE)
-            cache_line['tag'] = tag
-            cache_line['valid'] = True
-            cache_line['dirty'] = False
+            # If the block is not in the cache, or the tags don't match, replace it with the block from main memory
+            # (writing the dirty block back first), and return the requested word
+            self.replace_line(cache_line, tag)
             
             # Count the cache miss
             self.cache_read_misses += 1
             
-            return cache_line['data'][block_offset]
+            return cache_line.data[block_offset]
+
+    def replace_line(self, cache_line, tag):
+        # Replace the block of a line on a miss, as a clean line (the miss path of every access)
+        if cache_line.valid and cache_line.dirty:
+            # Write the dirty block back to main memory before replacing it
+            self.mm.mm_write(cache_line.tag * self.mm.MAIN_MEMORY_BLOCK_SIZE, cache_line.data)
+        elif cache_line.valid and self.victims_below:
+            # An exclusive level below keeps the clean victims as well
+            self.mm.mm_evict(cache_line.tag * self.mm.MAIN_MEMORY_BLOCK_SIZE, cache_line.data)
+        cache_line.data = self.mm.mm_read(tag * self.mm.MAIN_MEMORY_BLOCK_SIZE)
+        cache_line.tag = tag
+        cache_line.valid = True
+        cache_line.dirty = False
+
+    def access_words(self, ops, addrs, values, report=None, weights=None) -> array:
+        # Perform a batch of accesses (see `BatchAccess`), with the memory geometry and the lines hoisted out of the loop
+        if self.word_by_word:
+            return self.access_each(ops, addrs, values, report, weights)
+        block_size = self.mm.MAIN_MEMORY_BLOCK_SIZE
+        word_size = self.mm.MAIN_MEMORY_WORD_SIZE
+        num_sets = self.num_sets
+        cache = self.cache
+        replace_line = self.replace_line
+        monitor = self.monitor
+        sampled = monitor.sampled if monitor is not None else None
+        op_write, op_read = OP_WRITE, OP_READ
+        write_queries = write_misses = read_queries = read_misses = 0
+        loaded = []
+        load = loaded.append
+
+        for op, addr, value, weight in zip(as_list(ops), as_list(addrs), as_list(values), as_weights(weights)):
+            if op == op_write:
+                tag = addr // block_size
+                index = tag % num_sets
+                cache_line = cache[index]
+                if sampled is not None and sampled[index]:
+                    monitor.record(index, tag, not (cache_line.valid and cache_line.tag == tag), cache_line.valid)
+                if not (cache_line.valid and cache_line.tag == tag):
+                    replace_line(cache_line, tag)
+                    write_misses += 1
+                cache_line.data[(addr % block_size) // word_size] = value
+                cache_line.dirty = True
+                write_queries += weight
+            elif op == op_read:
+                tag = addr // block_size
+                index = tag % num_sets
+                cache_line = cache[index]
+                if sampled is not None and sampled[index]:
+                    monitor.record(index, tag, not (cache_line.valid and cache_line.tag == tag), cache_line.valid)
+                if not (cache_line.valid and cache_line.tag == tag):
+                    replace_line(cache_line, tag)
+                    read_misses += 1
+                value = cache_line.data[(addr % block_size) // word_size]
+                load(value)
+                read_queries += weight
+            if report is not None:
+                report(op, addr, value)
+
+        self.cache_write_queries += write_queries
+        self.cache_write_misses += write_misses
+        self.cache_read_queries += read_queries
+        self.cache_read_misses += read_misses
+        return array('q', loaded)
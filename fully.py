@@ -1,15 +1,24 @@
 #!/usr/bin/env python3
 
 from mainmem import Memory
+from cacheline import CacheLine
+from cachelevel import CacheLevel
+from policies import make_policies
+from batchaccess import BatchAccess, as_list, as_weights
+from writepolicy import WritePolicy
+from traces import OP_READ, OP_WRITE
+from array import array
 import math
 
-class FullyAssociativeCache(list):
+class FullyAssociativeCache(list, CacheLevel, BatchAccess, WritePolicy):
     '''
     Simulates a fully associative cache with a specified number of cache blocks (`num_ways`).
-    Uses a Least-Recently Used (LRU) policy to evict cache blocks when necessary.
+    Evicts cache blocks with a pluggable replacement policy (see `policies.py`), Least-Recently Used (LRU) by default.
+    Write-back and write-allocate by default, with selectable write policies and an optional write buffer (see `WritePolicy`).
     '''
 
-    def __init__(self, num_ways):
+    def __init__(self, num_ways, sink=None, policy='lru', mm=None, write_policy='write-back', write_miss='write-allocate',
+                 write_buffer=0, drain_interval=10):
         # Initialize counters for cache operations
         self.cache_write_queries = 0
         self.cache_read_queries = 0
@@ -19,18 +28,30 @@ class FullyAssociativeCache(list):
         # Set the number of cache blocks (ways)
         self.num_ways = num_ways
         
-        # Create an instance of the main memory
-        self.mm = Memory()
+        # Create an instance of the main memory, reporting its events to the given sink, unless this cache sits in front of another level
+        self.mm = mm if mm is not None else Memory(sink)
+
+        # Set the write policies, and put the write buffer (if any) in front of the memory
+        self.set_write_policy(write_policy, write_miss, write_buffer, drain_interval)
         
         # Initialize the cache structure: a list of cache blocks
-        self.cache = [{'data': None, 'tag': None, 'dirty': False, 'valid': False, 'last_used': 0} for _ in range(num_ways)]
+        self.cache = [CacheLine(way) for way in range(num_ways)]
         
-        # Access counter to track the usage of cache blocks for LRU policy
+        # Access counter to track the usage of cache blocks
         self.access_counter = 0
 
+        # Index of the valid cache blocks keyed by tag
+        self.tags = {}
+
+        # Replacement policy choosing the victim among the valid blocks (LRU by default)
+        self.policy = make_policies(policy, 1, num_ways)[0]
+
+        # Stack of invalid cache blocks, with the first block of the cache on top
+        self.free = self.cache[::-1]
+
     def calculate_base_index(self, addr):
-        # Ensure the memory address is aligned to a 4-byte boundary
-        assert (addr % 4 == 0), "Misaligned Memory Address"
+        # Ensure the memory address is aligned to a word boundary
+        assert (addr % self.mm.MAIN_MEMORY_WORD_SIZE == 0), "Misaligned Memory Address"
         
         # Calculate the base address of the block containing the word
         addr_offt = ((addr - self.mm.MAIN_MEMORY_START_ADDR) % self.mm.MAIN_MEMORY_BLOCK_SIZE)
@@ -42,24 +63,78 @@ class FullyAssociativeCache(list):
         # Return the base address of the block and the index of the word within that block
         return base, index
         
-    def find_least_recently_used(self):
-        # Find and return the least recently used block in the cache
-        return min(self.cache, key=lambda x: x['last_used'])
+    def find_victim(self, tag):
+        # Invalid blocks are always used first, otherwise the replacement policy picks the victim
+        if self.free:
+            return self.free[-1]
+        return self.cache[self.policy.victim(tag)]
 
     def locate_block(self, tag):
         '''
         Searches for a cache block with the specified tag.
         Returns the block if found, otherwise returns None.
         '''
-        for block in self.cache:
-            if block['valid'] and block['tag'] == tag:
-                return block
-        return None
+        return self.tags.get(tag)
+
+    def evict_block(self, block):
+        '''
+        Removes the block returned by `find_victim` from the tag index and the replacement policy,
+        writing it back to main memory first if it is dirty.
+        '''
+        if block.valid:
+            del self.tags[block.tag]
+            self.policy.evict(block.way)
+            if block.dirty:
+                self.mm.mm_write(block.tag * self.mm.MAIN_MEMORY_BLOCK_SIZE, block.data)
+            elif self.victims_below:
+                # An exclusive level below keeps the clean victims as well
+                self.mm.mm_evict(block.tag * self.mm.MAIN_MEMORY_BLOCK_SIZE, block.data)
+        else:
+            self.free.pop()
 
     def update_usage(self, block):
         # Update the access counter and set the block's last used time to the current counter value
         self.access_counter += 1
-        block['last_used'] = self.access_counter
+        block.last_used = self.access_counter
+
+        # Report the hit to the replacement policy
+        self.policy.touch(block.way)
+
+    def insert_block(self, block):
+        # Update the access counter and set the block's last used time to the current counter value
+        self.access_counter += 1
+        block.last_used = self.access_counter
+
+        # Index the newly loaded block and report it to the replacement policy
+        self.tags[block.tag] = block
+        self.policy.insert(block.way, block.tag)
+
+    # Line primitives used when this cache is a level of a hierarchy (see `CacheLevel`)
+    def find_line(self, tag):
+        return self.locate_block(tag)
+
+    def touch_line(self, line):
+        self.update_usage(line)
+
+    def claim_line(self, tag):
+        return self.find_victim(tag)
+
+    def evict_line(self, line, tag):
+        self.evict_block(line)
+
+    def install_line(self, line, tag, data, dirty):
+        line.data = data
+        line.tag = tag
+        line.valid = True
+        line.dirty = dirty
+        self.insert_block(line)
+
+    def drop_line(self, line):
+        del self.tags[line.tag]
+        self.policy.invalidate(line.way)
+        line.valid = False
+        line.dirty = False
+        self.free.append(line)
 
     def store_word(self, w_addr, w_data):
         # Calculate the tag and block offset from the write address
@@ -70,30 +145,41 @@ class FullyAssociativeCache(list):
         block = self.locate_block(tag)
         self.cache_write_queries += 1
 
-        if block and block['valid']:
-            # If the block is found and valid, update the word and mark it as dirty
-            block['data'][block_offset] = w_data
-            block['dirty'] = True
+        if block and block.valid:
+            # If the block is found and valid, update the word and mark it as dirty (or write the word through, leaving it clean)
+            block.data[block_offset] = w_data
+            if self.write_through:
+                self.write_word_below(tag, block_offset, w_data)
+            else:
+                block.dirty = True
+
+            # Update the block's usage information for the replacement policy
+            self.update_usage(block)
+        elif not self.write_allocate:
+            # Without write allocation, the word is written below and the cache is left unchanged
+            self.write_word_below(tag, block_offset, w_data)
+            self.cache_write_misses += 1
         else:
-            # If the block is not found, find the least recently used block in the cache
-            block = self.find_least_recently_used()
+            # If the block is not found, find the block to replace in the cache
+            block = self.find_victim(tag)
             
-            # If the LRU block is dirty, write it back to main memory before replacing it
-            if block['valid'] and block['dirty']:
-                self.mm.mm_write(block['tag'] * self.mm.MAIN_MEMORY_BLOCK_SIZE, block['data'])
+            # Unlink the victim block, writing it back to main memory first if it is dirty
+            self.evict_block(block)
             
             # Load the new block from main memory, update the word, and set the block's metadata
-            block['data'] = self.mm.mm_read(tag * self.mm.MAIN_MEMORY_BLOCK_SIZE)
-            block['data'][block_offset] = w_data
-            block['tag'] = tag
-            block['valid'] = True
-            block['dirty'] = True
+            block.data = self.mm.mm_read(tag * self.mm.MAIN_MEMORY_BLOCK_SIZE)
+            block.data[block_offset] = w_data
+            block.tag = tag
+            block.valid = True
+            block.dirty = not self.write_through
+            if self.write_through:
+                self.write_word_below(tag, block_offset, w_data)
             
             # Count the cache miss
             self.cache_write_misses += 1
 
-        # Update the block's usage information for LRU management
-        self.update_usage(block)
+            # Index the block and report it to the replacement policy
+            self.insert_block(block)
 
     def load_word(self, r_addr) -> int:
         # Calculate the tag and block offset from the read address
@@ -104,27 +190,109 @@ class FullyAssociativeCache(list):
         block = self.locate_block(tag)
         self.cache_read_queries += 1
 
-        if block and block['valid']:
+        if block and block.valid:
             # If the block is found and valid, update its usage and return the requested word
             self.update_usage(block)
-            return block['data'][block_offset]
+            return block.data[block_offset]
         else:
-            # If the block is not found, find the least recently used block in the cache
-            block = self.find_least_recently_used()
+            # If the block is not found, find the block to replace in the cache
+            block = self.find_victim(tag)
             
-            # If the LRU block is dirty, write it back to main memory before replacing it
-            if block['valid'] and block['dirty']:
-                self.mm.mm_write(block['tag'] * self.mm.MAIN_MEMORY_BLOCK_SIZE, block['data'])
+            # Unlink the victim block, writing it back to main memory first if it is dirty
+            self.evict_block(block)
             
             # Load the new block from main memory, update the block's metadata, and return the requested word
-            block['data'] = self.mm.mm_read(tag * self.mm.MAIN_MEMORY_BLOCK_SIZE)
-            block['tag'] = tag
-            block['valid'] = True
-            block['dirty'] = False
+            block.data = self.mm.mm_read(tag * self.mm.MAIN_MEMORY_BLOCK_SIZE)
+            block.tag = tag
+            block.valid = True
+            block.dirty = False
             
             # Count the cache miss
             self.cache_read_misses += 1
             
-            # Update the block's usage information for LRU management
-            self.update_usage(block)
-            return block['data'][block_offset]
+            # Index the block and report it to the replacement policy
+            self.insert_block(block)
+            return block.data[block_offset]
+
+    def load_block(self, tag):
+        '''
+        Replaces a block on a miss and indexes the loaded block, like `store_word` and `load_word`
+        (with `find_victim` and `evict_block` inlined, as this is the miss path of `access_words`).
+        '''
+        if self.free:
+            block = self.free.pop()
+        else:
+            block = self.cache[self.policy.victim(tag)]
+            del self.tags[block.tag]
+            self.policy.evict(block.way)
+            if block.dirty:
+                self.mm.mm_write(block.tag * self.mm.MAIN_MEMORY_BLOCK_SIZE, block.data)
+            elif self.victims_below:
+                self.mm.mm_evict(block.tag * self.mm.MAIN_MEMORY_BLOCK_SIZE, block.data)
+        block.data = self.mm.mm_read(tag * self.mm.MAIN_MEMORY_BLOCK_SIZE)
+        block.tag = tag
+        block.valid = True
+        block.dirty = False
+        self.tags[tag] = block
+        self.policy.insert(block.way, tag)
+        return block
+
+    def access_words(self, ops, addrs, values, report=None, weights=None) -> array:
+        # Perform a batch of accesses (see `BatchAccess`), with the memory geometry, the tag index
+        # and the replacement policy hoisted out of the loop
+        if self.word_by_word:
+            return self.access_each(ops, addrs, values, report, weights)
+        block_size = self.mm.MAIN_MEMORY_BLOCK_SIZE
+        word_size = self.mm.MAIN_MEMORY_WORD_SIZE
+        find = self.tags.get
+        touch = self.policy.touch
+        touches = 1 if self.policy.idempotent_touch else None  # Touches of the repeated hits of a weighted record
+        load_block = self.load_block
+        access_counter = self.access_counter
+        op_write, op_read = OP_WRITE, OP_READ
+        write_queries = write_misses = read_queries = read_misses = 0
+        loaded = []
+        load = loaded.append
+
+        for op, addr, value, weight in zip(as_list(ops), as_list(addrs), as_list(values), as_weights(weights)):
+            if op == op_write:
+                tag = addr // block_size
+                block = find(tag)
+                if block is None:
+                    block = load_block(tag)
+                    write_misses += 1
+                else:
+                    touch(block.way)
+                access_counter += weight
+                block.last_used = access_counter
+                if weight > 1:
+                    for _ in range(touches or weight - 1):
+                        touch(block.way)
+                block.data[(addr % block_size) // word_size] = value
+                block.dirty = True
+                write_queries += weight
+            elif op == op_read:
+                tag = addr // block_size
+                block = find(tag)
+                if block is None:
+                    block = load_block(tag)
+                    read_misses += 1
+                else:
+                    touch(block.way)
+                access_counter += weight
+                block.last_used = access_counter
+                if weight > 1:
+                    for _ in range(touches or weight - 1):
+                        touch(block.way)
+                value = block.data[(addr % block_size) // word_size]
+                load(value)
+                read_queries += weight
+            if report is not None:
+                report(op, addr, value)
+
+        self.access_counter = access_counter
+        self.cache_write_queries += write_queries
+        self.cache_write_misses += write_misses
+        self.cache_read_queries += read_queries
+        self.cache_read_misses += read_misses
+        return array('q', loaded)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+from mainmem import Memory
+from direct import DirectMappedCache
+from fully import FullyAssociativeCache
+from setassoc import SetAssociativeCache
+
+# Inclusion policies of the levels below the first one (see `CacheLevel`)
+INCLUSION_POLICIES = ('inclusive', 'exclusive', 'non-inclusive')
+
+def parse_level(spec, hit_time=1):
+    '''
+    Parses a level specification "type:sets:ways[:hit_time]", e.g. "sac:8:2" or "fac:1:64:12".
+    Returns the (cache type, sets, ways, hit time) of the level.
+    '''
+    fields = spec.lower().split(":")
+    if len(fields) not in (3, 4) or fields[0] not in ("dmc", "fac", "sac"):
+        raise Exception(f"INVALID CACHE LEVEL: {spec}")
+    sets, ways = int(fields[1]), int(fields[2])
+    return fields[0], sets, ways, int(fields[3]) if len(fields) == 4 else hit_time
+
+class CacheHierarchy():
+    '''
+    Chains caches into a multi-level hierarchy in front of a single main memory.
+    Each level uses the level below it as its `mm`, and the first level receives the word accesses.
+    The counters of the first level are exposed as the hierarchy's own, so `CacheRunner` reports it like a single cache.
+    The write policies and write buffer (see `WritePolicy`) apply to the first level; the levels below write back and allocate.
+    '''
+
+    def __init__(self, levels, inclusion='non-inclusive', sink=None, policy='lru', mm=None, write_policy='write-back',
+                 write_miss='write-allocate', write_buffer=0, drain_interval=10):
+        if inclusion not in INCLUSION_POLICIES:
+            raise Exception(f"UNKNOWN INCLUSION POLICY: {inclusion}")
+        if inclusion == "exclusive" and len(levels) > 1 and (write_policy == "write-through" or write_buffer):
+            # Both would keep copies of the first level's blocks below it
+            raise Exception("AN EXCLUSIVE HIERARCHY REQUIRES A WRITE-BACK FIRST LEVEL WITHOUT A WRITE BUFFER")
+        self.inclusion = inclusion
+        self.mm = mm if mm is not None else Memory(sink)
+
+        # Build the levels from the last one up, so each is created in front of the one below
+        self.levels = []
+        below = self.mm
+        for n, (cache_type, sets, ways) in reversed(list(enumerate(levels))):
+            writes = {'write_policy': write_policy, 'write_miss': write_miss, 'write_buffer': write_buffer,
+                      'drain_interval': drain_interval} if n == 0 else {}
+            if cache_type == "dmc":
+                cache = DirectMappedCache(sets, mm=below, **writes)
+            elif cache_type == "fac":
+                cache = FullyAssociativeCache(ways, policy=policy, mm=below, **writes)
+            elif cache_type == "sac":
+                cache = SetAssociativeCache(sets, ways, policy=policy, mm=below, **writes)
+            else:
+                raise Exception(f"UNKNOWN CACHE TYPE: {cache_type}")
+            if below is not self.mm:
+                below.attach(cache, inclusion)
+            self.levels.insert(0, cache)
+            below = cache
+
+        # Word accesses, single or batched, go straight to the first level
+        self.store_word = self.levels[0].store_word
+        self.load_word = self.levels[0].load_word
+        self.access_words = self.levels[0].access_words
+        self.store_words = self.levels[0].store_words
+        self.load_words = self.levels[0].load_words
+        self.write_buffer = self.levels[0].write_buffer
+
+    @property
+    def cache_write_queries(self):
+        return self.levels[0].cache_write_queries
+
+    @property
+    def cache_read_queries(self):
+        return self.levels[0].cache_read_queries
+
+    @property
+    def cache_write_misses(self):
+        return self.levels[0].cache_write_misses
+
+    @property
+    def cache_read_misses(self):
+        return self.levels[0].cache_read_misses
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+from collections import Counter, OrderedDict
+
+# Miss classes of the "3C" model
+MISS_CLASSES = ('compulsory', 'capacity', 'conflict')
+
+class HotspotMonitor():
+    '''
+    Collects per-set accesses, misses and evictions and per-block miss counts of a DMC or SAC,
+    and classifies its misses with the "3C" model:
+      compulsory: the first access to the block
+      capacity:   a fully associative LRU cache of the same size (the shadow cache) would miss as well
+      conflict:   the shadow cache would hit, so the miss is due to the mapping of blocks to sets
+
+    The cache reports each access to a tracked set with `record`, before performing it.
+    With set sampling only every `sample_every`-th set is tracked, and the shadow cache is scaled down to the lines
+    of the tracked sets, so accesses to the other sets only cost a list lookup.
+    '''
+
+    def __init__(self, num_sets, num_ways, block_size, sample_every=1, addr_digits=4):
+        if sample_every < 1:
+            raise Exception("SAMPLING PERIOD MUST BE AT LEAST 1")
+        self.num_sets = num_sets
+        self.num_ways = num_ways
+        self.block_size = block_size
+        self.sample_every = sample_every
+        self.addr_width = addr_digits + 2  # Including the "0x" prefix
+
+        # Whether each set is tracked
+        self.sampled = [set_index % sample_every == 0 for set_index in range(num_sets)]
+        self.sampled_sets = sum(self.sampled)
+
+        # Per-set and per-block counters
+        self.set_accesses = [0] * num_sets
+        self.set_misses = [0] * num_sets
+        self.set_evictions = [0] * num_sets
+        self.block_misses = Counter()  # tag -> misses
+
+        # Misses by class, the blocks accessed so far, and the shadow fully associative LRU cache (tag -> None)
+        self.miss_classes = dict.fromkeys(MISS_CLASSES, 0)
+        self.seen = set()
+        self.shadow = OrderedDict()
+        self.shadow_lines = self.sampled_sets * num_ways
+
+    def record(self, set_index, tag, missed, evicted, allocate=True):
+        '''
+        Records an access to block `tag` in a tracked set: whether it misses in the cache,
+        and whether that miss evicts a valid block. A miss that does not `allocate` the block
+        (a store miss without write allocation) leaves the cache, and so the shadow cache, unchanged.
+        '''
+        self.set_accesses[set_index] += 1
+
+        # Access the shadow cache, whatever the outcome in the real one, unless the real one does not fill the block
+        shadow = self.shadow
+        shadow_hit = tag in shadow
+        if shadow_hit:
+            shadow.move_to_end(tag)
+        elif allocate:
+            shadow[tag] = None
+            if len(shadow) > self.shadow_lines:
+                shadow.popitem(last=False)
+
+        if missed:
+            self.set_misses[set_index] += 1
+            self.block_misses[tag] += 1
+            if evicted:
+                self.set_evictions[set_index] += 1
+
+            # Blocks are only ever hit after they missed once, so only misses need to be remembered as seen
+            # (once the block is brought into the cache, so its first fill is the compulsory miss)
+            if tag not in self.seen:
+                if allocate:
+                    self.seen.add(tag)
+                self.miss_classes['compulsory'] += 1
+            elif shadow_hit:
+                self.miss_classes['conflict'] += 1
+            else:
+                self.miss_classes['capacity'] += 1
+
+    def to_dict(self, top_blocks=100):
+        # The statistics of the tracked sets and the `top_blocks` blocks with the most misses, as a JSON-serializable dict
+        sets = [set_index for set_index in range(self.num_sets) if self.sampled[set_index]]
+        return {
+            'num_sets': self.num_sets,
+            'num_ways': self.num_ways,
+            'block_size': self.block_size,
+            'sample_every': self.sample_every,
+            'sampled_sets': self.sampled_sets,
+            'accesses': sum(self.set_accesses),
+            'misses': sum(self.set_misses),
+            'evictions': sum(self.set_evictions),
+            'miss_classes': dict(self.miss_classes),
+            'sets': [{
+                'set': set_index,
+                'accesses': self.set_accesses[set_index],
+                'misses': self.set_misses[set_index],
+                'evictions': self.set_evictions[set_index],
+            } for set_index in sets],
+            'blocks': [{
+                'addr': tag * self.block_size,
+                'set': tag % self.num_sets,
+                'misses': misses,
+            } for tag, misses in self.block_misses.most_common(top_blocks)],
+        }
+
+    def print_summary(self, top=16, bar_width=40):
+        # Print the miss classes, a histogram of the misses of the hottest sets and the blocks that miss the most
+        misses = sum(self.set_misses)
+        print(f"Hot Spots ({self.sampled_sets} of {self.num_sets} set(s) tracked, every {self.sample_every}):")
+        print("Miss Classes:       " + ", ".join(
+            f"{name} {'{:.2f}'.format(count / misses * 100 if misses else 0)}% ({count})"
+            for name, count in self.miss_classes.items()))
+
+        hottest = sorted((set_index for set_index in range(self.num_sets) if self.set_misses[set_index]),
+                         key=lambda set_index: -self.set_misses[set_index])[:top]
+        if hottest:
+            most = self.set_misses[hottest[0]]
+            print(f"Misses per Set (hottest {len(hottest)}):")
+            for set_index in hottest:
+                bar = "#" * max(round(self.set_misses[set_index] / most * bar_width), 1)
+                print(f"  set {set_index:>5} |{bar:<{bar_width}}| {self.set_misses[set_index]} miss(es) "
+                      f"in {self.set_accesses[set_index]} access(es), {self.set_evictions[set_index]} eviction(s)")
+
+        if self.block_misses:
+            print("Blocks with the Most Misses:")
+            for tag, count in self.block_misses.most_common(top // 2):
+                print(f"  {tag * self.block_size:#0{self.addr_width}x} (set {tag % self.num_sets}): {count} miss(es)")
+        print("*******************************************")
@@ -1,62 +1,174 @@
 #!/usr/bin/env python3
 
-class Memory(dict):
+from array import array
+import mmap
+import os
+import sys
+
+from sinks import PrintSink
+
+# Read-only base images shared by every `Memory` of the process, keyed by the absolute path of their initialization file
+# and their word size. Forked worker processes inherit the mappings, so the pages of an image are shared rather than copied.
+BASE_IMAGES = {}
+
+# Array type codes of the supported word sizes, in bytes
+WORD_TYPECODES = {1: "b", 2: "h", 4: "i", 8: "q"}
+
+def load_image(path, word_size=4):
+    '''
+    Returns the immutable base image of a memory initialization file as a read-only buffer of native-order words,
+    loading it on first use. The file is assumed not to change while in use.
+    '''
+    key = (os.path.abspath(path), word_size)
+    if key not in BASE_IMAGES:
+        with open(key[0], mode="rb") as mem_init:
+            if os.fstat(mem_init.fileno()).st_size == 0:
+                image = memoryview(b"")  # An empty file cannot be mapped
+            elif sys.byteorder == "little" or word_size == 1:
+                # The file is already in native word order: map it read-only, so it is loaded lazily and shared between processes
+                image = memoryview(mmap.mmap(mem_init.fileno(), 0, access=mmap.ACCESS_READ))
+            else:
+                # Big-endian hosts need the little-endian words swapped, so read the file in bulk instead
+                words = array(WORD_TYPECODES[word_size])
+                data = mem_init.read()
+                words.frombytes(data[:len(data) - len(data) % word_size])
+                words.byteswap()
+                image = memoryview(words.tobytes())
+        BASE_IMAGES[key] = image
+    return BASE_IMAGES[key]
+
+class Memory():
     '''
-    Simulates main memory by reading from a memory initialization file (`mm_init.data`).
-    The memory is represented as a dictionary where each key is an address and the value is a list of data (a memory block).
-    Provides methods to read from and write to this simulated memory.
+    Simulates a sparse main memory of `memory_size` bytes, addressed with `addr_bits`-bit addresses,
+    whose initial contents come from a memory initialization file (`mm_init.data`) and are zero past its end
+    (or everywhere, without a file).
+    The file is a read-only base image shared by every `Memory` of the process (see `load_image`),
+    and each instance records the blocks written to it in its own copy-on-write overlay,
+    so a memory only costs space for the blocks actually written, however large its address space.
+    Reads hand out private copies of blocks, so caches never modify memory except through `mm_write`.
+    Every read and write is reported to an output sink (printed by default).
     '''
 
-    def __init__(self):
+    def __init__(self, sink=None, block_size=32, word_size=4, addr_bits=16, memory_size=None, init_file="./mm_init.data"):
+        if word_size not in WORD_TYPECODES:
+            raise Exception("UNSUPPORTED WORD SIZE")
+        if block_size % word_size or block_size & (block_size - 1):
+            raise Exception("BLOCK SIZE MUST BE A POWER-OF-TWO MULTIPLE OF THE WORD SIZE")
+
         # Initialize memory configuration constants
-        self.MAIN_MEMORY_SIZE            = 65536  # Total memory size in bytes
-        self.MAIN_MEMORY_SIZE_LN         = 16     # Logarithm base 2 of memory size (16-bit addresses)
+        self.MAIN_MEMORY_ADDR_BITS       = addr_bits  # Width of the addresses in bits
+        self.MAIN_MEMORY_SIZE            = memory_size if memory_size is not None else 1 << addr_bits  # Total memory size in bytes
+        self.MAIN_MEMORY_SIZE_LN         = (self.MAIN_MEMORY_SIZE - 1).bit_length()  # Logarithm base 2 of memory size (rounded up)
         self.MAIN_MEMORY_START_ADDR      = 0x0000 # Starting address of main memory
-        self.MAIN_MEMORY_BLOCK_SIZE      = 32     # Block size in bytes
-        self.MAIN_MEMORY_BLOCK_SIZE_LN   = 5      # Logarithm base 2 of block size (5 bits)
-        self.MAIN_MEMORY_INIT_FILE       = "./mm_init.data"  # File to initialize memory contents
-        self.MAIN_MEMORY_WORD_SIZE       = 4      # Size of a word in bytes (4 bytes for RISC-V)
+        self.MAIN_MEMORY_BLOCK_SIZE      = block_size  # Block size in bytes
+        self.MAIN_MEMORY_BLOCK_SIZE_LN   = block_size.bit_length() - 1  # Logarithm base 2 of block size
+        self.MAIN_MEMORY_INIT_FILE       = init_file  # File to initialize memory contents (None for all zeros)
+        self.MAIN_MEMORY_WORD_SIZE       = word_size  # Size of a word in bytes (4 bytes for RISC-V)
         self.MAIN_MEMORY_WORDS_PER_BLOCK = self.MAIN_MEMORY_BLOCK_SIZE // self.MAIN_MEMORY_WORD_SIZE
+        self.typecode = WORD_TYPECODES[word_size]  # Array type code of a word
+
+        if self.MAIN_MEMORY_START_ADDR + self.MAIN_MEMORY_SIZE > 1 << addr_bits:
+            raise Exception("MAIN MEMORY DOES NOT FIT IN THE ADDRESS SPACE")
 
-        # Counters for read and write operations
+        # Counters for read and write operations, and for the speculative reads of prefetchers
         self.write_queries  = 0
         self.read_queries   = 0
+        self.prefetch_queries = 0
+
+        # Sink that receives the read and write events
+        self.sink = sink if sink is not None else PrintSink()
+
+        # End address (exclusive) of the memory, only whole blocks are addressable
+        self.end_addr = self.MAIN_MEMORY_START_ADDR + self.MAIN_MEMORY_SIZE - self.MAIN_MEMORY_SIZE % block_size
+
+        # Shared initial contents, covering the whole blocks of the file that fall within the memory
+        self.base = self.load_base()
+
+        # The blocks written since, keyed by block address
+        self.overlay = {}
+
+        # Initial contents of the blocks past the end of the file
+        self.zero_block = array(self.typecode, bytes(block_size))
 
-        # Initialize the memory dictionary with the first block
-        self[0] = []  
-
-        # Load memory contents from the initialization file
-        with open(self.MAIN_MEMORY_INIT_FILE, mode="rb") as mem_init:
-            i = 0   # Index representing the block-aligned address in memory
-            j = 0   # Index within a block (word index)
-            while (byte := mem_init.read(4)):  # Read 4 bytes (1 word) at a time
-                # Convert the read bytes into an integer and append to the current block
-                self[i].append(int.from_bytes(byte, byteorder="little", signed=True))
-                j += 1
-                
-                # If the block is full, move to the next block
-                if j >= self.MAIN_MEMORY_WORDS_PER_BLOCK:
-                    j = 0
-                    i += self.MAIN_MEMORY_BLOCK_SIZE
-                    self[i] = []  # Initialize the next block in memory
+    def load_base(self):
+        # The part of the shared base image covering the whole blocks of the initialization file that fall within the memory
+        base = load_image(self.MAIN_MEMORY_INIT_FILE, self.MAIN_MEMORY_WORD_SIZE) if self.MAIN_MEMORY_INIT_FILE is not None else memoryview(b"")
+        base_size = min(len(base), self.end_addr - self.MAIN_MEMORY_START_ADDR)
+        return base[:base_size - base_size % self.MAIN_MEMORY_BLOCK_SIZE]
+
+    def __getstate__(self):
+        # Pickled (e.g. in a checkpoint) without the shared base image, which is reloaded from its file, nor the sink
+        state = self.__dict__.copy()
+        state['base'] = len(self.base)
+        del state['sink']
+        return state
+
+    def __setstate__(self, state):
+        base_size = state['base']
+        self.__dict__.update(state)
+        self.sink = PrintSink()  # The default sink, until the owner of the memory attaches its own
+        self.base = self.load_base()
+        if len(self.base) != base_size:
+            raise Exception("MEMORY INITIALIZATION FILE CHANGED SINCE THE CHECKPOINT")
+
+    def __contains__(self, addr):
+        # An address is valid if it is block-aligned and falls within the memory
+        return (self.MAIN_MEMORY_START_ADDR <= addr < self.end_addr
+                and (addr - self.MAIN_MEMORY_START_ADDR) % self.MAIN_MEMORY_BLOCK_SIZE == 0)
 
     # Method to read a block of memory from the specified address
-    def mm_read(self, addr) -> list:
+    def mm_read(self, addr) -> array:
         if addr in self:
             self.read_queries += 1  # Increment the read operation counter
-            print(f"MM:  Read {self.MAIN_MEMORY_BLOCK_SIZE} bytes at {'0x{:04x}'.format(addr)}")
-            return self[addr]  # Return the block of memory as a list
+            self.sink.mm_read(self.MAIN_MEMORY_BLOCK_SIZE, addr)
+            written = self.overlay.get(addr)
+            if written is not None:
+                return written[:]  # Return a copy of the last block written
+            return self.initial_block(addr)  # Return a copy of the initial block
+        else:
+            raise Exception("INVALID MAIN MEMORY ADDRESS")  # Raise an error if the address is invalid
+
+    # Method to read a block for a prefetcher, counted apart from the demand reads
+    def mm_prefetch(self, addr) -> array:
+        if addr in self:
+            self.prefetch_queries += 1  # Increment the prefetch operation counter
+            self.sink.mm_prefetch(self.MAIN_MEMORY_BLOCK_SIZE, addr)
+            written = self.overlay.get(addr)
+            return written[:] if written is not None else self.initial_block(addr)
         else:
             raise Exception("INVALID MAIN MEMORY ADDRESS")  # Raise an error if the address is invalid
 
+    def initial_block(self, addr) -> array:
+        # A copy of the initial contents of the block at the specified (valid) address
+        start = addr - self.MAIN_MEMORY_START_ADDR
+        if start >= len(self.base):
+            return self.zero_block[:]  # Blocks past the file are materialized as zeros
+        block = array(self.typecode)
+        block.frombytes(self.base[start:start + self.MAIN_MEMORY_BLOCK_SIZE])
+        return block
+
     # Method to write a block of memory to the specified address
     def mm_write(self, addr, block):
         # Ensure that the block size matches the expected block size in words
         assert len(block) == self.MAIN_MEMORY_WORDS_PER_BLOCK, "MAINMEM ERROR: wrong sized block!"
-        
+
+        if addr in self:
+            self.write_queries += 1  # Increment the write operation counter
+            self.sink.mm_write(self.MAIN_MEMORY_BLOCK_SIZE, addr)
+            self.overlay[addr] = array(self.typecode, block)  # Record a copy of the block in the overlay
+        else:
+            raise Exception("INVALID MAIN MEMORY ADDRESS")  # Raise an error if the address is invalid
+
+    # Method to write some words of the block at the specified address, as a single write (write-through caches,
+    # stores that do not allocate, and partial write buffer entries), from a dict of word indexes to words
+    def mm_write_words(self, addr, words):
         if addr in self:
             self.write_queries += 1  # Increment the write operation counter
-            print(f"MM:  Wrote {self.MAIN_MEMORY_BLOCK_SIZE} bytes at {'0x{:04x}'.format(addr)}")
-            self[addr] = block  # Write the block to the specified address
+            self.sink.mm_write(len(words) * self.MAIN_MEMORY_WORD_SIZE, addr + min(words) * self.MAIN_MEMORY_WORD_SIZE)
+            block = self.overlay.get(addr)
+            if block is None:
+                block = self.overlay[addr] = self.initial_block(addr)
+            for index, word in words.items():
+                block[index] = word
         else:
             raise Exception("INVALID MAIN MEMORY ADDRESS")  # Raise an error if the address is invalid
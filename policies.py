@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+
+from collections import OrderedDict
+import random
+
+class ReplacementPolicy():
+    '''
+    Replacement state of a single cache set, tracking its ways by index.
+    The cache fills invalid ways by itself and only asks the policy for a victim when every way of the set is valid.
+
+    The cache calls, for each event on the set:
+      touch(way)        on a hit
+      victim(tag)       on a miss in a full set, with the tag of the incoming block; returns the way to replace
+      evict(way)        when the block in `way` is replaced
+      insert(way, tag)  once a missing block has been loaded into `way`
+      invalidate(way)   when the block in `way` is dropped without being replaced
+    '''
+
+    # Whether touching a way again right after touching it leaves the state unchanged, so that a run of hits
+    # on a block only needs one touch (see the weighted records of `BatchAccess`)
+    idempotent_touch = True
+
+    def __init__(self, num_ways):
+        self.num_ways = num_ways
+
+    def touch(self, way):
+        pass
+
+    def victim(self, tag):
+        raise NotImplementedError
+
+    def evict(self, way):
+        self.invalidate(way)
+
+    def insert(self, way, tag):
+        pass
+
+    def invalidate(self, way):
+        pass
+
+class LRUPolicy(ReplacementPolicy):
+    '''
+    Least-Recently Used: the ways are kept in an ordered dict from least to most recently used.
+    '''
+
+    def __init__(self, num_ways):
+        super().__init__(num_ways)
+        self.order = OrderedDict()
+
+    def touch(self, way):
+        self.order.move_to_end(way)
+
+    def victim(self, tag):
+        return next(iter(self.order))
+
+    def insert(self, way, tag):
+        self.order[way] = None
+
+    def invalidate(self, way):
+        del self.order[way]
+
+class FIFOPolicy(LRUPolicy):
+    '''
+    First-In First-Out: like LRU, but hits do not change the order, so the oldest block is replaced.
+    '''
+
+    def touch(self, way):
+        pass
+
+class RandomPolicy(ReplacementPolicy):
+    '''
+    Random: replaces a uniformly random way, from a seeded generator so runs are reproducible.
+    '''
+
+    def __init__(self, num_ways, seed=0):
+        super().__init__(num_ways)
+        self.rng = random.Random(seed)
+
+    def victim(self, tag):
+        return self.rng.randrange(self.num_ways)
+
+class TreePLRUPolicy(ReplacementPolicy):
+    '''
+    Tree pseudo-LRU: a binary tree of `num_ways - 1` bits, one byte per node, whose leaves are the ways.
+    Each bit points to the half of its subtree that was used less recently (0 = left, 1 = right).
+    A hit flips the bits on the way's path to point away from it, and the victim is found by following the bits,
+    so both update one node per level of the tree.
+    Requires a power-of-two number of ways.
+    '''
+
+    def __init__(self, num_ways):
+        if num_ways & (num_ways - 1):
+            raise Exception("TREE-PLRU REQUIRES A POWER-OF-TWO NUMBER OF WAYS")
+        super().__init__(num_ways)
+        self.levels = num_ways.bit_length() - 1
+        self.bits = bytearray(num_ways - 1)
+
+    def touch(self, way):
+        # Walk from the root (node 0) to the leaf, the children of node n being 2n+1 and 2n+2
+        bits = self.bits
+        node = 0
+        for level in range(self.levels - 1, -1, -1):
+            right = (way >> level) & 1
+            bits[node] = 1 - right
+            node = 2 * node + 1 + right
+
+    def victim(self, tag):
+        bits = self.bits
+        node = way = 0
+        for _ in range(self.levels):
+            right = bits[node]
+            way = 2 * way + right
+            node = 2 * node + 1 + right
+        return way
+
+    def insert(self, way, tag):
+        self.touch(way)
+
+class LFUPolicy(ReplacementPolicy):
+    '''
+    Least-Frequently Used in O(1): the ways are grouped in buckets by access count,
+    each bucket ordered from least to most recently used so ties are broken by LRU.
+    '''
+
+    idempotent_touch = False  # Every hit counts
+
+    def __init__(self, num_ways):
+        super().__init__(num_ways)
+        self.counts = {}    # way -> access count
+        self.buckets = {}   # access count -> ordered dict of the ways with that count
+        self.min_count = 0
+
+    def touch(self, way):
+        count = self.counts[way]
+        bucket = self.buckets[count]
+        del bucket[way]
+        if not bucket:
+            del self.buckets[count]
+            if self.min_count == count:
+                self.min_count = count + 1
+        self.counts[way] = count + 1
+        self.buckets.setdefault(count + 1, OrderedDict())[way] = None
+
+    def victim(self, tag):
+        return next(iter(self.buckets[self.min_count]))
+
+    def insert(self, way, tag):
+        self.counts[way] = 1
+        self.buckets.setdefault(1, OrderedDict())[way] = None
+        self.min_count = 1
+
+    def invalidate(self, way):
+        count = self.counts.pop(way)
+        bucket = self.buckets[count]
+        del bucket[way]
+        if not bucket:
+            del self.buckets[count]
+            if self.min_count == count:
+                self.min_count = min(self.buckets, default=0)
+
+class SRRIPPolicy(ReplacementPolicy):
+    '''
+    Static Re-Reference Interval Prediction with 2-bit re-reference prediction values (RRPVs).
+    Blocks are inserted with a long predicted interval (2), promoted to 0 on a hit, and the victim is a block
+    predicted to be re-referenced in the distant future (3), aging every block until one is.
+
+    The ways are kept in one bucket per RRPV, oldest first, so aging shifts the buckets instead of visiting every way.
+    Each way stores its RRPV relative to the total aging applied to the set.
+    '''
+
+    MAX_RRPV = 3
+    INSERT_RRPV = 2
+
+    def __init__(self, num_ways):
+        super().__init__(num_ways)
+        self.buckets = [OrderedDict() for _ in range(self.MAX_RRPV + 1)]
+        self.rrpv = {}  # way -> RRPV minus `age`
+        self.age = 0
+
+    def move(self, way, rrpv):
+        del self.buckets[self.rrpv[way] + self.age][way]
+        self.place(way, rrpv)
+
+    def place(self, way, rrpv):
+        self.buckets[rrpv][way] = None
+        self.rrpv[way] = rrpv - self.age
+
+    def touch(self, way):
+        self.move(way, 0)
+
+    def victim(self, tag):
+        # Age every block by the amount that brings the oldest ones to the distant RRPV
+        if not self.buckets[self.MAX_RRPV]:
+            shift = next(s for s in range(1, self.MAX_RRPV + 1) if self.buckets[self.MAX_RRPV - s])
+            self.buckets = [OrderedDict() for _ in range(shift)] + self.buckets[:-shift]
+            self.age += shift
+        return next(iter(self.buckets[self.MAX_RRPV]))
+
+    def insert(self, way, tag):
+        self.place(way, self.INSERT_RRPV)
+
+    def invalidate(self, way):
+        del self.buckets[self.rrpv.pop(way) + self.age][way]
+
+class ARCPolicy(ReplacementPolicy):
+    '''
+    Adaptive Replacement Cache (Megiddo and Modha) within a set of `num_ways` blocks.
+    Resident blocks are split between T1 (seen once recently) and T2 (seen at least twice), and the tags of blocks
+    recently evicted from each are remembered in the ghost lists B1 and B2. A miss on a ghost tag moves the target
+    size `p` of T1 towards the list it was evicted from, which makes the policy resistant to scans.
+    All four lists are ordered dicts from least to most recently used.
+    '''
+
+    idempotent_touch = False  # The first hit after a miss moves the block to T2
+
+    def __init__(self, num_ways):
+        super().__init__(num_ways)
+        self.t1 = OrderedDict()  # way -> tag
+        self.t2 = OrderedDict()  # way -> tag
+        self.b1 = OrderedDict()  # tag -> None
+        self.b2 = OrderedDict()  # tag -> None
+        self.p = 0
+
+        # Whether `victim` already adapted `p` to the incoming tag, and whether the victim leaves a ghost
+        self.adapted = False
+        self.ghost_victim = True
+
+    def adapt(self, tag):
+        if tag in self.b1:
+            self.p = min(self.num_ways, self.p + max(len(self.b2) // len(self.b1), 1))
+        elif tag in self.b2:
+            self.p = max(0, self.p - max(len(self.b1) // len(self.b2), 1))
+
+    def touch(self, way):
+        # A block hit again moves to (or within) the frequency list
+        tag = self.t1.pop(way, None)
+        if tag is None:
+            tag = self.t2.pop(way)
+        self.t2[way] = tag
+
+    def victim(self, tag):
+        self.adapt(tag)
+        self.adapted = True
+        self.ghost_victim = True
+
+        if tag not in self.b1 and tag not in self.b2:
+            # A new block: keep the ghost lists within the cache directory size of 2 * num_ways
+            if len(self.t1) + len(self.b1) >= self.num_ways:
+                if not self.b1:
+                    # T1 alone fills the set, so its oldest block is dropped without leaving a ghost
+                    self.ghost_victim = False
+                    return next(iter(self.t1))
+                self.b1.popitem(last=False)
+            elif len(self.t1) + len(self.t2) + len(self.b1) + len(self.b2) >= 2 * self.num_ways:
+                self.b2.popitem(last=False)
+
+        # Replace from T1 if it is above its target size (or at it, when the incoming block was evicted from T2)
+        if self.t1 and (not self.t2 or len(self.t1) > self.p or (tag in self.b2 and len(self.t1) == self.p)):
+            return next(iter(self.t1))
+        return next(iter(self.t2))
+
+    def evict(self, way):
+        if way in self.t1:
+            tag = self.t1.pop(way)
+            ghosts = self.b1
+        else:
+            tag = self.t2.pop(way)
+            ghosts = self.b2
+        if self.ghost_victim:
+            ghosts[tag] = None
+        self.ghost_victim = True
+
+    def insert(self, way, tag):
+        if tag in self.b1 or tag in self.b2:
+            # A ghost hit: the block was evicted too early, so it joins the frequency list
+            if not self.adapted:
+                self.adapt(tag)
+            self.b1.pop(tag, None)
+            self.b2.pop(tag, None)
+            self.t2[way] = tag
+        else:
+            self.t1[way] = tag
+        self.adapted = False
+
+        # Keep the directory bounded when blocks were filled into invalid ways without a victim
+        while self.b1 and len(self.t1) + len(self.b1) > self.num_ways:
+            self.b1.popitem(last=False)
+        while self.b2 and len(self.t1) + len(self.t2) + len(self.b1) + len(self.b2) > 2 * self.num_ways:
+            self.b2.popitem(last=False)
+
+    def invalidate(self, way):
+        if self.t1.pop(way, None) is None:
+            self.t2.pop(way)
+
+# Replacement policies selectable with `runcache.py --policy`
+POLICIES = {
+    'lru': LRUPolicy,
+    'fifo': FIFOPolicy,
+    'random': RandomPolicy,
+    'plru': TreePLRUPolicy,
+    'lfu': LFUPolicy,
+    'srrip': SRRIPPolicy,
+    'arc': ARCPolicy,
+}
+
+def make_policies(name, num_sets, num_ways):
+    # One policy instance per set; random policies are seeded by set so every set draws its own reproducible sequence
+    if name not in POLICIES:
+        raise Exception(f"UNKNOWN REPLACEMENT POLICY: {name}")
+    if name == "random":
+        return [RandomPolicy(num_ways, seed=set_index) for set_index in range(num_sets)]
+    return [POLICIES[name](num_ways) for _ in range(num_sets)]
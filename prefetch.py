@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+from collections import OrderedDict
+
+class Prefetcher():
+    '''
+    Hardware prefetcher attached to a DMC, FAC or SAC (see `attach`).
+    The cache reports each demand access once it is performed (`access`), and the prefetcher fills the blocks
+    it predicts into the cache with speculative reads (`mm_prefetch`), which main memory counts apart from demand reads.
+    Prefetches are triggered by the demand misses and by the first hit on each prefetched block (tagged prefetching),
+    so a prefetcher that predicts well stays ahead of the accesses.
+
+    Time is counted in demand accesses. A prefetched block is useful if a demand access hits it before it is evicted,
+    and late if that access comes within `latency` accesses of the prefetch, before the block would have arrived.
+    The metrics are:
+      accuracy:   useful / issued prefetches
+      coverage:   useful / (useful + misses), the share of the misses the prefetcher removed
+      timeliness: (useful - late) / useful
+    '''
+
+    def __init__(self, degree=1, latency=10):
+        if degree < 1:
+            raise Exception("PREFETCH DEGREE MUST BE AT LEAST 1")
+        self.degree = degree  # Number of blocks prefetched per trigger
+        self.latency = latency  # Number of accesses a prefetched block takes to arrive
+        self.cache = None
+        self.memory = None
+        self.time = 0
+
+        # Prefetched blocks that no demand access used yet, keyed by tag, with the time they were prefetched at
+        self.unused = {}
+
+        # Counters of the prefetches issued, the useful and late ones, and the demand misses left
+        self.issued = 0
+        self.useful = 0
+        self.late = 0
+        self.misses = 0
+
+    def attach(self, cache, memory):
+        # Attach the prefetcher to a cache in front of `memory`, the main memory bounding the blocks worth prefetching;
+        # the cache then performs its accesses one at a time, to report each of them
+        self.cache = cache
+        self.memory = memory
+        cache.prefetcher = self
+        cache.word_by_word = True
+
+    def access(self, addr, missed):
+        # Report a demand access to the word at `addr`, and whether it missed
+        tag = addr // self.memory.MAIN_MEMORY_BLOCK_SIZE
+        self.time += 1
+        issued_at = self.unused.pop(tag, None)
+        if missed:
+            # A prefetched block that misses was evicted before it was used
+            self.misses += 1
+        elif issued_at is not None:
+            self.useful += 1
+            if self.time - issued_at <= self.latency:
+                self.late += 1
+        else:
+            return
+        for target in self.predict(tag):
+            self.prefetch(target)
+
+    def predict(self, tag):
+        # The tags of the blocks to prefetch after a trigger access to block `tag`
+        raise NotImplementedError
+
+    def prefetch(self, tag):
+        # Fill a block into the cache with a speculative read, unless it is cached already or outside main memory
+        addr = tag * self.memory.MAIN_MEMORY_BLOCK_SIZE
+        if addr in self.memory and self.cache.find_line(tag) is None:
+            self.cache.fill_line(tag, self.cache.mm.mm_prefetch(addr), False)
+            self.unused[tag] = self.time
+            self.issued += 1
+
+    def counters(self) -> dict:
+        return {'issued': self.issued, 'useful': self.useful, 'late': self.late, 'misses': self.misses}
+
+class NextLinePrefetcher(Prefetcher):
+    '''
+    Next-N-line: prefetches the `degree` blocks following the block of each trigger access.
+    '''
+
+    def predict(self, tag):
+        return range(tag + 1, tag + self.degree + 1)
+
+class StridePrefetcher(Prefetcher):
+    '''
+    Stride: without program counters, looks for a constant distance between the blocks of consecutive trigger accesses,
+    and once the same non-zero stride is seen twice in a row, prefetches the next `degree` blocks along it.
+    '''
+
+    def __init__(self, degree=1, latency=10):
+        super().__init__(degree, latency)
+        self.last_tag = None
+        self.stride = 0
+
+    def predict(self, tag):
+        stride = tag - self.last_tag if self.last_tag is not None else 0
+        confirmed = stride != 0 and stride == self.stride
+        self.last_tag = tag
+        self.stride = stride
+        return [tag + stride * k for k in range(1, self.degree + 1)] if confirmed else ()
+
+class StreamBuffer(Prefetcher):
+    '''
+    Stream buffer: a FIFO of `degree` prefetched blocks beside the cache, which stands in for the memory below it.
+    A miss whose block is at the head of the buffer takes it from there instead of main memory, and the buffer
+    prefetches the block after its tail to stay full; any other miss restarts the stream after the missing block.
+    Blocks only enter the cache when a miss takes them, so the buffer never pollutes the cache.
+    Here a useful prefetch is one taken by a miss, and the misses are the ones the buffer could not serve.
+    '''
+
+    def __init__(self, degree=4, latency=10):
+        super().__init__(degree, latency)
+        self.stream = OrderedDict()  # Tag -> (block, time prefetched), from head to tail
+
+    def attach(self, cache, memory):
+        super().attach(cache, memory)
+        self.mm = cache.mm
+        cache.mm = self
+
+    def __getattr__(self, name):
+        # The buffer stands in for the memory below, so its geometry and counters are read through the buffer
+        if name.startswith("MAIN_MEMORY_") or name in ("read_queries", "write_queries"):
+            return getattr(self.mm, name)
+        raise AttributeError(name)
+
+    def access(self, addr, missed):
+        # The misses are served (or not) by `mm_read`, so only the time advances
+        self.time += 1
+
+    def push(self, tag):
+        # Prefetch a block at the tail of the stream
+        addr = tag * self.memory.MAIN_MEMORY_BLOCK_SIZE
+        if addr in self.memory:
+            self.stream[tag] = (self.mm.mm_prefetch(addr), self.time)
+            self.issued += 1
+
+    # Method to read a block for the cache on a miss, from the head of the stream if it is there
+    def mm_read(self, addr):
+        tag = addr // self.memory.MAIN_MEMORY_BLOCK_SIZE
+        if self.stream and next(iter(self.stream)) == tag:
+            block, issued_at = self.stream.pop(tag)
+            self.useful += 1
+            if self.time + 1 - issued_at <= self.latency:  # The current access is not counted yet
+                self.late += 1
+            self.push(next(reversed(self.stream)) + 1 if self.stream else tag + 1)
+            return block
+
+        self.misses += 1
+        self.stream.clear()
+        block = self.mm.mm_read(addr)
+        for next_tag in range(tag + 1, tag + self.degree + 1):
+            self.push(next_tag)
+        return block
+
+    # Methods to write blocks below, dropping their stale copies from the stream
+    def mm_write(self, addr, block):
+        self.stream.pop(addr // self.memory.MAIN_MEMORY_BLOCK_SIZE, None)
+        self.mm.mm_write(addr, block)
+
+    def mm_write_words(self, addr, words):
+        self.stream.pop(addr // self.memory.MAIN_MEMORY_BLOCK_SIZE, None)
+        self.mm.mm_write_words(addr, words)
+
+# Prefetchers selectable from `runcache.py --prefetcher`
+PREFETCHERS = {
+    'next-line': NextLinePrefetcher,
+    'stride': StridePrefetcher,
+    'stream': StreamBuffer,
+}
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import cProfile
+import os
+import pstats
+import sys
+import time
+
+# Phases of a run timed by `PhaseProfiler`, and the methods of the caches, of main memory and of the sink in each of them
+PHASES = ('parse', 'lookup', 'replacement', 'memory', 'output')
+CACHE_PHASES = {
+    'lookup': ('calculate_base_index', 'base_addr_to_dmc_index', 'calculate_set_index', 'locate_block', 'find_line'),
+    'replacement': ('replace_line', 'find_victim', 'evict_block', 'update_usage', 'insert_block', 'load_block'),
+}
+MEMORY_METHODS = ('mm_read', 'mm_write', 'mm_write_words', 'mm_prefetch')
+SINK_METHODS = ('mm_read', 'mm_write', 'mm_prefetch', 'cache_write', 'cache_read', 'invalid_line', 'flush')
+
+class PhaseProfiler():
+    '''
+    Wall-clock timers of the phases of a `CacheRunner` run:
+      parse:       reading the trace and parsing it into batches of records
+      lookup:      the index computations and tag searches of the caches
+      replacement: the victim choices, evictions and replacement state updates of the caches
+      memory:      the block reads and writes of main memory
+      output:      the events written by the output sink
+      other:       the rest of the run, mostly the access loop and the statistics
+    The methods of each phase are wrapped on the runner's own objects (see `instrument`). Time spent in a phase called
+    from another one (main memory from an eviction, the sink from main memory) is only counted in the inner phase.
+
+    The caches are driven access by access, so their lookups and replacements go through the timed methods rather than
+    the inlined loops of `access_words`: a profiled run is slower than an unprofiled one, and the report is a breakdown.
+    '''
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.calls = dict.fromkeys(PHASES, 0)
+        self.nested = []  # Time spent in the phases called by each timed call in progress, innermost last
+        self.started = time.perf_counter()
+
+    def timed(self, phase, func):
+        # Wrap a function so its calls are timed as `phase`
+        clock = time.perf_counter
+        nested = self.nested
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            nested.append(0.0)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                self.seconds[phase] += elapsed - nested.pop()
+                self.calls[phase] += 1
+                if nested:
+                    nested[-1] += elapsed
+        return wrapper
+
+    def iterate(self, phase, iterable):
+        # Yield the items of an iterable, timing the production of each one as `phase`
+        next_item = self.timed(phase, iter(iterable).__next__)
+        while True:
+            try:
+                item = next_item()
+            except StopIteration:
+                return
+            yield item
+
+    def wrap(self, obj, phase, names):
+        # Replace the methods of an object that it has among `names` by timed ones
+        for name in names:
+            method = getattr(obj, name, None)
+            if callable(method):
+                setattr(obj, name, self.timed(phase, method))
+
+    def instrument(self, runner):
+        # Time the phases of a runner's next `run`
+        if runner.engine != "scalar":
+            raise Exception("ONLY THE SCALAR ENGINE CAN BE PROFILED BY PHASE")
+        caches = getattr(runner.c, 'levels', [runner.c])
+        for cache in caches:
+            for phase, names in CACHE_PHASES.items():
+                self.wrap(cache, phase, names)
+        caches[0].word_by_word = True
+        self.wrap(runner.mm, 'memory', MEMORY_METHODS)
+        self.wrap(runner.sink, 'output', SINK_METHODS)
+        runner.profiler = self
+        self.started = time.perf_counter()
+
+    def report(self, records, file=sys.stderr):
+        # Print the time of each phase, and its share of the run
+        total = time.perf_counter() - self.started
+        seconds = dict(self.seconds, other=max(total - sum(self.seconds.values()), 0.0))
+        print(f"Profile:            {'{:.3f}'.format(total)} s for {records} record(s)"
+              f" ({'{:.0f}'.format(records / total if total else 0)} records/s)", file=file)
+        for phase, spent in seconds.items():
+            calls = f", {self.calls[phase]} call(s)" if phase in self.calls else ""
+            print(f"  {phase:<12}      {'{:.3f}'.format(spent):>9} s {'{:6.2f}'.format(spent / total * 100 if total else 0)}%{calls}",
+                  file=file)
+
+def frame_name(func):
+    # Name a (file, line, function) key of cProfile as a stack frame, without the separators of collapsed stacks
+    filename, line, name = func
+    frame = name if filename == "~" else f"{name} ({os.path.basename(filename)}:{line})"  # "~" marks built-ins
+    return frame.replace(";", ",")
+
+def collapsed_stacks(stats, min_seconds=1e-6) -> dict:
+    '''
+    Rebuilds call stacks from the statistics of cProfile (`pstats.Stats.stats`), which only record caller-callee edges:
+    the time a function spent in its own code is split between the paths leading to it, in proportion to the time
+    spent under each call edge. Returns a dict of stacks (tuples of frame names, outermost first) to seconds;
+    recursive calls end their stack, and paths worth less than `min_seconds` are dropped.
+    '''
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    stacks = {}
+    on_path = set()
+
+    def walk(func, path, share):
+        # `share` is the fraction of the time of `func` spent under `path`
+        own_time, cumulative_time = stats[func][2], stats[func][3]
+        path = path + (frame_name(func),)
+        if own_time * share >= min_seconds:
+            stacks[path] = stacks.get(path, 0.0) + own_time * share
+        on_path.add(func)
+        for callee, edge_time in callees.get(func, ()):
+            callee_time = stats[callee][3]
+            if callee not in on_path and callee_time > 0 and edge_time * share >= min_seconds:
+                walk(callee, path, share * edge_time / callee_time)
+        on_path.discard(func)
+
+    for func, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            walk(func, (), 1.0)
+    return stacks
+
+def profile_stacks(run, path):
+    '''
+    Calls `run()` under cProfile, and writes the time spent in each call stack to `path` in the collapsed-stack format
+    of flame graph tools, one `frame;frame;frame microseconds` line per stack (e.g. `flamegraph.pl path > run.svg`).
+    '''
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(run)
+    finally:
+        stacks = collapsed_stacks(pstats.Stats(profiler).stats)
+        with open(path, "w") as f:
+            for stack, seconds in sorted(stacks.items()):
+                f.write(f"{';'.join(stack)} {max(round(seconds * 1e6), 1)}\n")
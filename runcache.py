@@ -1,12 +1,27 @@
 #!/usr/bin/env python3
 
 import argparse
-import re
+import csv
+import json
+import sys
+from operator import itemgetter
 
 from simple import SimpleCache
 from direct import DirectMappedCache
 from fully import FullyAssociativeCache
 from setassoc import SetAssociativeCache
+from hierarchy import CacheHierarchy, INCLUSION_POLICIES, parse_level
+from mainmem import Memory, WORD_TYPECODES
+from sinks import SINKS, NullSink
+from policies import POLICIES
+from writepolicy import WRITE_POLICIES, WRITE_MISS_POLICIES
+from prefetch import PREFETCHERS
+from timing import TimingModel
+from coherence import MultiCoreRunner, PROTOCOLS
+from hotspots import HotspotMonitor
+from checkpoint import save_checkpoint, load_checkpoint
+from profiling import PhaseProfiler, profile_stacks
+from traces import trace_batches, OP_READ, OP_WRITE
 
 # Function to parse command-line arguments passed to the program
 def parse_cli_args():
@@ -27,13 +42,27 @@ def parse_cli_args():
         default=16,
         help='the number of ways per set')
 
+    # Arguments for specifying the timing model used to compute the average memory access time
+    parser.add_argument(
+        '--hit_time',
+        type=int,
+        default=1,
+        help='the cache hit time (in cycles)')
+
+    parser.add_argument(
+        '--miss_penalty',
+        type=int,
+        default=10,
+        help='the cache miss penalty (in cycles)')
+
     # Argument for specifying the test trace file to use
     parser.add_argument(
         '--testfile',
         type=str,
         default='tests/t1.test',
         # required=True,  # Uncomment if the testfile should be required
-        help='the test trace file (with read/write addrs and vals) to run')
+        help='the test trace file (with read/write addrs and vals) to run, in text or binary format, '
+             'optionally compressed with gzip or zstd ("-" reads it from standard input)')
 
     # Argument for specifying the type of cache to simulate
     parser.add_argument(
@@ -44,84 +73,805 @@ def parse_cli_args():
         help='the cache structure type (simple, DMC, SAC, or FAC)'
     )
 
+    # Argument for specifying the replacement policy of the FAC and SAC
+    parser.add_argument(
+        '--policy',
+        choices=tuple(POLICIES),
+        default='lru',
+        type=str.lower,
+        help='the replacement policy of associative caches (LRU, FIFO, random, tree-PLRU, LFU, SRRIP, or ARC)'
+    )
+
+    # Arguments for specifying the write policies of the cache (the first level of a hierarchy) and its write buffer
+    parser.add_argument(
+        '--write_policy',
+        choices=WRITE_POLICIES,
+        default='write-back',
+        type=str.lower,
+        help='write stores below only when their block is evicted (write-back), or right away (write-through)'
+    )
+
+    parser.add_argument(
+        '--write_miss',
+        choices=WRITE_MISS_POLICIES,
+        default='write-allocate',
+        type=str.lower,
+        help='load the block of a store that misses (write-allocate), or only write its word below (no-write-allocate)'
+    )
+
+    parser.add_argument(
+        '--write_buffer',
+        type=int,
+        default=0,
+        help='the number of entries (blocks) of a coalescing write buffer below the cache (0 for none)')
+
+    parser.add_argument(
+        '--drain_interval',
+        type=int,
+        default=None,
+        help='the number of cache accesses the memory takes to retire a buffered write (defaults to the miss penalty)')
+
+    # Arguments for specifying a hardware prefetcher
+    parser.add_argument(
+        '--prefetcher',
+        choices=('none',) + tuple(PREFETCHERS),
+        default='none',
+        type=str.lower,
+        help='the prefetcher of a dmc, fac or sac: prefetch the next blocks (next-line), along a detected stride (stride), '
+             'or into a stream buffer beside the cache (stream)')
+
+    parser.add_argument(
+        '--prefetch_degree',
+        type=int,
+        default=None,
+        help='the number of blocks prefetched per trigger, or the depth of the stream buffer (defaults to 1, and 4 for stream)')
+
+    parser.add_argument(
+        '--prefetch_latency',
+        type=int,
+        default=None,
+        help='the number of accesses a prefetched block takes to arrive, to tell late prefetches (defaults to the miss penalty)')
+
+    # Arguments for specifying the cycle-level timing model
+    parser.add_argument(
+        '--timing',
+        action='store_true',
+        help='time each access of a single cache, with non-blocking misses, and report the total, stall and memory busy cycles')
+
+    parser.add_argument(
+        '--memory_latency',
+        type=int,
+        default=None,
+        help='the number of cycles main memory takes to start sending a block (defaults to the miss penalty)')
+
+    parser.add_argument(
+        '--memory_bandwidth',
+        type=int,
+        default=8,
+        help='the number of bytes main memory transfers per cycle')
+
+    parser.add_argument(
+        '--writeback_time',
+        type=int,
+        default=None,
+        help='the number of cycles a dirty block written back occupies main memory (defaults to the transfer of a block)')
+
+    parser.add_argument(
+        '--mshrs',
+        type=int,
+        default=4,
+        help='the number of miss status holding registers of the cache, bounding the misses in flight')
+
+
+    # Arguments for specifying a multi-level hierarchy instead of a single cache
+    parser.add_argument(
+        '--levels',
+        type=str,
+        nargs='+',
+        default=None,
+        help='the levels of a cache hierarchy, from L1 down, as type:sets:ways[:hit_time] (e.g. sac:8:2:1 sac:64:8:10); '
+             'overrides --cachetype, and --miss_penalty becomes the main memory latency')
+
+    parser.add_argument(
+        '--inclusion',
+        choices=INCLUSION_POLICIES,
+        default='non-inclusive',
+        type=str.lower,
+        help='the inclusion policy of the levels of a hierarchy'
+    )
+
+    # Arguments for simulating several cores with coherent private caches
+    parser.add_argument(
+        '--cores',
+        type=int,
+        default=None,
+        help='simulate this many cores with private caches of --cachetype, kept coherent over a snooping bus; '
+             'the lines of --testfile then start with the id of the core performing the access (e.g. "1 W 0x79b0 42")')
+
+    parser.add_argument(
+        '--core_traces',
+        type=str,
+        nargs='+',
+        default=None,
+        help='simulate one core per trace, with private caches of --cachetype kept coherent over a snooping bus, '
+             'interleaving the traces round-robin')
+
+    parser.add_argument(
+        '--protocol',
+        choices=PROTOCOLS,
+        default='mesi',
+        type=str.lower,
+        help='the snooping coherence protocol of a multi-core simulation')
+
+    parser.add_argument(
+        '--quantum',
+        type=int,
+        default=1,
+        help='with --core_traces, the number of records each core performs per turn')
+
+    parser.add_argument(
+        '--transfer_time',
+        type=int,
+        default=None,
+        help='the latency of a cache-to-cache transfer in a multi-core simulation (defaults to the miss penalty)')
+
+    # Arguments for specifying the geometry of main memory
+    parser.add_argument(
+        '--block_size',
+        type=int,
+        default=32,
+        help='the block size in bytes (a power of two)')
+
+    parser.add_argument(
+        '--word_size',
+        type=int,
+        choices=tuple(WORD_TYPECODES),
+        default=4,
+        help='the word size in bytes')
+
+    parser.add_argument(
+        '--addr_bits',
+        type=int,
+        default=16,
+        help='the width of the addresses in bits (e.g. 16, 32 or 48)')
+
+    parser.add_argument(
+        '--memory_size',
+        type=lambda size: int(float(size)),
+        default=None,
+        help='the main memory size in bytes (defaults to the whole address space, e.g. 4e9)')
+
+    parser.add_argument(
+        '--mm_init',
+        type=str,
+        default='./mm_init.data',
+        help='the memory initialization file ("none" for a zero-filled memory); memory past its end reads as zeros')
+
+    # Argument for specifying how per-access events are reported
+    parser.add_argument(
+        '--output',
+        choices=tuple(SINKS),
+        default='verbose',
+        help='print every access (verbose), print them in batches (buffered), or only print the final statistics (stats)'
+    )
+
+    # Argument for specifying the simulation engine
+    parser.add_argument(
+        '--engine',
+        choices=('scalar', 'numpy'),
+        default='scalar',
+        help='simulate access by access (scalar), or compute only the statistics over the whole trace with NumPy (numpy)'
+    )
+
+    # Arguments for instrumenting the sets and blocks of a DMC or SAC
+    parser.add_argument(
+        '--hotspots',
+        action='store_true',
+        help='track per-set and per-block misses of a dmc or sac, classify them as compulsory, capacity or conflict misses, '
+             'and print a histogram of the hottest sets')
+
+    parser.add_argument(
+        '--sample_every',
+        type=int,
+        default=1,
+        help='with --hotspots, only track every Nth set (set sampling), to keep the overhead low on large caches')
+
+    parser.add_argument(
+        '--hotspots_json',
+        type=str,
+        default=None,
+        help='with --hotspots, also write the per-set and per-block statistics to this JSON file')
+
+    # Arguments for leaving the warm-up out of the statistics and reporting them over time
+    parser.add_argument(
+        '--warmup',
+        type=lambda count: int(float(count)),
+        default=0,
+        help='leave the accesses of the first N trace records out of the statistics (the cache still warms up on them)')
+
+    parser.add_argument(
+        '--interval',
+        type=lambda count: int(float(count)),
+        default=None,
+        help='also report the hit rate, main memory reads/writes and AMAT of every window of N trace records, as CSV rows')
+
+    parser.add_argument(
+        '--interval_out',
+        type=str,
+        default='-',
+        help='the file to stream the interval statistics to ("-" for stdout)')
+
+    # Arguments for checkpointing the simulation and resuming it
+    parser.add_argument(
+        '--checkpoint',
+        type=str,
+        default=None,
+        help='the file to save the simulation state to at the end of the run (and every --checkpoint_every records)')
+
+    parser.add_argument(
+        '--checkpoint_every',
+        type=lambda count: int(float(count)),
+        default=None,
+        help='with --checkpoint, also save the state every N trace records (e.g. 1e7), overwriting the previous checkpoint')
+
+    parser.add_argument(
+        '--stop_after',
+        type=lambda count: int(float(count)),
+        default=None,
+        help='stop once N records of the trace were simulated (e.g. to warm up a cache and checkpoint it)')
+
+    parser.add_argument(
+        '--resume',
+        type=str,
+        default=None,
+        help='restore the state from a checkpoint and continue its trace where it stopped (the cache options are ignored)')
+
+    parser.add_argument(
+        '--warm',
+        type=str,
+        default=None,
+        help='restore the state from a checkpoint and run --testfile from its start on top of it, as a what-if continuation')
+
+    # Arguments for profiling the simulator itself
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='time the trace parsing, cache lookups, replacements, main memory and output of the run, and report them on stderr')
+
+    parser.add_argument(
+        '--profile_stacks',
+        type=str,
+        default=None,
+        help='run under cProfile and write the time of each call stack to this file, in the collapsed format of flame graphs')
+
     # Parse the arguments and return them as a namespace object
-    return parser.parse_args()
+    cli_args = parser.parse_args()
+
+    # A multi-core run reads either one trace per core, or a single --testfile whose lines start with a core id
+    if cli_args.core_traces and cli_args.cores is not None and cli_args.cores != len(cli_args.core_traces):
+        parser.error("--cores must match the number of --core_traces (one core per trace)")
+    if cli_args.cores is not None and cli_args.cores < 1:
+        parser.error("--cores must be at least 1")
+    return cli_args
+
+# Columns of the interval statistics, one row per window of records
+INTERVAL_FIELDS = ('records', 'warmup', 'accesses', 'hit_rate', 'mm_reads', 'mm_writes', 'amat')
 
 # Class to run the cache simulation based on provided configuration
 class CacheRunner():
-    def __init__(self, structure, ways, sets, testfile):
+    profiler = None  # Phase timers of the run, if it is profiled (see `PhaseProfiler`)
+
+    def __init__(self, structure, ways, sets, testfile, output='verbose', engine='scalar', hit_time=1, miss_penalty=10,
+                 policy='lru', levels=None, inclusion='non-inclusive', geometry=None, hotspots=None, hotspots_json=None,
+                 warmup=0, write_policy='write-back', write_miss='write-allocate', write_buffer=0, drain_interval=None,
+                 prefetcher=None, prefetch_degree=None, prefetch_latency=None, timing=False, memory_latency=None,
+                 memory_bandwidth=8, writeback_time=None, mshrs=4):
         self.cache_type = structure  # Store the type of cache structure
         self.testfile = testfile  # Store the test file path
-        self.hit_time = 1  # Set the default hit time for cache hits
-        self.miss_penalty = 10  # Set the default miss penalty (for quantitative modeling)
+        self.engine = engine  # Store the simulation engine (scalar or numpy)
+        self.geometry = geometry or {}  # Keyword arguments of `Memory` (block_size, word_size, addr_bits, memory_size, init_file)
+        self.addr_bits = self.geometry.get('addr_bits', 16)  # Width of the trace addresses in bits
+        self.output = output  # Store the output mode
+        self.sink = SINKS[output](addr_digits=(self.addr_bits + 3) // 4)  # Sink that receives the per-access events of the runner, cache and memory
+        self.mm = Memory(self.sink, **self.geometry)  # Main memory shared by every level of the cache
+        self.offset = 0  # Number of trace records simulated so far
+        self.warmup = warmup  # Number of trace records whose accesses are left out of the statistics
+        self.baseline = None  # The counters at the end of the warm-up, subtracted from the statistics
+        self.window = None  # The counters at the start of the current statistics window
+        self.hit_time = hit_time  # Set the hit time for cache hits
+        self.miss_penalty = miss_penalty  # Set the miss penalty (for quantitative modeling)
+        self.policy = policy  # Set the replacement policy of associative caches
+        self.levels = levels  # The (type, sets, ways, hit time) of each level of a hierarchy, or None for a single cache
+        self.write_policy = write_policy  # Set the policy on write hits (write-back or write-through)
+        self.write_miss = write_miss  # Set the policy on write misses (write-allocate or no-write-allocate)
+        self.write_buffer = write_buffer  # Set the number of entries of the write buffer (0 for none)
+        self.drain_interval = drain_interval or miss_penalty  # Set the number of accesses taken to retire a buffered write
+        writes = {'write_policy': write_policy, 'write_miss': write_miss, 'write_buffer': write_buffer,
+                  'drain_interval': self.drain_interval}
+
+        # A timed cache is built on the timing model, which stands in for main memory
+        self.timing = None
+        below = self.mm
+        if timing:
+            if self.levels:
+                raise Exception("THE TIMING MODEL REQUIRES A SINGLE CACHE")
+            below = self.timing = TimingModel(self.mm, memory_latency if memory_latency is not None else miss_penalty,
+                                              memory_bandwidth, writeback_time, mshrs, hit_time)
         
         # Initialize the appropriate cache structure based on the cache type
-        if (self.cache_type == "simple"):
-            self.c = SimpleCache()  # Simple cache (no actual caching)
+        if self.levels:
+            # A hierarchy is driven through its first level, whose type names the accesses
+            self.cache_type = self.levels[0][0]
+            self.hit_time = self.levels[0][3]
+            self.c = CacheHierarchy([level[:3] for level in self.levels], inclusion, self.sink, self.policy, self.mm, **writes)
+            self.descriptor = f"{len(self.levels)}-level {inclusion} cache hierarchy{self.policy_descriptor()}"
+            for n, (cache_type, sets, ways, level_hit_time) in enumerate(self.levels, 1):
+                self.descriptor += f"\nL{n}: {cache_type} cache with {sets} set(s) and {ways} way(s), {level_hit_time} cycle(s) per hit"
+            self.descriptor += "\n*******************************************"
+        elif (self.cache_type == "simple"):
+            if write_policy != "write-back" or write_miss != "write-allocate":
+                raise Exception("THE SIMPLE CACHE HAS NO WRITE POLICIES")
+            self.c = SimpleCache(self.sink, below, write_buffer, self.drain_interval)  # Simple cache (no actual caching)
             self.descriptor = f"{self.cache_type} cache\n*******************************************"
         elif (self.cache_type == "dmc"):
             self.num_sets = sets  # Direct-mapped cache with the specified number of sets
-            self.c = DirectMappedCache(self.num_sets)
+            self.c = DirectMappedCache(self.num_sets, self.sink, below, **writes)
             self.descriptor = f"{self.cache_type} cache with {self.num_sets} set(s)\n*******************************************"
         elif (self.cache_type == "fac"):
             self.num_ways = ways  # Fully associative cache with the specified number of ways
-            self.c = FullyAssociativeCache(self.num_ways)
-            self.descriptor = f"{self.cache_type} cache with {self.num_ways} way(s)\n*******************************************"
+            self.c = FullyAssociativeCache(self.num_ways, self.sink, self.policy, below, **writes)
+            self.descriptor = f"{self.cache_type} cache with {self.num_ways} way(s){self.policy_descriptor()}\n*******************************************"
         elif (self.cache_type == "sac"):
             self.num_sets = sets  # Set-associative cache with the specified number of sets and ways
             self.num_ways = ways
-            self.c = SetAssociativeCache(self.num_sets, self.num_ways)
-            self.descriptor = f"{self.cache_type} cache with {self.num_sets} set(s) and {self.num_ways} way(s)\n*******************************************"
-
-    # Method to run the cache simulation using the provided test file
-    def run(self):
-        with open(self.testfile, "r") as t:
-            # Process each line in the test file
-            while(line := t.readline()):
-                # Handle write operations by matching the pattern "W <address> <data>"
-                if matches := re.search(r"^W\s+(0x[0-9a-zA-Z]{4})\s+(-?[0-9]+)\s*$", line):
-                    addr = int(matches.group(1), base=16)  # Convert address from hex to int
-                    data = int(matches.group(2))  # Convert data to int
-                    self.c.store_word(addr, data)  # Store the word in the cache
-                    print(f"{self.cache_type}: Wrote to {'0x{:04x}'.format(addr)}: {data}\n")
-                # Handle read operations by matching the pattern "R <address>"
-                elif matches := re.search(r"^R\s+(0x[0-9a-zA-Z]{4})\s*$", line):
-                    addr = int(matches.group(1), base=16)  # Convert address from hex to int
-                    readval = self.c.load_word(addr)  # Load the word from the cache
-                    print(f"{self.cache_type}: Read from {'0x{:04x}'.format(addr)} the value: {readval}\n")
-                else:
-                    print("Invalid test format")  # Print an error message for invalid format
+            self.c = SetAssociativeCache(self.num_sets, self.num_ways, self.sink, self.policy, below, **writes)
+            self.descriptor = f"{self.cache_type} cache with {self.num_sets} set(s) and {self.num_ways} way(s){self.policy_descriptor()}\n*******************************************"
+
+        # Attach the hot-spot instrumentation, tracking every `hotspots`-th set
+        self.monitor = None
+        self.hotspots_json = hotspots_json
+        if hotspots is not None:
+            if self.levels or self.cache_type not in ("dmc", "sac"):
+                raise Exception("HOT-SPOT INSTRUMENTATION REQUIRES A SINGLE DMC OR SAC")
+            self.monitor = HotspotMonitor(self.num_sets, getattr(self, 'num_ways', 1), self.mm.MAIN_MEMORY_BLOCK_SIZE,
+                                          hotspots, (self.addr_bits + 3) // 4)
+            self.c.monitor = self.monitor
+
+        # Attach the prefetcher, with its own default degree unless one is given
+        self.prefetcher = None
+        if prefetcher is not None:
+            if self.levels or self.cache_type not in ("dmc", "fac", "sac"):
+                raise Exception("PREFETCHERS REQUIRE A SINGLE DMC, FAC OR SAC")
+            degree = {'degree': prefetch_degree} if prefetch_degree else {}
+            self.prefetcher = PREFETCHERS[prefetcher](latency=prefetch_latency or miss_penalty, **degree)
+            self.prefetcher.attach(self.c, self.mm)
+            self.prefetcher_name = prefetcher
+
+        if self.timing is not None:
+            self.timing.attach(self.c)
+
+    # Method to name the replacement policy in the descriptor, if it is not the default LRU
+    def policy_descriptor(self):
+        return "" if self.policy == "lru" else f" ({self.policy} replacement)"
+
+    # Method to describe the write policies and write buffer, if they are not the default write-back, write-allocate cache
+    def write_descriptor(self):
+        if self.write_policy == "write-back" and self.write_miss == "write-allocate" and not self.write_buffer:
+            return ""
+        descriptor = f"{self.write_policy}, {self.write_miss}"
+        if self.write_buffer:
+            descriptor += f", {self.write_buffer}-entry write buffer retiring a write every {self.drain_interval} access(es)"
+        return descriptor
+
+    # Methods to checkpoint the runner without its sink, and to attach a new one once it is restored
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['sink']
+        return state
+
+    def attach_sink(self, output):
+        self.output = output
+        self.sink = SINKS[output](addr_digits=(self.addr_bits + 3) // 4)
+        self.mm.sink = self.sink
+
+    # Method to run the cache simulation using the provided test file (text or binary trace, file or stream)
+    def run(self, checkpoint=None, checkpoint_every=None, stop_after=None, interval=None, interval_out=None):
+        '''
+        Simulates the trace from the current offset (its start, unless the runner was restored from a checkpoint)
+        and prints the statistics. With `checkpoint`, the state is saved to that file when the run ends,
+        and every `checkpoint_every` records; with `stop_after`, the run ends once that many records were simulated.
+        With `interval`, the statistics of every window of that many records are written as CSV rows to `interval_out`
+        (a file path, or stdout by default).
+        '''
+        if self.engine == "numpy":
+            if self.warmup or interval:
+                raise Exception("THE NUMPY ENGINE DOES NOT SUPPORT WARM-UP OR INTERVAL STATISTICS")
+            if checkpoint or checkpoint_every or stop_after is not None:
+                raise Exception("THE NUMPY ENGINE DOES NOT SUPPORT CHECKPOINTS")
+            self.run_vectorized()
+            return
+
+        windows = None
+        if interval:
+            # A resumed run appends its windows to those written before the checkpoint
+            resumed = self.offset > 0
+            out = open(interval_out, "a" if resumed else "w", newline="") if interval_out and interval_out != "-" else sys.stdout
+            windows = csv.DictWriter(out, fieldnames=INTERVAL_FIELDS)
+            if not resumed:
+                windows.writeheader()
+            if self.window is None:
+                self.window = self.counters()
+
+        # The trace is streamed in batches, so it is never held in memory as a whole
+        stopped = stop_after is not None and self.offset >= stop_after
+        batches = trace_batches(self.testfile, self.addr_bits, skip=self.offset, weighted=self.weighted()) if not stopped else ()
+        if self.profiler is not None:
+            batches = self.profiler.iterate('parse', batches)
+        try:
+            for batch in batches:
+                while batch and not stopped:
+                    # Cut the batch at the next checkpoint, window, end of the warm-up or stop offset
+                    end = len(batch)
+                    for every in (checkpoint_every if checkpoint else None, interval):
+                        if every:
+                            end = min(end, every - self.offset % every)
+                    for limit in (stop_after, self.warmup if self.baseline is None else None):
+                        if limit and limit > self.offset:
+                            end = min(end, limit - self.offset)
+                    self.simulate(batch[:end] if end < len(batch) else batch)
+                    self.offset += end
+                    batch = batch[end:]
+
+                    if self.warmup and self.baseline is None and self.offset >= self.warmup:
+                        self.baseline = self.counters()
+                    if interval and self.offset % interval == 0:
+                        self.write_window(windows, interval)
+                    if checkpoint and checkpoint_every and self.offset % checkpoint_every == 0:
+                        save_checkpoint(self, checkpoint)
+                    stopped = stop_after is not None and self.offset >= stop_after
+                if stopped:
+                    break
+
+            # The last window may be shorter than the others
+            if interval and self.offset % interval:
+                self.write_window(windows, interval)
+        finally:
+            if windows is not None and out is not sys.stdout:
+                out.close()
+
+        if checkpoint:
+            save_checkpoint(self, checkpoint)
+        self.sink.flush()  # Write out any buffered events before the statistics
         self.print_stats()  # Print the cache statistics after processing the test file
 
-    # Method to print cache performance statistics
-    def print_stats(self):
-        print("\n\n*******************************************")
-        write_hits      = self.c.cache_write_queries - self.c.cache_write_misses
-        write_hit_rate  = write_hits/self.c.cache_write_queries * 100 if self.c.cache_write_queries else 0
-        read_hits       = self.c.cache_read_queries - self.c.cache_read_misses
-        read_hit_rate   = read_hits/self.c.cache_read_queries * 100 if self.c.cache_read_queries else 0
+        if self.monitor is not None:
+            self.monitor.print_summary()
+            if self.hotspots_json:
+                with open(self.hotspots_json, "w") as f:
+                    json.dump(self.monitor.to_dict(), f, indent=2)
+                    f.write("\n")
+
+    # Method to write the statistics of the window ending at the current offset, from the counter deltas
+    def write_window(self, windows, interval):
+        counters = self.counters()
+        stats = self.stats({name: count - self.window[name] for name, count in counters.items()})
+        self.window = counters
+        self.sink.flush()  # Keep the rows in order with any buffered events on stdout
+        windows.writerow({
+            'records': self.offset,
+            'warmup': int((self.offset - 1) // interval * interval < self.warmup),  # Whether the window overlaps the warm-up
+            'accesses': stats['total_queries'],
+            'hit_rate': round(stats['total_hit_rate'], 4),
+            'mm_reads': stats['mm_reads'],
+            'mm_writes': stats['mm_writes'],
+            'amat': round(stats['amat'], 4),
+        })
+
+    # Method to give the (block size, word size) of the run-length encoded traces the cache can simulate, if any
+    def weighted(self):
+        # Weighted records are performed by the specialized loops, without reporting the accesses they stand for
+        if not isinstance(self.sink, NullSink) or getattr(self.c, 'levels', [self.c])[0].word_by_word or self.monitor is not None:
+            return None
+        return (self.mm.MAIN_MEMORY_BLOCK_SIZE, self.mm.MAIN_MEMORY_WORD_SIZE)
+
+    # Method to feed a list of (op, addr, data) trace records to the cache, as a single batch
+    def simulate(self, records):
+        # Each access is reported as soon as the cache has performed it, so it follows the memory events it caused;
+        # without output, the accesses are not reported at all
+        report = None if isinstance(self.sink, NullSink) else self.report
+        if records and len(records[0]) == 4:
+            # The records of a run-length encoded trace stand for runs of accesses to a block (see `traces.py --rle`)
+            ops, addrs, values, weights = (list(map(itemgetter(column), records)) for column in range(4))
+            self.c.access_words(ops, addrs, values, None, weights)
+            return
+        ops, addrs, values = (list(map(itemgetter(column), records)) for column in range(3))
+        self.c.access_words(ops, addrs, values, report)
+
+    # Method to report one performed access (or invalid record) to the sink
+    def report(self, op, addr, value):
+        if op == OP_WRITE:
+            self.sink.cache_write(self.cache_type, addr, value)
+        elif op == OP_READ:
+            self.sink.cache_read(self.cache_type, addr, value)
+        else:
+            self.sink.invalid_line()  # Report an error message for invalid format
+
+    # Method to compute only the cache statistics, over the whole trace at once
+    def run_vectorized(self):
+        import vectorized  # NumPy is only required by this engine
+
+        if self.levels:
+            raise Exception("THE NUMPY ENGINE ONLY MODELS A SINGLE CACHE")
+        if self.policy != "lru" and self.cache_type in ("fac", "sac"):
+            raise Exception("THE NUMPY ENGINE ONLY MODELS LRU REPLACEMENT")
+        if self.monitor is not None:
+            raise Exception("THE NUMPY ENGINE DOES NOT SUPPORT HOT-SPOT INSTRUMENTATION")
+        if self.write_descriptor():
+            raise Exception("THE NUMPY ENGINE ONLY MODELS WRITE-BACK, WRITE-ALLOCATE CACHES WITHOUT A WRITE BUFFER")
+        if self.prefetcher is not None:
+            raise Exception("THE NUMPY ENGINE DOES NOT MODEL PREFETCHERS")
+        if self.timing is not None:
+            raise Exception("THE NUMPY ENGINE HAS NO TIMING MODEL")
+
+        ops, addrs = vectorized.load_trace(self.testfile, self.addr_bits)
+        # The computed counters replace the cache, and are reported like the counters of a simulated one
+        self.c = vectorized.simulate(self.cache_type, ops, addrs, getattr(self, 'num_sets', 1), getattr(self, 'num_ways', 1),
+                                     self.c.mm.MAIN_MEMORY_BLOCK_SIZE)
+        self.print_stats()
+
+    # Method to read the raw counters of the cache (and of the lower levels of a hierarchy) and of main memory
+    def counters(self) -> dict:
+        counters = {
+            'write_queries': self.c.cache_write_queries,
+            'read_queries': self.c.cache_read_queries,
+            'write_misses': self.c.cache_write_misses,
+            'read_misses': self.c.cache_read_misses,
+            'mm_writes': self.c.mm.write_queries,
+            'mm_reads': self.c.mm.read_queries,
+        }
+        for n in range(2, len(self.levels or ()) + 1):
+            level = self.c.levels[n - 1]
+            counters[f'l{n}_read_queries'] = level.cache_read_queries
+            counters[f'l{n}_read_misses'] = level.cache_read_misses
+            counters[f'l{n}_write_queries'] = level.cache_write_queries
+        buffer = getattr(self.c, 'write_buffer', None)  # The counters of the NumPy engine have no write buffer
+        if buffer is not None:
+            counters['wb_writes'] = buffer.writes
+            counters['wb_coalesced'] = buffer.coalesced
+            counters['wb_stalls'] = buffer.stalls
+            counters['wb_stall_time'] = buffer.stall_time
+            counters['wb_forwarded'] = buffer.forwarded
+            counters['wb_occupancy'] = buffer.occupancy
+        if self.prefetcher is not None:
+            counters.update({f'pf_{name}': count for name, count in self.prefetcher.counters().items()})
+            counters['mm_prefetches'] = self.mm.prefetch_queries
+        if self.timing is not None:
+            counters['tm_cycles'] = self.timing.cycles()
+            counters['tm_stall_cycles'] = self.timing.stall_cycles
+            counters['tm_busy_cycles'] = self.timing.busy_cycles
+            counters['tm_latency_cycles'] = self.timing.latency_cycles
+            counters['tm_merged'] = self.timing.merged
+            counters['tm_writebacks'] = self.timing.writebacks
+        return counters
+
+    # Method to compute the cache performance statistics, from the counters accumulated since the warm-up by default
+    def stats(self, counters=None) -> dict:
+        if counters is None:
+            counters = self.counters()
+            if self.baseline is not None:
+                counters = {name: count - self.baseline[name] for name, count in counters.items()}
+
+        write_hits      = counters['write_queries'] - counters['write_misses']
+        write_hit_rate  = write_hits/counters['write_queries'] * 100 if counters['write_queries'] else 0
+        read_hits       = counters['read_queries'] - counters['read_misses']
+        read_hit_rate   = read_hits/counters['read_queries'] * 100 if counters['read_queries'] else 0
         total_hits      = write_hits + read_hits
-        total_queries   = self.c.cache_write_queries + self.c.cache_read_queries
+        total_queries   = counters['write_queries'] + counters['read_queries']
         total_hit_rate  = total_hits / total_queries * 100 if total_queries else 0
-        queries         = self.c.cache_write_queries + self.c.cache_read_queries
-        misses          = self.c.cache_write_misses + self.c.cache_read_misses
+        queries         = counters['write_queries'] + counters['read_queries']
+        misses          = counters['write_misses'] + counters['read_misses']
         amat = self.hit_time + (misses/queries)*self.miss_penalty if queries else 0
-        
+
+        levels = {}
+        if self.levels:
+            # Only the block reads requested by the level above are on the access path of a lower level,
+            # so AMAT = t1 + m1 * (t2 + m2 * (... + mn * miss penalty)) with each lower level's read miss rate
+            below = self.miss_penalty
+            for n in range(len(self.levels), 1, -1):
+                level_queries = counters[f'l{n}_read_queries']
+                level_hits = level_queries - counters[f'l{n}_read_misses']
+                levels[f'l{n}_hits'] = level_hits
+                levels[f'l{n}_queries'] = level_queries
+                levels[f'l{n}_hit_rate'] = level_hits / level_queries * 100 if level_queries else 0
+                levels[f'l{n}_writebacks'] = counters[f'l{n}_write_queries']
+                miss_rate = counters[f'l{n}_read_misses'] / level_queries if level_queries else 0
+                below = self.levels[n - 1][3] + miss_rate * below
+            amat = self.hit_time + (misses/queries)*below if queries else 0
+
+        buffer = {}
+        if 'wb_writes' in counters:
+            buffer = {name: counters[name] for name in ('wb_writes', 'wb_coalesced', 'wb_stalls', 'wb_stall_time', 'wb_forwarded')}
+            buffer['wb_avg_occupancy'] = counters['wb_occupancy'] / counters['wb_writes'] if counters['wb_writes'] else 0
+
+        prefetches = {}
+        if 'pf_issued' in counters:
+            useful = counters['pf_useful']
+            prefetches = {
+                'mm_prefetches': counters['mm_prefetches'],
+                'pf_issued': counters['pf_issued'],
+                'pf_useful': useful,
+                'pf_late': counters['pf_late'],
+                'pf_accuracy': useful / counters['pf_issued'] * 100 if counters['pf_issued'] else 0,
+                'pf_coverage': useful / (useful + counters['pf_misses']) * 100 if useful + counters['pf_misses'] else 0,
+                'pf_timeliness': (useful - counters['pf_late']) / useful * 100 if useful else 0,
+            }
+
+        timing = {}
+        if 'tm_cycles' in counters:
+            cycles = counters['tm_cycles']
+            timing = {
+                'cycles': cycles,
+                'stall_cycles': counters['tm_stall_cycles'],
+                'stall_share': counters['tm_stall_cycles'] / cycles * 100 if cycles else 0,
+                'busy_cycles': counters['tm_busy_cycles'],
+                'bandwidth_utilization': counters['tm_busy_cycles'] / cycles * 100 if cycles else 0,
+                'avg_latency': counters['tm_latency_cycles'] / queries if queries else 0,
+                'merged': counters['tm_merged'],
+                'writebacks': counters['tm_writebacks'],
+            }
+
+        return {
+            'write_hits': write_hits,
+            'write_queries': counters['write_queries'],
+            'write_hit_rate': write_hit_rate,
+            'read_hits': read_hits,
+            'read_queries': counters['read_queries'],
+            'read_hit_rate': read_hit_rate,
+            'total_hits': total_hits,
+            'total_queries': total_queries,
+            'total_hit_rate': total_hit_rate,
+            'mm_writes': counters['mm_writes'],
+            'mm_reads': counters['mm_reads'],
+            'amat': amat,
+            **levels,
+            **buffer,
+            **prefetches,
+            **timing,
+        }
+
+    # Method to print cache performance statistics
+    def print_stats(self):
+        print("\n\n*******************************************")
+        stats = self.stats()
+
         # Print a summary of cache performance
         print(self.descriptor)
-        print(f"Write Hit Rate:	    {'{:.2f}'.format(write_hit_rate)}% ({write_hits}/{self.c.cache_write_queries})")
-        print(f"Read Hit Rate:	    {'{:.2f}'.format(read_hit_rate)}% ({read_hits}/{self.c.cache_read_queries})")
-        print(f"Total Hit Rate:     {'{:.2f}'.format(total_hit_rate)}% ({total_hits}/{total_queries})")
-        print(f"Writes to Main Memory:   {self.c.mm.write_queries}")
-        print(f"Reads from Main Memory:  {self.c.mm.read_queries}")
-        print(f"Avg. Memory Access Time: {'{:.2f}'.format(amat)} cycles")
+        if self.warmup:
+            print(f"Warm-up:            first {self.warmup} record(s) excluded")
+        if self.write_descriptor():
+            print(f"Writes:             {self.write_descriptor()}")
+        if self.prefetcher is not None:
+            print(f"Prefetcher:         {self.prefetcher_name}, degree {self.prefetcher.degree}, "
+                  f"{self.prefetcher.latency} access(es) of latency")
+        if self.timing is not None:
+            print(f"Timing:             memory latency {self.timing.latency} cycle(s), {self.timing.bandwidth} byte(s)/cycle, "
+                  f"{self.timing.writeback_time} cycle(s) per writeback, {self.timing.mshrs} MSHR(s)")
+        print(f"Write Hit Rate:	    {'{:.2f}'.format(stats['write_hit_rate'])}% ({stats['write_hits']}/{stats['write_queries']})")
+        print(f"Read Hit Rate:	    {'{:.2f}'.format(stats['read_hit_rate'])}% ({stats['read_hits']}/{stats['read_queries']})")
+        print(f"Total Hit Rate:     {'{:.2f}'.format(stats['total_hit_rate'])}% ({stats['total_hits']}/{stats['total_queries']})")
+        for n in range(2, len(self.levels or ()) + 1):
+            print(f"L{n} Hit Rate:        {'{:.2f}'.format(stats[f'l{n}_hit_rate'])}% ({stats[f'l{n}_hits']}/{stats[f'l{n}_queries']}), "
+                  f"{stats[f'l{n}_writebacks']} block(s) received from L{n - 1}")
+        if 'wb_writes' in stats:
+            print(f"Write Buffer:       {stats['wb_writes']} write(s), {stats['wb_coalesced']} coalesced, "
+                  f"{stats['wb_forwarded']} read(s) forwarded")
+            print(f"Buffer Stalls:      {stats['wb_stalls']} stall(s), {stats['wb_stall_time']} access(es) waited")
+            print(f"Buffer Occupancy:   {'{:.2f}'.format(stats['wb_avg_occupancy'])} average, "
+                  f"{self.c.write_buffer.max_occupancy} max of {self.write_buffer} entries")
+        if 'pf_issued' in stats:
+            print(f"Prefetch Accuracy:  {'{:.2f}'.format(stats['pf_accuracy'])}% ({stats['pf_useful']}/{stats['pf_issued']} useful)")
+            print(f"Prefetch Coverage:  {'{:.2f}'.format(stats['pf_coverage'])}% of the misses removed")
+            print(f"Prefetch Timeliness: {'{:.2f}'.format(stats['pf_timeliness'])}% on time ({stats['pf_late']} late)")
+        print(f"Writes to Main Memory:   {stats['mm_writes']}")
+        print(f"Reads from Main Memory:  {stats['mm_reads']}")
+        if 'mm_prefetches' in stats:
+            print(f"Prefetches from Main Memory: {stats['mm_prefetches']}")
+        print(f"Avg. Memory Access Time: {'{:.2f}'.format(stats['amat'])} cycles")
+        if 'cycles' in stats:
+            print(f"Total Cycles:       {stats['cycles']} ({stats['stall_cycles']} stall cycle(s) waiting for an MSHR, "
+                  f"{'{:.2f}'.format(stats['stall_share'])}%)")
+            print(f"Avg. Access Latency: {'{:.2f}'.format(stats['avg_latency'])} cycles, timed "
+                  f"({stats['merged']} access(es) waiting for a block in flight)")
+            print(f"Memory Bandwidth:   {'{:.2f}'.format(stats['bandwidth_utilization'])}% utilized "
+                  f"({stats['busy_cycles']} busy cycle(s), {stats['writebacks']} writeback(s))")
         print("*******************************************")
 
 # Main function to parse command-line arguments and run the cache simulation
 def main():
     cli_args = parse_cli_args()  # Parse the command-line arguments
-    CacheRunner(cli_args.cachetype, cli_args.num_ways, cli_args.num_sets, cli_args.testfile).run()  # Run the simulation
+    geometry = {
+        'block_size': cli_args.block_size,
+        'word_size': cli_args.word_size,
+        'addr_bits': cli_args.addr_bits,
+        'memory_size': cli_args.memory_size,
+        'init_file': None if cli_args.mm_init.lower() == "none" else cli_args.mm_init,
+    }
+
+    if cli_args.profile and cli_args.checkpoint:
+        raise Exception("PHASE PROFILING CANNOT BE COMBINED WITH CHECKPOINTS")
+
+    if cli_args.cores or cli_args.core_traces:
+        # Simulate coherent private caches, one per core, instead of a single cache
+        if cli_args.profile:
+            raise Exception("PHASE PROFILING REQUIRES A SINGLE CACHE OR HIERARCHY")
+        # The private caches are plain write-back, write-allocate caches, run over the whole trace in one go
+        unsupported = {
+            '--write_policy': cli_args.write_policy != 'write-back',
+            '--write_miss': cli_args.write_miss != 'write-allocate',
+            '--write_buffer': cli_args.write_buffer,
+            '--prefetcher': cli_args.prefetcher != 'none',
+            '--timing': cli_args.timing,
+            '--levels': cli_args.levels,
+            '--engine': cli_args.engine != 'scalar',
+            '--hotspots': cli_args.hotspots or cli_args.hotspots_json,
+            '--warmup': cli_args.warmup,
+            '--interval': cli_args.interval,
+            '--checkpoint': cli_args.checkpoint or cli_args.checkpoint_every or cli_args.stop_after,
+            '--resume': cli_args.resume or cli_args.warm,
+        }
+        for flag, given in unsupported.items():
+            if given:
+                raise Exception(f"MULTI-CORE SIMULATIONS DO NOT SUPPORT: {flag}")
+        if cli_args.core_traces:
+            # One trace per core, so as many cores as traces
+            cores, testfiles = len(cli_args.core_traces), cli_args.core_traces
+        else:
+            # A single trace whose lines start with a core id
+            cores, testfiles = cli_args.cores, [cli_args.testfile]
+        runner = MultiCoreRunner(cli_args.cachetype, cli_args.num_ways, cli_args.num_sets, cores, testfiles,
+                                 cli_args.output, cli_args.hit_time, cli_args.miss_penalty, cli_args.policy, geometry,
+                                 cli_args.protocol, cli_args.quantum, cli_args.transfer_time,
+                                 per_core_traces=bool(cli_args.core_traces))
+        run = runner.run
+    else:
+        if cli_args.resume or cli_args.warm:
+            # Restore the cache, memory and counters of a checkpoint instead of building a new cache
+            runner = load_checkpoint(cli_args.resume or cli_args.warm, cli_args.output)
+            if cli_args.warm:
+                # A what-if continuation runs the given trace from its start on the warmed-up state
+                runner.testfile = cli_args.testfile
+                runner.offset = 0
+                # Its statistics leave out the warm-up that built the checkpoint, and the first --warmup records of the new trace
+                runner.window = None
+                runner.warmup = cli_args.warmup
+                runner.baseline = None if cli_args.warmup else runner.counters()
+        else:
+            runner = CacheRunner(cli_args.cachetype, cli_args.num_ways, cli_args.num_sets, cli_args.testfile, cli_args.output,
+                                 cli_args.engine, cli_args.hit_time, cli_args.miss_penalty, cli_args.policy,
+                                 [parse_level(spec, cli_args.hit_time) for spec in cli_args.levels] if cli_args.levels else None,
+                                 cli_args.inclusion, geometry,
+                                 cli_args.sample_every if cli_args.hotspots or cli_args.hotspots_json else None,
+                                 cli_args.hotspots_json, cli_args.warmup, cli_args.write_policy, cli_args.write_miss,
+                                 cli_args.write_buffer, cli_args.drain_interval,
+                                 None if cli_args.prefetcher == "none" else cli_args.prefetcher,
+                                 cli_args.prefetch_degree, cli_args.prefetch_latency, cli_args.timing, cli_args.memory_latency,
+                                 cli_args.memory_bandwidth, cli_args.writeback_time, cli_args.mshrs)
+        run = lambda: runner.run(cli_args.checkpoint, cli_args.checkpoint_every, cli_args.stop_after, cli_args.interval,
+                                 cli_args.interval_out)
+
+    profiler = None
+    if cli_args.profile:
+        profiler = PhaseProfiler()
+        profiler.instrument(runner)
+    if cli_args.profile_stacks:
+        profile_stacks(run, cli_args.profile_stacks)
+    else:
+        run()  # Run the simulation
+    if profiler is not None:
+        profiler.report(runner.offset)
 
 # Entry point of the script
 if __name__ == '__main__':
-    main()
+    # Run the importable module rather than `__main__`, so checkpoints refer to `runcache.CacheRunner` and load anywhere
+    import runcache
+    runcache.main()
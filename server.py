@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import http.server
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+
+import sweep
+from policies import POLICIES
+from mainmem import Memory
+from sinks import NullSink
+from traces import open_trace
+
+CACHE_TYPES = ('simple', 'dmc', 'sac', 'fac')
+
+def file_digest(path, chunk_size=1 << 20) -> str:
+    # Hash the contents of a file, so a trace is identified by what it holds rather than by its path
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def positive_int(config, name, default=None):
+    # Read a positive integer field of a JSON configuration
+    value = config.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise Exception(f"{name.upper()} MUST BE A POSITIVE INTEGER")
+    return value
+
+class SimulationService():
+    '''
+    State of the simulation daemon, shared by the threads serving its requests:
+      traces:  the parsed traces, keyed by the SHA-256 of their file and bounded to `trace_records` records in total,
+               least recently used first (the traces of the request being served are kept even beyond the bound)
+      results: the statistics of every simulated (trace hash, configuration), bounded to `memo_entries` entries
+      pool:    the worker processes, forked so they inherit the parsed traces and the memory image (see `sweep.FORK`)
+    The pool is replaced whenever a trace is parsed, so the new workers inherit it; the tasks already submitted to
+    the old pool still run to completion. Traces are assumed not to change while their hash is cached, which is only
+    recomputed when the size or modification time of their file does.
+    '''
+
+    def __init__(self, jobs=None, trace_records=5_000_000, memo_entries=100_000):
+        self.jobs = jobs
+        self.trace_records = trace_records
+        self.memo_entries = memo_entries
+        self.lock = threading.Lock()
+
+        self.digests = {}  # Absolute path -> ((size, mtime), digest) of every trace hashed so far
+        self.traces = OrderedDict()  # Digest -> parsed records, least recently used first
+        self.results = OrderedDict()  # (digest, configuration) -> statistics, least recently used first
+        self.pool = None
+
+        # Counters reported by `status`
+        self.requests = 0
+        self.memo_hits = 0
+        self.simulations = 0
+        self.parses = 0
+        self.evictions = 0
+
+        mm = Memory(NullSink())  # Load the shared base memory image, so the workers inherit it instead of loading their own
+        self.weighted = (mm.MAIN_MEMORY_BLOCK_SIZE, mm.MAIN_MEMORY_WORD_SIZE)  # Run-length encoded traces are simulated as weighted records
+
+    def digest(self, path) -> str:
+        # Hash a trace file, unless it has not changed since it was last hashed
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = (stat.st_size, stat.st_mtime_ns)
+        cached = self.digests.get(path)
+        if cached is None or cached[0] != key:
+            cached = self.digests[path] = (key, file_digest(path))
+        return cached[1]
+
+    def parse_trace(self, path) -> list:
+        # Parse a trace (without the lock held, as it can take seconds)
+        return list(open_trace(path, weighted=self.weighted))
+
+    def load_trace(self, digest, parsed, needed):
+        # Make a trace resident, inserting its `parsed` records and evicting the least recently used traces that are
+        # not `needed` if the bound is exceeded (with the lock held)
+        if digest in self.traces:
+            self.traces.move_to_end(digest)
+            return
+        self.traces[digest] = parsed[digest]
+        self.parses += 1
+        evictable = [key for key in self.traces if key not in needed]
+        while evictable and sum(map(len, self.traces.values())) > self.trace_records:
+            del self.traces[evictable.pop(0)]
+            self.evictions += 1
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+        self.pool = None
+
+    def workers(self) -> ProcessPoolExecutor:
+        # The worker pool holding every resident trace (with the lock held)
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.jobs, mp_context=sweep.FORK, initializer=sweep.init_worker,
+                                            initargs=(dict(self.traces),))
+        return self.pool
+
+    def simulate(self, request) -> list:
+        '''
+        Answers a batch of simulation requests, `{"testfile": ..., "configs": [{"cachetype": ..., "num_sets": ...,
+        "num_ways": ..., "policy": ..., "hit_time": ..., "miss_penalty": ...}, ...]}`, where a configuration may also
+        name its own `testfile`, and `num_sets` (`num_ways`) is optional for the cache types that have a single set (way).
+        Returns one result row per configuration, in order, in the format of `sweep`, with the hash of the trace and
+        whether the row was `memoized`. Configurations already simulated on the same trace contents are answered from
+        memory; the others are run on the worker pool, each distinct simulation once.
+        '''
+        if not isinstance(request, dict) or not isinstance(request.get('configs'), list):
+            raise Exception("REQUEST MUST BE AN OBJECT WITH A LIST OF CONFIGS")
+
+        # Validate the configurations, and key them by trace hash and canonical configuration
+        keys = []
+        paths = {}
+        for config in request['configs']:
+            if not isinstance(config, dict):
+                raise Exception("EACH CONFIG MUST BE AN OBJECT")
+            testfile = config.get('testfile', request.get('testfile'))
+            cache_type = config.get('cachetype')
+            policy = config.get('policy', 'lru')
+            if not isinstance(testfile, str):
+                raise Exception("EACH CONFIG NEEDS A TESTFILE")
+            if cache_type not in CACHE_TYPES:
+                raise Exception("UNKNOWN CACHE TYPE")
+            if policy not in POLICIES:
+                raise Exception("UNKNOWN REPLACEMENT POLICY")
+            # The dimensions a cache type ignores, which `sweep.canonical_config` fixes to 1, are optional
+            simulation = sweep.canonical_config(cache_type,
+                                                positive_int(config, 'num_sets', 1 if cache_type in ('simple', 'fac') else None),
+                                                positive_int(config, 'num_ways', 1 if cache_type in ('simple', 'dmc') else None),
+                                                policy)
+            timing = (positive_int(config, 'hit_time', 1), positive_int(config, 'miss_penalty', 10))
+            if testfile not in paths:
+                paths[testfile] = self.digest(testfile)
+            keys.append((paths[testfile], testfile, simulation, timing))
+
+        rows = [None] * len(keys)
+        pending = {}  # (simulation, digest) -> {timing: [indices of the rows it answers]}
+        with self.lock:
+            self.requests += 1
+            for n, (digest, testfile, simulation, timing) in enumerate(keys):
+                memo = (digest, simulation, timing)
+                if memo in self.results:
+                    self.results.move_to_end(memo)
+                    rows[n] = dict(self.results[memo], testfile=testfile, memoized=True)
+                    self.memo_hits += 1
+                else:
+                    pending.setdefault((simulation, digest), {}).setdefault(timing, []).append(n)
+
+        # Parse the traces that are not resident without the lock, so other requests are served meanwhile, and parse
+        # again any trace that another request evicted in the meantime
+        needed = {digest: testfile for digest, testfile, _, _ in keys if any(key[1] == digest for key in pending)}
+        parsed = {}
+        while True:
+            with self.lock:
+                missing = {digest: testfile for digest, testfile in needed.items()
+                           if digest not in self.traces and digest not in parsed}
+                if not missing:
+                    # Submit each distinct simulation once, for every timing it was asked with (see `sweep.run_config`)
+                    for digest in needed:
+                        self.load_trace(digest, parsed, needed)
+                    pool = self.workers() if pending else None
+                    futures = {key: pool.submit(sweep.run_config, key[0] + (key[1],), list(timings))
+                               for key, timings in pending.items()}
+                    self.simulations += len(futures)
+                    break
+            for digest, testfile in missing.items():
+                parsed[digest] = self.parse_trace(testfile)
+
+        # Wait for the simulations without the lock, so other requests are served meanwhile
+        for (simulation, digest), future in futures.items():
+            for row in future.result():
+                timing = (row['hit_time'], row['miss_penalty'])
+                row = dict(row, digest=digest)
+                with self.lock:
+                    self.results[(digest, simulation, timing)] = row
+                    while len(self.results) > self.memo_entries:
+                        self.results.popitem(last=False)
+                for n in pending[(simulation, digest)][timing]:
+                    rows[n] = dict(row, testfile=keys[n][1], memoized=False)
+        return rows
+
+    def status(self) -> dict:
+        # Describe the resident traces and the counters of the service
+        with self.lock:
+            return {
+                'traces': [{'digest': digest, 'records': len(records)} for digest, records in self.traces.items()],
+                'trace_records': sum(map(len, self.traces.values())),
+                'memo_entries': len(self.results),
+                'requests': self.requests,
+                'memo_hits': self.memo_hits,
+                'simulations': self.simulations,
+                'parses': self.parses,
+                'evictions': self.evictions,
+            }
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+class SimulationHandler(http.server.BaseHTTPRequestHandler):
+    '''
+    HTTP interface of a `SimulationService` (at `self.server.service`):
+      POST /simulate  runs a batch of simulations (see `SimulationService.simulate`) and returns {"results": [...]}
+      GET  /status    returns the resident traces and the counters of the service
+    Errors are returned as {"error": ...} with status 400. Connections are kept alive between requests.
+    '''
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/status":
+            self.send_json(200, self.server.service.status())
+        else:
+            self.send_json(404, {'error': "NOT FOUND"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != "/simulate":
+            self.send_json(404, {'error': "NOT FOUND"})
+            return
+        try:
+            results = self.server.service.simulate(json.loads(body))
+        except Exception as e:
+            self.send_json(400, {'error': str(e)})
+        else:
+            self.send_json(200, {'results': results})
+
+    def address_string(self):
+        # Clients of a Unix socket have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def make_server(service, host="127.0.0.1", port=8765, socket_path=None, verbose=False):
+    '''
+    Serves a `SimulationService` over HTTP, on a Unix socket if `socket_path` is given (replacing any stale socket
+    file), on `host`:`port` otherwise. The service has no authentication, so only bind it to local interfaces.
+    '''
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = UnixHTTPServer(socket_path, SimulationHandler)
+    else:
+        server = http.server.ThreadingHTTPServer((host, port), SimulationHandler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+# Function to parse command-line arguments passed to the program
+def parse_cli_args():
+
+    parser = argparse.ArgumentParser(description='serve cache simulations from resident traces over HTTP')
+
+    # Arguments for specifying where the daemon listens
+    parser.add_argument(
+        '--host',
+        type=str,
+        default='127.0.0.1',
+        help='the address to listen on (unauthenticated, so keep it local)')
+
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=8765,
+        help='the TCP port to listen on')
+
+    parser.add_argument(
+        '--socket',
+        type=str,
+        default=None,
+        help='listen on this Unix socket instead of TCP')
+
+    # Arguments for specifying the workers and the caches of the daemon
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=None,
+        help='the number of worker processes (defaults to the number of CPUs)')
+
+    parser.add_argument(
+        '--trace_records',
+        type=int,
+        default=5_000_000,
+        help='the number of parsed trace records kept in memory, over all traces')
+
+    parser.add_argument(
+        '--memo_entries',
+        type=int,
+        default=100_000,
+        help='the number of memoized simulation results')
+
+    parser.add_argument(
+        '--verbose',
+        action='store_true',
+        help='log every request to stderr')
+
+    return parser.parse_args()
+
+# Main function to serve requests until interrupted
+def main():
+    cli_args = parse_cli_args()
+    service = SimulationService(cli_args.jobs, cli_args.trace_records, cli_args.memo_entries)
+    server = make_server(service, cli_args.host, cli_args.port, cli_args.socket, cli_args.verbose)
+    print(f"Serving on {cli_args.socket or f'http://{cli_args.host}:{cli_args.port}'}", file=sys.stderr)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # Clean up on `kill` as on Ctrl-C
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if cli_args.socket is not None and os.path.exists(cli_args.socket):
+            os.unlink(cli_args.socket)
+
+# Entry point of the script
+if __name__ == '__main__':
+    main()
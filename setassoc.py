@@ -1,15 +1,24 @@
 #!/usr/bin/env python3
 
 from mainmem import Memory
+from cacheline import CacheLine
+from cachelevel import CacheLevel
+from policies import make_policies
+from batchaccess import BatchAccess, as_list, as_weights
+from writepolicy import WritePolicy
+from traces import OP_READ, OP_WRITE
+from array import array
 import math
 
-class SetAssociativeCache(dict):
+class SetAssociativeCache(dict, CacheLevel, BatchAccess, WritePolicy):
     '''
     Implements a set-associative cache with a specified number of sets and ways.
-    Uses a Least-Recently Used (LRU) policy for evicting cache blocks when necessary.
+    Evicts cache blocks with a pluggable per-set replacement policy (see `policies.py`), Least-Recently Used (LRU) by default.
+    Write-back and write-allocate by default, with selectable write policies and an optional write buffer (see `WritePolicy`).
     '''
 
-    def __init__(self, num_sets, num_ways):
+    def __init__(self, num_sets, num_ways, sink=None, policy='lru', mm=None, write_policy='write-back',
+                 write_miss='write-allocate', write_buffer=0, drain_interval=10):
         # Initialize counters for cache operations
         self.cache_write_queries = 0
         self.cache_read_queries = 0
@@ -20,21 +29,36 @@ class SetAssociativeCache(dict):
         self.num_sets = num_sets
         self.num_ways = num_ways
         
-        # Create an instance of the main memory
-        self.mm = Memory()
+        # Create an instance of the main memory, reporting its events to the given sink, unless this cache sits in front of another level
+        self.mm = mm if mm is not None else Memory(sink)
+
+        # Set the write policies, and put the write buffer (if any) in front of the memory
+        self.set_write_policy(write_policy, write_miss, write_buffer, drain_interval)
         
         # Initialize the cache structure: a list of sets, each containing a list of blocks
         self.cache = [
-            [{'data': None, 'tag': None, 'dirty': False, 'valid': False, 'last_used': 0} for _ in range(num_ways)]
+            [CacheLine(way) for way in range(num_ways)]
             for _ in range(num_sets)
         ]
         
-        # Access counter to track the usage of cache blocks for LRU policy
+        # Access counter to track the usage of cache blocks
         self.access_counter = 0
 
+        # Per-set index of the valid cache blocks keyed by tag
+        self.tags = [{} for _ in range(num_sets)]
+
+        # Per-set replacement policy state, choosing the victim among the valid blocks of a set (LRU by default)
+        self.policies = make_policies(policy, num_sets, num_ways)
+
+        # Per-set stacks of invalid cache blocks, with the first block of each set on top
+        self.free = [blocks[::-1] for blocks in self.cache]
+
+        # Optional per-set instrumentation (see `HotspotMonitor`)
+        self.monitor = None
+
     def calculate_base_index(self, addr):
-        # Ensure the memory address is aligned to a 4-byte boundary
-        assert (addr % 4 == 0), "Misaligned Memory Address"
+        # Ensure the memory address is aligned to a word boundary
+        assert (addr % self.mm.MAIN_MEMORY_WORD_SIZE == 0), "Misaligned Memory Address"
         
         # Calculate the base address of the block containing the word
         addr_offt = ((addr - self.mm.MAIN_MEMORY_START_ADDR) % self.mm.MAIN_MEMORY_BLOCK_SIZE)
@@ -50,22 +74,76 @@ class SetAssociativeCache(dict):
         # Calculate the set index by taking the block address modulo the number of sets
         return (addr // self.mm.MAIN_MEMORY_BLOCK_SIZE) % self.num_sets
 
-    def find_least_recently_used(self, set_index):
-        # Find and return the least recently used block in the specified set
-        return min(self.cache[set_index], key=lambda x: x['last_used'])
+    def find_victim(self, set_index, tag):
+        # Invalid blocks are always used first, otherwise the set's replacement policy picks the victim
+        if self.free[set_index]:
+            return self.free[set_index][-1]
+        return self.cache[set_index][self.policies[set_index].victim(tag)]
 
     def locate_block(self, set_index, tag):
-        # Search for a block within the set that matches the given tag
-        for block in self.cache[set_index]:
-            if block['valid'] and block['tag'] == tag:
-                return block
-        # Return None if no matching block is found
-        return None
+        # Look up the block within the set that matches the given tag, or None if it is not cached
+        return self.tags[set_index].get(tag)
+
+    def evict_block(self, set_index, block):
+        '''
+        Removes the block returned by `find_victim` from the set's tag index and replacement policy,
+        writing it back to main memory first if it is dirty.
+        '''
+        if block.valid:
+            del self.tags[set_index][block.tag]
+            self.policies[set_index].evict(block.way)
+            if block.dirty:
+                self.mm.mm_write(block.tag * self.mm.MAIN_MEMORY_BLOCK_SIZE, block.data)
+            elif self.victims_below:
+                # An exclusive level below keeps the clean victims as well
+                self.mm.mm_evict(block.tag * self.mm.MAIN_MEMORY_BLOCK_SIZE, block.data)
+        else:
+            self.free[set_index].pop()
 
     def update_usage(self, set_index, block):
         # Update the access counter and set the block's last used time to the current counter value
         self.access_counter += 1
-        block['last_used'] = self.access_counter
+        block.last_used = self.access_counter
+
+        # Report the hit to the set's replacement policy
+        self.policies[set_index].touch(block.way)
+
+    def insert_block(self, set_index, block):
+        # Update the access counter and set the block's last used time to the current counter value
+        self.access_counter += 1
+        block.last_used = self.access_counter
+
+        # Index the newly loaded block and report it to the set's replacement policy
+        self.tags[set_index][block.tag] = block
+        self.policies[set_index].insert(block.way, block.tag)
+
+    # Line primitives used when this cache is a level of a hierarchy (see `CacheLevel`)
+    def find_line(self, tag):
+        return self.locate_block(tag % self.num_sets, tag)
+
+    def touch_line(self, line):
+        self.update_usage(line.tag % self.num_sets, line)
+
+    def claim_line(self, tag):
+        return self.find_victim(tag % self.num_sets, tag)
+
+    def evict_line(self, line, tag):
+        self.evict_block(tag % self.num_sets, line)
+
+    def install_line(self, line, tag, data, dirty):
+        line.data = data
+        line.tag = tag
+        line.valid = True
+        line.dirty = dirty
+        self.insert_block(tag % self.num_sets, line)
+
+    def drop_line(self, line):
+        set_index = line.tag % self.num_sets
+        del self.tags[set_index][line.tag]
+        self.policies[set_index].invalidate(line.way)
+        line.valid = False
+        line.dirty = False
+        self.free[set_index].append(line)
 
     def store_word(self, w_addr, w_data):
         # Calculate the set index and tag from the write address
@@ -78,31 +156,45 @@ class SetAssociativeCache(dict):
         # Try to locate the block in the cache
         block = self.locate_block(set_index, tag)
         self.cache_write_queries += 1
+        if self.monitor is not None and self.monitor.sampled[set_index]:
+            self.monitor.record(set_index, tag, block is None, not self.free[set_index] and self.write_allocate,
+                                self.write_allocate)
 
-        if block and block['valid']:
-            # If the block is found and valid, update the word and mark it as dirty
-            block['data'][block_offset] = w_data
-            block['dirty'] = True
+        if block and block.valid:
+            # If the block is found and valid, update the word and mark it as dirty (or write the word through, leaving it clean)
+            block.data[block_offset] = w_data
+            if self.write_through:
+                self.write_word_below(tag, block_offset, w_data)
+            else:
+                block.dirty = True
+
+            # Update the block's usage information for the replacement policy
+            self.update_usage(set_index, block)
+        elif not self.write_allocate:
+            # Without write allocation, the word is written below and the cache is left unchanged
+            self.write_word_below(tag, block_offset, w_data)
+            self.cache_write_misses += 1
         else:
-            # If the block is not found, find the least recently used block in the set
-            block = self.find_least_recently_used(set_index)
+            # If the block is not found, find the block to replace in the set
+            block = self.find_victim(set_index, tag)
             
-            # If the LRU block is dirty, write it back to main memory before replacing it
-            if block['valid'] and block['dirty']:
-                self.mm.mm_write(block['tag'] * self.mm.MAIN_MEMORY_BLOCK_SIZE, block['data'])
+            # Unlink the victim block, writing it back to main memory first if it is dirty
+            self.evict_block(set_index, block)
             
             # Load the new block from main memory, update the word, and set the block's metadata
-            block['data'] = self.mm.mm_read(tag * self.mm.MAIN_MEMORY_BLOCK_SIZE)
-            block['data'][block_offset] = w_data
-            block['tag'] = tag
-            block['valid'] = True
-            block['dirty'] = True
+            block.data = self.mm.mm_read(tag * self.mm.MAIN_MEMORY_BLOCK_SIZE)
+            block.data[block_offset] = w_data
+            block.tag = tag
+            block.valid = True
+            block.dirty = not self.write_through
+            if self.write_through:
+                self.write_word_below(tag, block_offset, w_data)
             
             # Count the cache miss
             self.cache_write_misses += 1
 
-        # Update the block's usage information for LRU management
-        self.update_usage(set_index, block)
+            # Index the block and report it to the set's replacement policy
+            self.insert_block(set_index, block)
 
     def load_word(self, r_addr) -> int:
         # Calculate the set index and tag from the read address
@@ -115,28 +207,125 @@ class SetAssociativeCache(dict):
         # Try to locate the block in the cache
         block = self.locate_block(set_index, tag)
         self.cache_read_queries += 1
+        if self.monitor is not None and self.monitor.sampled[set_index]:
+            self.monitor.record(set_index, tag, block is None, not self.free[set_index])
 
-        if block and block['valid']:
+        if block and block.valid:
             # If the block is found and valid, update its usage and return the requested word
             self.update_usage(set_index, block)
-            return block['data'][block_offset]
+            return block.data[block_offset]
         else:
-            # If the block is not found, find the least recently used block in the set
-            block = self.find_least_recently_used(set_index)
+            # If the block is not found, find the block to replace in the set
+            block = self.find_victim(set_index, tag)
             
-            # If the LRU block is dirty, write it back to main memory before replacing it
-            if block['valid'] and block['dirty']:
-                self.mm.mm_write(block['tag'] * self.mm.MAIN_MEMORY_BLOCK_SIZE, block['data'])
+            # Unlink the victim block, writing it back to main memory first if it is dirty
+            self.evict_block(set_index, block)
             
             # Load the new block from main memory, update the block's metadata, and return the requested word
-            block['data'] = self.mm.mm_read(tag * self.mm.MAIN_MEMORY_BLOCK_SIZE)
-            block['tag'] = tag
-            block['valid'] = True
-            block['dirty'] = False
+            block.data = self.mm.mm_read(tag * self.mm.MAIN_MEMORY_BLOCK_SIZE)
+            block.tag = tag
+            block.valid = True
+            block.dirty = False
             
             # Count the cache miss
             self.cache_read_misses += 1
             
-            # Update the block's usage information for LRU management
-            self.update_usage(set_index, block)
-            return block['data'][block_offset]
+            # Index the block and report it to the set's replacement policy
+            self.insert_block(set_index, block)
+            return block.data[block_offset]
+
+    def load_block(self, set_index, tag):
+        '''
+        Replaces a block of the set on a miss and indexes the loaded block, like `store_word` and `load_word`
+        (with `find_victim` and `evict_block` inlined, as this is the miss path of `access_words`).
+        '''
+        free = self.free[set_index]
+        tags = self.tags[set_index]
+        policy = self.policies[set_index]
+        if free:
+            block = free.pop()
+        else:
+            block = self.cache[set_index][policy.victim(tag)]
+            del tags[block.tag]
+            policy.evict(block.way)
+            if block.dirty:
+                self.mm.mm_write(block.tag * self.mm.MAIN_MEMORY_BLOCK_SIZE, block.data)
+            elif self.victims_below:
+                self.mm.mm_evict(block.tag * self.mm.MAIN_MEMORY_BLOCK_SIZE, block.data)
+        block.data = self.mm.mm_read(tag * self.mm.MAIN_MEMORY_BLOCK_SIZE)
+        block.tag = tag
+        block.valid = True
+        block.dirty = False
+        tags[tag] = block
+        policy.insert(block.way, tag)
+        return block
+
+    def access_words(self, ops, addrs, values, report=None, weights=None) -> array:
+        # Perform a batch of accesses (see `BatchAccess`), with the memory geometry, the per-set tag indexes
+        # and replacement policies hoisted out of the loop
+        if self.word_by_word:
+            return self.access_each(ops, addrs, values, report, weights)
+        block_size = self.mm.MAIN_MEMORY_BLOCK_SIZE
+        word_size = self.mm.MAIN_MEMORY_WORD_SIZE
+        num_sets = self.num_sets
+        tags = self.tags
+        policies = self.policies
+        touches = 1 if policies[0].idempotent_touch else None  # Touches of the repeated hits of a weighted record
+        load_block = self.load_block
+        free = self.free
+        monitor = self.monitor
+        sampled = monitor.sampled if monitor is not None else None
+        access_counter = self.access_counter
+        op_write, op_read = OP_WRITE, OP_READ
+        write_queries = write_misses = read_queries = read_misses = 0
+        loaded = []
+        load = loaded.append
+
+        for op, addr, value, weight in zip(as_list(ops), as_list(addrs), as_list(values), as_weights(weights)):
+            if op == op_write:
+                tag = addr // block_size
+                set_index = tag % num_sets
+                block = tags[set_index].get(tag)
+                if sampled is not None and sampled[set_index]:
+                    monitor.record(set_index, tag, block is None, not free[set_index])
+                if block is None:
+                    block = load_block(set_index, tag)
+                    write_misses += 1
+                else:
+                    policies[set_index].touch(block.way)
+                access_counter += weight
+                block.last_used = access_counter
+                if weight > 1:
+                    for _ in range(touches or weight - 1):
+                        policies[set_index].touch(block.way)
+                block.data[(addr % block_size) // word_size] = value
+                block.dirty = True
+                write_queries += weight
+            elif op == op_read:
+                tag = addr // block_size
+                set_index = tag % num_sets
+                block = tags[set_index].get(tag)
+                if sampled is not None and sampled[set_index]:
+                    monitor.record(set_index, tag, block is None, not free[set_index])
+                if block is None:
+                    block = load_block(set_index, tag)
+                    read_misses += 1
+                else:
+                    policies[set_index].touch(block.way)
+                access_counter += weight
+                block.last_used = access_counter
+                if weight > 1:
+                    for _ in range(touches or weight - 1):
+                        policies[set_index].touch(block.way)
+                value = block.data[(addr % block_size) // word_size]
+                load(value)
+                read_queries += weight
+            if report is not None:
+                report(op, addr, value)
+
+        self.access_counter = access_counter
+        self.cache_write_queries += write_queries
+        self.cache_write_misses += write_misses
+        self.cache_read_queries += read_queries
+        self.cache_read_misses += read_misses
+        return array('q', loaded)
@@ -1,25 +1,30 @@
 #!/usr/bin/env python3
 
 from mainmem import Memory
+from batchaccess import BatchAccess, as_list, as_weights
+from writepolicy import WritePolicy
+from traces import OP_READ, OP_WRITE
+from array import array
 import math
 
-class SimpleCache():
+class SimpleCache(BatchAccess, WritePolicy):
     '''
     A simple cache class that does not actually cache data.
-    Instead, it always accesses the main memory directly.
+    Instead, it always accesses the main memory directly, optionally through a write buffer (see `WritePolicy`).
     '''
 
-    def __init__(self):
-        # Initialize counters for cache operations and connect to main memory
+    def __init__(self, sink=None, mm=None, write_buffer=0, drain_interval=10):
+        # Initialize counters for cache operations and connect to main memory (a new one, unless one is given)
         self.cache_write_queries = 0
         self.cache_read_queries = 0
         self.cache_write_misses = 0
         self.cache_read_misses = 0
-        self.mm = Memory()  
+        self.mm = mm if mm is not None else Memory(sink)
+        self.set_write_policy(write_buffer=write_buffer, drain_interval=drain_interval)
     
     def calculate_base_index(self, addr):
-        # Ensure the memory address is aligned to a 4-byte boundary
-        assert (addr % 4 == 0), "Misaligned Memory Address"
+        # Ensure the memory address is aligned to a word boundary
+        assert (addr % self.mm.MAIN_MEMORY_WORD_SIZE == 0), "Misaligned Memory Address"
         
         # Calculate the base address of the block containing the word
         addr_offt = ((addr - self.mm.MAIN_MEMORY_START_ADDR) % self.mm.MAIN_MEMORY_BLOCK_SIZE)
@@ -64,3 +69,45 @@ class SimpleCache():
         
         # Return the word that was loaded from memory
         return val
+
+    def access_words(self, ops, addrs, values, report=None, weights=None) -> array:
+        # Perform a batch of accesses (see `BatchAccess`), with the memory geometry and methods hoisted out of the loop
+        if self.word_by_word:
+            return self.access_each(ops, addrs, values, report, weights)
+        start_addr = self.mm.MAIN_MEMORY_START_ADDR
+        block_size = self.mm.MAIN_MEMORY_BLOCK_SIZE
+        word_size = self.mm.MAIN_MEMORY_WORD_SIZE
+        mm_read = self.mm.mm_read
+        mm_write = self.mm.mm_write
+        writes = reads = 0
+        loaded = []
+        if weights is not None:
+            # Without actual caching every access misses, so the accesses a weighted record stands for are all performed
+            ops, addrs, values = ([item for item, weight in zip(as_list(seq), as_weights(weights)) for _ in range(weight)]
+                                  for seq in (ops, addrs, values))
+
+        for op, addr, value in zip(as_list(ops), as_list(addrs), as_list(values)):
+            if op == OP_WRITE or op == OP_READ:
+                assert (addr % word_size == 0), "Misaligned Memory Address"
+                addr_offt = (addr - start_addr) % block_size
+                base_addr = addr - addr_offt
+
+                # Every access reads the block from main memory, and writes write it back
+                block = mm_read(base_addr)
+                if op == OP_WRITE:
+                    block[addr_offt // word_size] = value
+                    mm_write(base_addr, block)
+                    writes += 1
+                else:
+                    value = block[addr_offt // word_size]
+                    loaded.append(value)
+                    reads += 1
+            if report is not None:
+                report(op, addr, value)
+
+        # Every access is a miss, since there is no actual caching
+        self.cache_write_queries += writes
+        self.cache_write_misses  += writes
+        self.cache_read_queries  += reads
+        self.cache_read_misses   += reads
+        return array('q', loaded)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import sys
+
+class PrintSink():
+    '''
+    Output sink that prints every simulation event as soon as it happens.
+    This is the default sink, and produces the verbose trace output checked by `test.sh`.
+    Addresses are printed in hexadecimal with `addr_digits` digits (4 for 16-bit addresses).
+    '''
+
+    def __init__(self, addr_digits=4):
+        self.addr_width = addr_digits + 2  # Including the "0x" prefix
+
+    def mm_read(self, size, addr):
+        print(f"MM:  Read {size} bytes at {addr:#0{self.addr_width}x}")
+
+    def mm_write(self, size, addr):
+        print(f"MM:  Wrote {size} bytes at {addr:#0{self.addr_width}x}")
+
+    def mm_prefetch(self, size, addr):
+        print(f"MM:  Prefetched {size} bytes at {addr:#0{self.addr_width}x}")
+
+    def cache_write(self, cache_type, addr, data):
+        print(f"{cache_type}: Wrote to {addr:#0{self.addr_width}x}: {data}\n")
+
+    def cache_read(self, cache_type, addr, val):
+        print(f"{cache_type}: Read from {addr:#0{self.addr_width}x} the value: {val}\n")
+
+    def invalid_line(self):
+        print("Invalid test format")
+
+    def flush(self):
+        # Printed events are already on stdout
+        pass
+
+class BufferedSink(PrintSink):
+    '''
+    Output sink that formats the same lines as `PrintSink`, but collects them and writes them to stdout in batches.
+    '''
+
+    def __init__(self, batch_size=4096, addr_digits=4):
+        super().__init__(addr_digits)
+        self.batch_size = batch_size  # Number of lines to collect before writing them out
+        self.lines = []
+
+    def emit(self, line):
+        self.lines.append(line)
+        if len(self.lines) >= self.batch_size:
+            self.flush()
+
+    def mm_read(self, size, addr):
+        self.emit(f"MM:  Read {size} bytes at {addr:#0{self.addr_width}x}\n")
+
+    def mm_write(self, size, addr):
+        self.emit(f"MM:  Wrote {size} bytes at {addr:#0{self.addr_width}x}\n")
+
+    def mm_prefetch(self, size, addr):
+        self.emit(f"MM:  Prefetched {size} bytes at {addr:#0{self.addr_width}x}\n")
+
+    def cache_write(self, cache_type, addr, data):
+        self.emit(f"{cache_type}: Wrote to {addr:#0{self.addr_width}x}: {data}\n\n")
+
+    def cache_read(self, cache_type, addr, val):
+        self.emit(f"{cache_type}: Read from {addr:#0{self.addr_width}x} the value: {val}\n\n")
+
+    def invalid_line(self):
+        self.emit("Invalid test format\n")
+
+    def flush(self):
+        # Write out all collected lines in a single call
+        sys.stdout.write("".join(self.lines))
+        self.lines.clear()
+
+class NullSink():
+    '''
+    Output sink that drops every event, so only the final statistics are reported.
+    '''
+
+    def __init__(self, addr_digits=4):
+        # Nothing is printed, so the address width is not needed
+        pass
+
+    def mm_read(self, size, addr):
+        pass
+
+    def mm_write(self, size, addr):
+        pass
+
+    def mm_prefetch(self, size, addr):
+        pass
+
+    def cache_write(self, cache_type, addr, data):
+        pass
+
+    def cache_read(self, cache_type, addr, val):
+        pass
+
+    def invalid_line(self):
+        pass
+
+    def flush(self):
+        pass
+
+# Output modes selectable from `runcache.py --output`
+SINKS = {
+    'verbose': PrintSink,
+    'buffered': BufferedSink,
+    'stats': NullSink,
+}
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import sys
+
+from traces import open_trace, DEFAULT_ADDR_BITS, OP_WRITE, OP_INVALID
+
+# Default main memory block size in bytes, as in `Memory`
+BLOCK_SIZE = 32
+
+class StackDistanceProfile():
+    '''
+    Computes the LRU behavior of every associativity from 1 to `max_ways` for a fixed number of sets,
+    in a single pass over a trace (Mattson's stack algorithm).
+
+    Each set keeps its blocks ordered from most to least recently used. An access at stack depth d hits in
+    every cache with more than d ways. Each block also keeps the smallest associativity in which its line is dirty,
+    so the dirty writebacks of every associativity are counted as blocks are pushed down the stack.
+    '''
+
+    def __init__(self, num_sets, max_ways):
+        self.num_sets = num_sets
+        self.max_ways = max_ways
+
+        # Per-set LRU stacks of [block, dirty_from] entries, most recently used first, at most `max_ways` deep
+        self.stacks = [[] for _ in range(num_sets)]
+
+        # Histograms of read and write hits by stack depth, and of dirty evictions by associativity
+        self.read_hits = [0] * max_ways
+        self.write_hits = [0] * max_ways
+        self.evictions = [0] * (max_ways + 1)
+
+        # Counters for all accesses, independent of the associativity
+        self.cache_write_queries = 0
+        self.cache_read_queries = 0
+
+    def access(self, block, is_write):
+        stack = self.stacks[block % self.num_sets]
+        if is_write:
+            self.cache_write_queries += 1
+        else:
+            self.cache_read_queries += 1
+
+        # Find the block's depth in its set's stack, or treat it as deeper than any cache
+        for depth, entry in enumerate(stack):
+            if entry[0] == block:
+                break
+        else:
+            depth = len(stack)
+            entry = None
+
+        if entry is not None:
+            (self.write_hits if is_write else self.read_hits)[depth] += 1
+            del stack[depth]
+            # A read keeps the line dirty only in the caches where it hit, a write dirties it everywhere
+            dirty_from = 1 if is_write else max(entry[1], depth + 1)
+        else:
+            dirty_from = 1 if is_write else self.max_ways + 1
+
+        # Every block above the accessed one moves down one position, which evicts it from the cache
+        # whose associativity equals its new depth; the eviction is a writeback if it is dirty there
+        evictions = self.evictions
+        for position in range(depth):
+            if stack[position][1] <= position + 1:
+                evictions[position + 1] += 1
+
+        stack.insert(0, [block, dirty_from])
+        if len(stack) > self.max_ways:
+            # A block pushed below `max_ways` is no longer cached in any profiled configuration
+            stack.pop()
+
+    def results(self, hit_time=1, miss_penalty=10):
+        '''
+        Returns one row per associativity, with the same counters as `CacheRunner.print_stats`.
+        '''
+        rows = []
+        read_hits = write_hits = 0
+        queries = self.cache_write_queries + self.cache_read_queries
+        for ways in range(1, self.max_ways + 1):
+            read_hits += self.read_hits[ways - 1]
+            write_hits += self.write_hits[ways - 1]
+            read_misses = self.cache_read_queries - read_hits
+            write_misses = self.cache_write_queries - write_hits
+            misses = read_misses + write_misses
+            rows.append({
+                'num_sets': self.num_sets,
+                'num_ways': ways,
+                'write_hits': write_hits,
+                'write_queries': self.cache_write_queries,
+                'read_hits': read_hits,
+                'read_queries': self.cache_read_queries,
+                'miss_ratio': misses / queries if queries else 0,
+                'mm_reads': misses,
+                'mm_writes': self.evictions[ways],
+                'amat': hit_time + (misses / queries) * miss_penalty if queries else 0,
+            })
+        return rows
+
+def profile(testfile, num_sets_list, max_ways, block_size=BLOCK_SIZE, addr_bits=DEFAULT_ADDR_BITS):
+    '''
+    Profiles a trace for several set counts at once, reading the trace a single time.
+    Returns the rows of every (num_sets, num_ways) configuration.
+    '''
+    profiles = [StackDistanceProfile(num_sets, max_ways) for num_sets in num_sets_list]
+    for op, addr, _ in open_trace(testfile, addr_bits):
+        if op != OP_INVALID:
+            block = addr // block_size
+            for p in profiles:
+                p.access(block, op == OP_WRITE)
+    return [row for p in profiles for row in p.results()]
+
+# Function to parse command-line arguments passed to the program
+def parse_cli_args():
+
+    parser = argparse.ArgumentParser(description='LRU miss-ratio curves for every associativity in one trace pass')
+
+    # Argument for specifying the set counts to profile
+    parser.add_argument(
+        '--num_sets',
+        type=int,
+        nargs='+',
+        default=[1],
+        help='the number(s) of sets per cache (1 profiles fully associative caches)')
+
+    # Argument for specifying the largest associativity to report
+    parser.add_argument(
+        '--max_ways',
+        type=int,
+        default=64,
+        help='the largest number of ways per set to report')
+
+    # Argument for specifying the test trace file to use
+    parser.add_argument(
+        '--testfile',
+        type=str,
+        default='tests/t1.test',
+        help='the test trace file (text or binary) to profile')
+
+    # Arguments for specifying the block size and the address width of text traces
+    parser.add_argument(
+        '--block_size',
+        type=int,
+        default=BLOCK_SIZE,
+        help='the block size in bytes')
+
+    parser.add_argument(
+        '--addr_bits',
+        type=int,
+        default=DEFAULT_ADDR_BITS,
+        help='the width of the addresses of text traces in bits')
+
+    # Argument for writing the table as CSV instead of text
+    parser.add_argument(
+        '--csv',
+        action='store_true',
+        help='write the results as CSV')
+
+    return parser.parse_args()
+
+# Main function to profile a trace and print the miss-ratio table
+def main():
+    cli_args = parse_cli_args()
+    rows = profile(cli_args.testfile, cli_args.num_sets, cli_args.max_ways, cli_args.block_size, cli_args.addr_bits)
+
+    if cli_args.csv:
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+        return
+
+    print(f"{'sets':>6} {'ways':>6} {'write hits':>14} {'read hits':>14} {'miss ratio':>10} {'MM reads':>10} {'MM writes':>10} {'AMAT':>8}")
+    for row in rows:
+        print(f"{row['num_sets']:>6} {row['num_ways']:>6} "
+              f"{row['write_hits']:>7}/{row['write_queries']:<6} {row['read_hits']:>7}/{row['read_queries']:<6} "
+              f"{row['miss_ratio']:>10.4f} {row['mm_reads']:>10} {row['mm_writes']:>10} {row['amat']:>8.2f}")
+
+# Entry point of the script
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import itertools
+import json
+import multiprocessing
+import sys
+import time
+
+from runcache import CacheRunner
+from policies import POLICIES
+from mainmem import Memory
+from sinks import NullSink
+from traces import open_trace
+
+# The start method of the worker pools, which must fork for the workers to inherit the traces (the default is spawn on
+# macOS, and forkserver on Linux from Python 3.14)
+FORK = multiprocessing.get_context("fork")
+
+# Traces parsed once by the parent process and keyed by path, installed in every worker by `init_worker`
+TRACES = {}
+
+def init_worker(traces):
+    # The workers are forked (see `FORK`), so the parsed traces are inherited rather than pickled to each of them;
+    # their pages are still copied as the workers update the reference counts of the records
+    TRACES.update(traces)
+
+def canonical_config(cache_type, sets, ways, policy):
+    # Fix the dimensions a cache type ignores to 1 (or LRU), so equivalent configurations compare equal
+    if cache_type == "simple":
+        sets = ways = 1
+        policy = "lru"
+    elif cache_type == "dmc":
+        ways = 1
+        policy = "lru"
+    elif cache_type == "fac":
+        sets = 1
+    return cache_type, sets, ways, policy
+
+def expand_grid(cachetypes, num_sets, num_ways, testfiles, policies=('lru',)):
+    '''
+    Yields the distinct (cache type, sets, ways, policy, test file) simulations of a grid.
+    Dimensions a cache type ignores are fixed to 1 (or LRU), so e.g. a DMC is only simulated once per set count.
+    '''
+    seen = set()
+    for cache_type, sets, ways, policy, testfile in itertools.product(cachetypes, num_sets, num_ways, policies, testfiles):
+        config = canonical_config(cache_type, sets, ways, policy) + (testfile,)
+        if config not in seen:
+            seen.add(config)
+            yield config
+
+def run_config(config, timings):
+    '''
+    Simulates one configuration on its pre-parsed trace.
+    The hit time and miss penalty only affect the AMAT, so one simulation yields a row per (hit time, miss penalty).
+    '''
+    cache_type, sets, ways, policy, testfile = config
+    start = time.perf_counter()
+    runner = CacheRunner(cache_type, ways, sets, testfile, 'stats', policy=policy)
+    runner.simulate(TRACES[testfile])
+    seconds = time.perf_counter() - start
+
+    rows = []
+    for hit_time, miss_penalty in timings:
+        runner.hit_time = hit_time
+        runner.miss_penalty = miss_penalty
+        rows.append({
+            'cachetype': cache_type,
+            'num_sets': sets,
+            'num_ways': ways,
+            'policy': policy,
+            'hit_time': hit_time,
+            'miss_penalty': miss_penalty,
+            'testfile': testfile,
+            **runner.stats(),
+            'seconds': seconds,
+        })
+    return rows
+
+def sweep(cachetypes, num_sets, num_ways, hit_times, miss_penalties, testfiles, jobs=None, policies=('lru',)):
+    '''
+    Runs every configuration of the grid on a process pool and returns one result row per configuration.
+    Each trace is parsed, and the memory image loaded, a single time before the workers start.
+    Run-length encoded traces are simulated as weighted records (see `traces.py --rle`).
+    '''
+    mm = Memory(NullSink())  # Load the shared base memory image, so the workers inherit it instead of loading their own
+    weighted = (mm.MAIN_MEMORY_BLOCK_SIZE, mm.MAIN_MEMORY_WORD_SIZE)
+    traces = {testfile: list(open_trace(testfile, weighted=weighted)) for testfile in testfiles}
+    configs = list(expand_grid(cachetypes, num_sets, num_ways, testfiles, policies))
+    timings = list(itertools.product(hit_times, miss_penalties))
+
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=FORK, initializer=init_worker, initargs=(traces,)) as pool:
+        results = pool.map(run_config, configs, itertools.repeat(timings))
+        return [row for rows in results for row in rows]
+
+# Function to parse command-line arguments passed to the program
+def parse_cli_args():
+
+    parser = argparse.ArgumentParser(description='run a grid of cache configurations in parallel')
+
+    # Arguments for specifying the grid of configurations
+    parser.add_argument(
+        '--cachetype',
+        nargs='+',
+        choices=('simple', 'dmc', 'sac', 'fac'),
+        default=['dmc', 'fac', 'sac'],
+        type=str.lower,
+        help='the cache structure types to simulate')
+
+    parser.add_argument(
+        '--num_sets',
+        type=int,
+        nargs='+',
+        default=[16],
+        help='the numbers of sets per cache')
+
+    parser.add_argument(
+        '--num_ways',
+        type=int,
+        nargs='+',
+        default=[16],
+        help='the numbers of ways per set')
+
+    parser.add_argument(
+        '--policy',
+        nargs='+',
+        choices=tuple(POLICIES),
+        default=['lru'],
+        type=str.lower,
+        help='the replacement policies of associative caches')
+
+    parser.add_argument(
+        '--hit_time',
+        type=int,
+        nargs='+',
+        default=[1],
+        help='the cache hit times (in cycles)')
+
+    parser.add_argument(
+        '--miss_penalty',
+        type=int,
+        nargs='+',
+        default=[10],
+        help='the cache miss penalties (in cycles)')
+
+    parser.add_argument(
+        '--testfile',
+        type=str,
+        nargs='+',
+        default=['tests/t1.test'],
+        help='the test trace files (text or binary) to run')
+
+    # Arguments for specifying how the sweep is run and reported
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=None,
+        help='the number of worker processes (defaults to the number of CPUs)')
+
+    parser.add_argument(
+        '--format',
+        choices=('csv', 'json'),
+        default='csv',
+        help='the format of the results table')
+
+    parser.add_argument(
+        '--out',
+        type=str,
+        default=None,
+        help='the file to write the results to (defaults to stdout)')
+
+    return parser.parse_args()
+
+# Main function to run the sweep and write the results table
+def main():
+    cli_args = parse_cli_args()
+    rows = sweep(cli_args.cachetype, cli_args.num_sets, cli_args.num_ways, cli_args.hit_time,
+                 cli_args.miss_penalty, cli_args.testfile, cli_args.jobs, cli_args.policy)
+
+    out = open(cli_args.out, "w", newline="") if cli_args.out else sys.stdout
+    try:
+        if cli_args.format == "json":
+            json.dump(rows, out, indent=2)
+            out.write("\n")
+        elif rows:
+            writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+# Entry point of the script
+if __name__ == '__main__':
+    main()
@@ -88,4 +88,157 @@ else
 	echo "sac: all tests passed!"
 fi
 
+# every replacement policy, on the traces whose victims differ between policies (random is seeded)
+echo "checking policies..."
+
+policytests=(8d 8f 8s 19 23c0)
+mkdir -p tests/test_policy
+for policy in lru fifo random plru lfu srrip arc; do
+	for cache in "fac --num_ways 4" "sac --num_sets 2 --num_ways 4"; do
+		for i in ${policytests[@]}; do
+			name=${policy}_${cache%% *}_t${i}
+			python3 runcache.py --cachetype $cache --policy $policy --testfile tests/t${i}${t} > tests/test_policy/${name}${text}
+			if [[ $(diff tests/results_policy/${name}${text} tests/test_policy/${name}${text}) ]]; then
+				echo "policy: error in test $name"
+				failed=1
+			fi
+		done
+	done
+done
+
+if [[ -z $failed ]]; then
+	echo "policy: all tests passed!"
+fi
+unset failed
+
+# two- and three-level hierarchies in every inclusion mode (back-invalidations, victim fills)
+echo "checking hierarchies..."
+
+hierarchytests=(8s 19 23c0)
+mkdir -p tests/test_hierarchy
+for inclusion in inclusive exclusive non-inclusive; do
+	for levels in "2l fac:1:4:1 dmc:4:1:10" "3l fac:1:4:1 sac:2:2:5 dmc:8:1:20"; do
+		for i in ${hierarchytests[@]}; do
+			name=${inclusion}_${levels%% *}_t${i}
+			python3 runcache.py --levels ${levels#* } --inclusion $inclusion --testfile tests/t${i}${t} > tests/test_hierarchy/${name}${text}
+			if [[ $(diff tests/results_hierarchy/${name}${text} tests/test_hierarchy/${name}${text}) ]]; then
+				echo "hierarchy: error in test $name"
+				failed=1
+			fi
+		done
+	done
+done
+
+if [[ -z $failed ]]; then
+	echo "hierarchy: all tests passed!"
+fi
+unset failed
+
+# write-through, no-write-allocate and the coalescing write buffer (drains, forwarding, stalls)
+echo "checking write policies..."
+
+writetests=(8s 19 21 23c0)
+mkdir -p tests/test_write
+for policy in "wt --write_policy write-through" "nwa --write_miss no-write-allocate" \
+		"wtnwa --write_policy write-through --write_miss no-write-allocate" "wb --write_buffer 2 --drain_interval 3" \
+		"wtwb --write_policy write-through --write_buffer 4 --drain_interval 2"; do
+	for cache in "dmc --num_sets 4" "fac --num_ways 4" "sac --num_sets 2 --num_ways 2"; do
+		for i in ${writetests[@]}; do
+			name=${policy%% *}_${cache%% *}_t${i}
+			python3 runcache.py --cachetype $cache ${policy#* } --testfile tests/t${i}${t} > tests/test_write/${name}${text}
+			if [[ $(diff tests/results_write/${name}${text} tests/test_write/${name}${text}) ]]; then
+				echo "write: error in test $name"
+				failed=1
+			fi
+		done
+	done
+done
+
+if [[ -z $failed ]]; then
+	echo "write: all tests passed!"
+fi
+unset failed
+
+# every prefetcher on strided traces (accuracy, coverage and timeliness)
+echo "checking prefetchers..."
+
+prefetchtests=(15 16)
+mkdir -p tests/test_prefetch
+for prefetcher in "nl --prefetcher next-line" "nl2 --prefetcher next-line --prefetch_degree 2 --prefetch_latency 2" \
+		"stride --prefetcher stride --prefetch_degree 2" "stream --prefetcher stream"; do
+	for cache in "dmc --num_sets 4" "fac --num_ways 4" "sac --num_sets 2 --num_ways 2"; do
+		for i in ${prefetchtests[@]}; do
+			name=${prefetcher%% *}_${cache%% *}_t${i}
+			python3 runcache.py --cachetype $cache ${prefetcher#* } --testfile tests/t${i}${t} > tests/test_prefetch/${name}${text}
+			if [[ $(diff tests/results_prefetch/${name}${text} tests/test_prefetch/${name}${text}) ]]; then
+				echo "prefetch: error in test $name"
+				failed=1
+			fi
+		done
+	done
+done
+
+if [[ -z $failed ]]; then
+	echo "prefetch: all tests passed!"
+fi
+unset failed
+
+# run-length encoded traces must give the statistics of the traces they were converted from, for every policy
+echo "checking run-length encoding..."
+
+rletests=(15 16)
+mkdir -p tests/test_rle
+for i in ${rletests[@]}; do
+	python3 traces.py tests/t${i}${t} tests/test_rle/t${i}.trc --rle > /dev/null
+done
+for policy in lru fifo random plru lfu srrip arc; do
+	for cache in "dmc --num_sets 4" "fac --num_ways 4" "sac --num_sets 2 --num_ways 4"; do
+		for i in ${rletests[@]}; do
+			name=${policy}_${cache%% *}_t${i}
+			python3 runcache.py --cachetype $cache --policy $policy --testfile tests/t${i}${t} --output stats > tests/test_rle/${name}${text}
+			python3 runcache.py --cachetype $cache --policy $policy --testfile tests/test_rle/t${i}.trc --output stats > tests/test_rle/${name}_rle${text}
+			if [[ $(diff tests/test_rle/${name}${text} tests/test_rle/${name}_rle${text}) ]]; then
+				echo "rle: error in test $name"
+				failed=1
+			fi
+		done
+	done
+done
+
+if [[ -z $failed ]]; then
+	echo "rle: all tests passed!"
+fi
+unset failed
+
+# coherent multi-core runs, from one trace per core and from the same accesses in one trace with a core id column
+echo "checking coherence..."
+
+mkdir -p tests/test_coherence
+for protocol in mesi msi; do
+	for cache in "dmc --num_sets 4" "fac --num_ways 8" "sac --num_sets 4 --num_ways 2"; do
+		name=${protocol}_${cache%% *}
+		python3 runcache.py --cachetype $cache --protocol $protocol --core_traces tests/t23c0${t} tests/t23c1${t} tests/t23c2${t} > tests/test_coherence/${name}${text}
+		python3 runcache.py --cachetype $cache --protocol $protocol --cores 3 --testfile tests/t23${t} > tests/test_coherence/${name}_ids${text}
+		if [[ $(diff tests/results_coherence/${name}${text} tests/test_coherence/${name}${text}) || $(diff tests/results_coherence/${name}${text} tests/test_coherence/${name}_ids${text}) ]]; then
+			echo "coherence: error in test $name"
+			failed=1
+		fi
+	done
+done
+
+if [[ -z $failed ]]; then
+	echo "coherence: all tests passed!"
+fi
+unset failed
+
+# the replacement phase of a profiled dmc must see its misses
+echo "checking profiling..."
+
+replacements=$(python3 runcache.py --cachetype dmc --num_sets 16 --num_ways 1 --testfile tests/t21.test --output stats --profile 2>&1 >/dev/null | grep "replacement")
+if [[ "$replacements" =~ ,\ ([1-9][0-9]*)\ call ]]; then
+	echo "profiling: all tests passed!"
+else
+	echo "profiling: no dmc replacements profiled"
+fi
+
 exit 0
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import heapq
+import math
+
+class TimingModel():
+    '''
+    Cycle-level timing of a cache and its main memory, which the model stands in for below the cache (see `attach`).
+
+    The core issues one access per cycle, in trace order. A hit completes `hit_time` cycles after it is issued.
+    A miss takes one of the cache's `mshrs` miss status holding registers until its block arrives, and the core
+    only stalls when it needs one and they are all busy, so up to `mshrs` misses overlap; an access to a block
+    that is still on its way (a secondary miss) waits for it without taking another register.
+    Main memory answers a block read `latency` cycles after its request starts, plus the transfer of the block at
+    `bandwidth` bytes per cycle over a single channel, on which requests queue. A writeback (a dirty block evicted
+    by `store_word` or `load_word`) occupies the channel for `writeback_time` cycles, delaying the read that follows it.
+    '''
+
+    def __init__(self, mm, latency=10, bandwidth=8, writeback_time=None, mshrs=4, hit_time=1):
+        if bandwidth <= 0 or mshrs < 1:
+            raise Exception("TIMING MODEL NEEDS A POSITIVE BANDWIDTH AND AT LEAST 1 MSHR")
+        self.mm = mm
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.mshrs = mshrs
+        self.hit_time = hit_time
+        self.transfer_time = math.ceil(mm.MAIN_MEMORY_BLOCK_SIZE / bandwidth)  # Cycles of channel use per block
+        self.writeback_time = writeback_time if writeback_time is not None else self.transfer_time
+
+        self.now = 0            # Issue cycle of the current access
+        self.end = 0            # Completion cycle of the latest access
+        self.channel_free = 0   # First cycle the memory channel is free
+        self.done = None        # Completion cycle of the current access's block read, if it missed
+        self.outstanding = []   # Heap of the (arrival cycle, tag) of the blocks being read, one per busy MSHR
+        self.arrivals = {}      # Tag -> arrival cycle of the blocks being read
+        self.prefetches = []    # Heap of the (arrival cycle, tag) of the blocks being prefetched, which take no MSHR
+        self.prefetched = {}    # Tag -> arrival cycle of the blocks being prefetched
+
+        # Counters of the stall cycles, the cycles the channel was busy, the sum of the access latencies,
+        # the secondary misses and the writebacks
+        self.stall_cycles = 0
+        self.busy_cycles = 0
+        self.latency_cycles = 0
+        self.merged = 0
+        self.writebacks = 0
+
+    def attach(self, cache):
+        # Time the accesses of a cache created with this model as its `mm`, which then performs them one at a time
+        cache.timing = self
+        cache.word_by_word = True
+
+    def __getattr__(self, name):
+        # The model stands in for main memory, so its geometry and counters are read through the model
+        if name.startswith("MAIN_MEMORY_") or name in ("read_queries", "write_queries", "prefetch_queries"):
+            return getattr(self.mm, name)
+        raise AttributeError(name)
+
+    def cycles(self):
+        # The cycles elapsed so far, until every access issued completed and main memory is idle
+        return max(self.now, self.end, self.channel_free)
+
+    def occupy(self, cycles):
+        # Queue a request on the memory channel; returns the cycle it starts at
+        start = max(self.now, self.channel_free)
+        self.channel_free = start + cycles
+        self.busy_cycles += cycles
+        return start
+
+    def read(self, addr):
+        # Time a block read: wait for a free MSHR, then for the channel, and record when the block arrives
+        prefetches = self.prefetches
+        while prefetches and prefetches[0][0] <= self.now:
+            arrival, tag = heapq.heappop(prefetches)
+            if self.prefetched.get(tag) == arrival:
+                del self.prefetched[tag]
+        outstanding = self.outstanding
+        while outstanding and outstanding[0][0] <= self.now:
+            arrival, tag = heapq.heappop(outstanding)
+            if self.arrivals.get(tag) == arrival:
+                del self.arrivals[tag]
+        if len(outstanding) >= self.mshrs:
+            arrival, tag = heapq.heappop(outstanding)
+            if self.arrivals.get(tag) == arrival:
+                del self.arrivals[tag]
+            self.stall_cycles += arrival - self.now
+            self.now = arrival
+        arrival = self.occupy(self.transfer_time) + self.latency + self.transfer_time
+        tag = addr // self.mm.MAIN_MEMORY_BLOCK_SIZE
+        heapq.heappush(outstanding, (arrival, tag))
+        self.arrivals[tag] = arrival
+        self.prefetched.pop(tag, None)  # The block missed, so a prefetch still on its way no longer brings it
+        return arrival
+
+    def access(self, addr, missed):
+        # Complete the current access (once the cache performed it) and issue the next one a cycle later
+        completion = self.now + self.hit_time
+        if self.done is not None:
+            completion = max(completion, self.done)
+        elif not missed:
+            # A hit waits for its block if it is still on its way, read on a miss or prefetched since (the later one
+            # brought the block, as a block is only read again once evicted)
+            tag = addr // self.mm.MAIN_MEMORY_BLOCK_SIZE
+            arrival = max(self.arrivals.get(tag, 0), self.prefetched.get(tag, 0))
+            if arrival > completion:
+                completion = arrival
+                self.merged += 1
+        self.latency_cycles += completion - self.now
+        self.end = max(self.end, completion)
+        self.done = None
+        self.now += 1
+
+    # Methods to read a block for the cache, on a miss or for a prefetcher (which takes no MSHR)
+    def mm_read(self, addr):
+        arrival = self.read(addr)
+        self.done = arrival if self.done is None else max(self.done, arrival)
+        return self.mm.mm_read(addr)
+
+    def mm_prefetch(self, addr):
+        tag = addr // self.mm.MAIN_MEMORY_BLOCK_SIZE
+        arrival = self.occupy(self.transfer_time) + self.latency + self.transfer_time
+        heapq.heappush(self.prefetches, (arrival, tag))
+        self.prefetched[tag] = arrival
+        return self.mm.mm_prefetch(addr)
+
+    # Methods to write blocks and words back, which only occupy the channel
+    def mm_write(self, addr, block):
+        self.occupy(self.writeback_time)
+        self.writebacks += 1
+        self.mm.mm_write(addr, block)
+
+    def mm_write_words(self, addr, words):
+        self.occupy(math.ceil(len(words) * self.mm.MAIN_MEMORY_WORD_SIZE / self.bandwidth))
+        self.mm.mm_write_words(addr, words)
@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import functools
+import gzip
+import io
+import itertools
+import mmap
+import re
+import struct
+import sys
+
+try:
+    import zstandard
+except ImportError:  # zstd-framed traces are only needed when compression is requested
+    zstandard = None
+
+# Operation codes shared by the text and binary trace formats
+OP_READ    = 0
+OP_WRITE   = 1
+OP_INVALID = 2  # A line that did not match the text trace format
+
+# Binary trace header: magic, format version, flags, address width and value width in bytes
+TRACE_MAGIC   = b"CTRC"
+TRACE_VERSION = 1
+TRACE_HEADER  = struct.Struct("<4sBBBB")
+FLAG_ZSTD     = 0x01  # The records following the header are a single zstd frame
+FLAG_WEIGHTED = 0x02  # The records are run-length encoded and carry a weight (see `run_length_encode`)
+
+# Weighted traces follow the header with the block size and word size their runs were encoded for
+WEIGHTED_HEADER = struct.Struct("<IB")
+
+# Each record is the operation, the address and the value (0 for reads), as little-endian integers
+# of the widths given in the header; by default a 16-bit address and a 32-bit value. Weighted records end with a 32-bit weight
+ADDR_FORMATS  = {2: "H", 4: "I", 8: "Q"}
+VALUE_FORMATS = {4: "i", 8: "q"}
+TRACE_RECORD  = struct.Struct("<BHi")
+
+# Address width (in bits) of the text traces, unless another one is given
+DEFAULT_ADDR_BITS = 16
+
+# Path that reads a trace from standard input, e.g. piped from a tracer
+STDIN_PATH = "-"
+
+# Magic numbers of the compressed files traces can be read from
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Traces are read in batches of up to this many records, so memory use does not depend on their length
+BATCH_RECORDS = 65536
+
+# Number of characters of a text trace read (and split into lines) at a time
+TEXT_CHUNK_SIZE = 1 << 20
+
+@functools.lru_cache(maxsize=None)
+def text_patterns(addr_bits=DEFAULT_ADDR_BITS):
+    '''
+    Returns the (write, read) patterns for the lines of a text (.test) trace with `addr_bits`-bit addresses,
+    which are written in hexadecimal with up to one digit per 4 bits.
+    '''
+    address = rf"(0x[0-9a-fA-F]{{1,{(addr_bits + 3) // 4}}})"
+    return (re.compile(rf"^W\s+{address}\s+(-?[0-9]+)\s*$"),
+            re.compile(rf"^R\s+{address}\s*$"))
+
+# Patterns for the lines of a text trace with the default address width
+WRITE_PATTERN, READ_PATTERN = text_patterns()
+
+@functools.lru_cache(maxsize=None)
+def core_text_patterns(addr_bits=DEFAULT_ADDR_BITS):
+    '''
+    Returns the (write, read) patterns for the lines of a multi-core text trace, which start with the decimal id
+    of the core performing the access, e.g. "1 W 0x79b0 42" or "0 R 0x79b0".
+    '''
+    return tuple(re.compile(r"^([0-9]+)\s+" + pattern.pattern[1:]) for pattern in text_patterns(addr_bits))
+
+def parse_text_line(line, patterns=(WRITE_PATTERN, READ_PATTERN)):
+    '''
+    Parses one line of a text trace into an (op, addr, data) record.
+    Lines that do not match either pattern become OP_INVALID records.
+    '''
+    write_pattern, read_pattern = patterns
+    # Handle write operations by matching the pattern "W <address> <data>"
+    if matches := write_pattern.search(line):
+        return OP_WRITE, int(matches.group(1), base=16), int(matches.group(2))
+    # Handle read operations by matching the pattern "R <address>"
+    elif matches := read_pattern.search(line):
+        return OP_READ, int(matches.group(1), base=16), 0
+    else:
+        return OP_INVALID, 0, 0
+
+def record_format(addr_bytes=2, value_bytes=4, weighted=False):
+    # The struct of a binary trace record with the given address and value widths, and a weight if `weighted`
+    if addr_bytes not in ADDR_FORMATS or value_bytes not in VALUE_FORMATS:
+        raise Exception("UNSUPPORTED TRACE RECORD WIDTH")
+    return struct.Struct(f"<B{ADDR_FORMATS[addr_bytes]}{VALUE_FORMATS[value_bytes]}{'I' if weighted else ''}")
+
+def read_header(t):
+    '''
+    Reads and validates the header of a binary trace opened in binary mode.
+    Returns the header flags and the address and value widths in bytes, leaving the file positioned at the first record.
+    '''
+    magic, version, flags, addr_bytes, value_bytes = TRACE_HEADER.unpack(t.read(TRACE_HEADER.size))
+    if magic != TRACE_MAGIC or version != TRACE_VERSION:
+        raise Exception("INVALID TRACE HEADER")
+    if addr_bytes not in ADDR_FORMATS or value_bytes not in VALUE_FORMATS:
+        raise Exception("UNSUPPORTED TRACE RECORD WIDTH")
+    return flags, addr_bytes, value_bytes
+
+def read_encoding(t, flags, weighted=None):
+    '''
+    Reads the (block size, word size) a weighted trace was run-length encoded for, which follows its header,
+    and checks that the reader simulates weighted records (`weighted`) of that geometry. Returns whether the trace is weighted.
+    '''
+    if not flags & FLAG_WEIGHTED:
+        return False
+    encoding = WEIGHTED_HEADER.unpack(t.read(WEIGHTED_HEADER.size))
+    if weighted is None:
+        raise Exception("RUN-LENGTH ENCODED TRACES ARE ONLY SIMULATED BY STATS-ONLY RUNS OF WRITE-BACK, WRITE-ALLOCATE "
+                        "CACHES WITHOUT A BUFFER, PREFETCHER, TIMING MODEL, HOT-SPOT INSTRUMENTATION OR PHASE PROFILING")
+    if encoding != tuple(weighted):
+        raise Exception("TRACE WAS RUN-LENGTH ENCODED FOR ANOTHER BLOCK OR WORD SIZE")
+    return True
+
+def is_binary_trace(path):
+    # Binary traces are recognized by their magic number rather than their file extension
+    if path == STDIN_PATH:
+        return False
+    with open(path, "rb") as t:
+        return t.read(len(TRACE_MAGIC)) == TRACE_MAGIC
+
+def is_mappable_trace(path):
+    # Only uncompressed binary trace files can be memory-mapped, every other trace is streamed
+    if not is_binary_trace(path):
+        return False
+    with open(path, "rb") as t:
+        flags, _, _ = read_header(t)
+    return not flags & FLAG_ZSTD
+
+def zstd_reader(stream):
+    # A buffered reader decompressing a zstd stream, across frames, without closing the underlying stream
+    if zstandard is None:
+        raise Exception("zstd-framed traces require the zstandard package")
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True, closefd=False))
+
+@contextlib.contextmanager
+def open_stream(path):
+    '''
+    Opens a trace file, or standard input for "-", as a buffered binary stream.
+    Files compressed with gzip or zstd are decompressed on the fly, recognized by their magic number rather than their extension.
+    '''
+    with contextlib.ExitStack() as stack:
+        if path == STDIN_PATH:
+            raw = sys.stdin.buffer  # Left open, as it belongs to the process
+        else:
+            raw = stack.enter_context(open(path, "rb"))
+
+        # A single peek: a pipe may hold fewer bytes at first, but compressors write their magic number in one go
+        magic = raw.peek(len(ZSTD_MAGIC))
+        if magic.startswith(GZIP_MAGIC):
+            yield stack.enter_context(gzip.GzipFile(fileobj=raw, mode="rb"))
+        elif magic.startswith(ZSTD_MAGIC):
+            yield stack.enter_context(zstd_reader(raw))
+        else:
+            yield raw
+
+def mapped_batches(path, batch_records=BATCH_RECORDS, skip=0, weighted=None):
+    # Unpack an uncompressed binary trace file from a memory mapping, one batch of records at a time, from record `skip` on
+    with open(path, "rb") as t:
+        flags, addr_bytes, value_bytes = read_header(t)
+        record = record_format(addr_bytes, value_bytes, read_encoding(t, flags, weighted))
+        size = batch_records * record.size
+        with mmap.mmap(t.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for start in range(t.tell() + skip * record.size, len(m), size):
+                yield list(record.iter_unpack(m[start:start + size]))
+
+def skip_records(batches, skip):
+    # Drop the first `skip` records of a stream of batches
+    for batch in batches:
+        if skip >= len(batch):
+            skip -= len(batch)
+            continue
+        yield batch[skip:] if skip else batch
+        skip = 0
+
+def binary_batches(stream, batch_records=BATCH_RECORDS, weighted=None):
+    # Unpack a binary trace from a stream positioned at its header, decompressing its records if they are a zstd frame
+    flags, addr_bytes, value_bytes = read_header(stream)
+    record = record_format(addr_bytes, value_bytes, read_encoding(stream, flags, weighted))
+    size = batch_records * record.size
+    with contextlib.ExitStack() as stack:
+        if flags & FLAG_ZSTD:
+            stream = stack.enter_context(zstd_reader(stream))
+        # Buffered reads only return short at the end of the stream
+        while chunk := stream.read(size):
+            if len(chunk) % record.size:
+                raise Exception("TRUNCATED TRACE RECORD")
+            yield list(record.iter_unpack(chunk))
+
+def parse_text_lines(lines, write_match, read_match):
+    # Same parsing as `parse_text_line`, over many lines with the patterns' `match` methods bound to locals
+    records = []
+    append = records.append
+    for line in lines:
+        if matches := write_match(line):
+            append((OP_WRITE, int(matches.group(1), base=16), int(matches.group(2))))
+        elif matches := read_match(line):
+            append((OP_READ, int(matches.group(1), base=16), 0))
+        else:
+            append((OP_INVALID, 0, 0))
+    return records
+
+def parse_core_lines(lines, write_match, read_match):
+    # Parse the lines of a multi-core text trace into (core, op, addr, data) records; invalid lines are reported by core 0
+    records = []
+    append = records.append
+    for line in lines:
+        if matches := write_match(line):
+            append((int(matches.group(1)), OP_WRITE, int(matches.group(2), base=16), int(matches.group(3))))
+        elif matches := read_match(line):
+            append((int(matches.group(1)), OP_READ, int(matches.group(2), base=16), 0))
+        else:
+            append((0, OP_INVALID, 0, 0))
+    return records
+
+def text_batches(stream, addr_bits=DEFAULT_ADDR_BITS, batch_records=BATCH_RECORDS, cores=False):
+    '''
+    Parses a text trace from a binary stream in large chunks: each chunk is split into lines in bulk,
+    the partial line at its end being carried over to the next one, and its lines are parsed into batches of records.
+    With `cores`, the lines start with a core id column, and the records are (core, op, addr, data).
+    '''
+    matchers = [pattern.match for pattern in (core_text_patterns if cores else text_patterns)(addr_bits)]
+    parse = parse_core_lines if cores else parse_text_lines
+    text = io.TextIOWrapper(stream)
+    try:
+        tail = ""
+        while chunk := text.read(TEXT_CHUNK_SIZE):
+            lines = (tail + chunk).split("\n")
+            tail = lines.pop()
+            records = parse(lines, *matchers)
+            for start in range(0, len(records), batch_records):
+                yield records[start:start + batch_records]
+        # The last line may not end with a newline
+        if tail:
+            yield parse([tail], *matchers)
+    finally:
+        text.detach()  # Hand the stream back without closing it
+
+def trace_batches(path, addr_bits=DEFAULT_ADDR_BITS, batch_records=BATCH_RECORDS, skip=0, weighted=None):
+    '''
+    Yields the (op, addr, data) records of a trace in lists of up to `batch_records` records, holding only a bounded
+    part of the trace in memory. The trace can be a text or binary file, standard input ("-"), or either format
+    compressed with gzip or zstd. Binary traces carry their own address width, text traces are parsed with
+    `addr_bits`-bit addresses.
+    The first `skip` records are left out, which seeks straight to them in an uncompressed binary trace file.
+    Run-length encoded traces can only be read by callers that simulate weighted records, passing the (block size,
+    word size) they simulate as `weighted`; their records are (op, addr, data, weight).
+    '''
+    if is_mappable_trace(path):
+        yield from mapped_batches(path, batch_records, skip, weighted)
+        return
+    with open_stream(path) as stream:
+        if stream.peek(len(TRACE_MAGIC)).startswith(TRACE_MAGIC):
+            yield from skip_records(binary_batches(stream, batch_records, weighted), skip)
+        else:
+            yield from skip_records(text_batches(stream, addr_bits, batch_records), skip)
+
+def core_trace_batches(path, addr_bits=DEFAULT_ADDR_BITS, batch_records=BATCH_RECORDS):
+    '''
+    Yields the (core, op, addr, data) records of a multi-core text trace (see `core_text_patterns`) in batches,
+    from a file or standard input, optionally compressed with gzip or zstd.
+    '''
+    with open_stream(path) as stream:
+        if stream.peek(len(TRACE_MAGIC)).startswith(TRACE_MAGIC):
+            raise Exception("CORE ID COLUMNS ARE ONLY SUPPORTED IN TEXT TRACES")
+        yield from text_batches(stream, addr_bits, batch_records, cores=True)
+
+def run_length_encode(records, block_size, word_size):
+    '''
+    Collapses the runs of consecutive accesses to the same block in (op, addr, data) records into weighted records,
+    returned as lists of operations, addresses, values and weights (see `BatchAccess.access_words`).
+    Traces are encoded once, when they are converted to the binary format (see `convert`).
+    In a cache that keeps a block once it accessed it, every access of a run but the first is a hit, and the hits of
+    a run only differ by the words they write. So the reads of a run become one record weighted by their number, and
+    its writes to each word one record of the last value written, weighted by theirs; the records are in the order
+    of their first access, so the first access of the run, which may miss, comes first.
+    Records that are neither reads nor writes are dropped.
+    '''
+    ops, addrs, values, weights = [], [], [], []
+    append_op, append_addr, append_value, append_weight = ops.append, addrs.append, values.append, weights.append
+    run_tag = None
+    read = None   # Index of the record of the reads of the current run
+    written = {}  # Word index -> index of the record of the writes of the current run to that word
+
+    for op, addr, value in records:
+        if op == OP_READ:
+            tag = addr // block_size
+            if tag == run_tag:
+                if read is not None:
+                    weights[read] += 1
+                    continue
+            else:
+                run_tag = tag
+                written = {}
+            read = len(weights)
+        elif op == OP_WRITE:
+            tag = addr // block_size
+            word = addr // word_size
+            if tag == run_tag:
+                index = written.get(word)
+                if index is not None:
+                    weights[index] += 1
+                    values[index] = value
+                    continue
+            else:
+                run_tag = tag
+                read = None
+                written = {}
+            written[word] = len(weights)
+        else:
+            continue
+        append_op(op)
+        append_addr(addr)
+        append_value(value)
+        append_weight(1)
+    return ops, addrs, values, weights
+
+def read_text_trace(path, addr_bits=DEFAULT_ADDR_BITS):
+    # Yield the records of a text trace one at a time
+    with open_stream(path) as stream:
+        yield from itertools.chain.from_iterable(text_batches(stream, addr_bits))
+
+def read_binary_trace(path):
+    # Yield the records of a binary trace one at a time
+    with open_stream(path) as stream:
+        yield from itertools.chain.from_iterable(binary_batches(stream))
+
+def open_trace(path, addr_bits=DEFAULT_ADDR_BITS, weighted=None):
+    '''
+    Returns an iterator over the (op, addr, data) records of a trace (see `trace_batches` for the supported sources,
+    and for `weighted`).
+    '''
+    return itertools.chain.from_iterable(trace_batches(path, addr_bits, weighted=weighted))
+
+def write_binary_trace(records, path, compress=False, addr_bytes=2, value_bytes=4, encoding=None):
+    '''
+    Writes (op, addr, data) records to a binary trace with the given address and value widths, optionally as a zstd frame.
+    With the (block size, word size) of an `encoding`, the records are run-length encoded (op, addr, data, weight) ones.
+    Returns the number of records written.
+    '''
+    record = record_format(addr_bytes, value_bytes, encoding is not None)
+    if compress and zstandard is None:
+        raise Exception("zstd-framed traces require the zstandard package")
+
+    count = 0
+    with open(path, "wb") as out:
+        flags = (FLAG_ZSTD if compress else 0) | (FLAG_WEIGHTED if encoding is not None else 0)
+        out.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, flags, addr_bytes, value_bytes))
+        if encoding is not None:
+            out.write(WEIGHTED_HEADER.pack(*encoding))
+        if compress:
+            writer = zstandard.ZstdCompressor().stream_writer(out, closefd=False)
+        else:
+            writer = out
+        pack = record.pack
+        for record in records:
+            writer.write(pack(*record))
+            count += 1
+        if compress:
+            writer.close()
+    return count
+
+def encode_batches(batches, block_size, word_size):
+    # Run-length encode a stream of batches of records into weighted records, the runs being cut at the batch boundaries
+    for batch in batches:
+        yield from zip(*run_length_encode(batch, block_size, word_size))
+
+def convert(src, dst, compress=False, addr_bytes=2, value_bytes=4, encoding=None):
+    '''
+    Converts a text (.test) trace to the binary format, parsing addresses as wide as the binary ones.
+    With the (block size, word size) of an `encoding`, the runs of accesses to the same block are run-length encoded
+    into weighted records, once, rather than by every simulation of the trace.
+    '''
+    if encoding is None:
+        return write_binary_trace(read_text_trace(src, addr_bytes * 8), dst, compress, addr_bytes, value_bytes)
+    with open_stream(src) as stream:
+        records = encode_batches(text_batches(stream, addr_bytes * 8), *encoding)
+        return write_binary_trace(records, dst, compress, addr_bytes, value_bytes, encoding)
+
+# Function to parse command-line arguments passed to the converter
+def parse_cli_args():
+
+    parser = argparse.ArgumentParser(description='convert a text (.test) trace to the binary trace format')
+
+    # Argument for specifying the text trace to convert
+    parser.add_argument(
+        'testfile',
+        type=str,
+        help='the text trace file to convert')
+
+    # Argument for specifying the binary trace to write
+    parser.add_argument(
+        'outfile',
+        type=str,
+        help='the binary trace file to write')
+
+    # Argument for compressing the records with zstd
+    parser.add_argument(
+        '--zstd',
+        action='store_true',
+        help='write the records as a zstd frame')
+
+    # Arguments for specifying the widths of the binary records
+    parser.add_argument(
+        '--addr_bytes',
+        type=int,
+        choices=tuple(ADDR_FORMATS),
+        default=2,
+        help='the width of the addresses in bytes')
+
+    parser.add_argument(
+        '--value_bytes',
+        type=int,
+        choices=tuple(VALUE_FORMATS),
+        default=4,
+        help='the width of the written values in bytes')
+
+    # Arguments for run-length encoding the records for a cache geometry
+    parser.add_argument(
+        '--rle',
+        action='store_true',
+        help='collapse the runs of accesses to the same block into weighted records, which only stats-only runs of '
+             'write-back, write-allocate caches of the same --block_size and --word_size can simulate')
+
+    parser.add_argument(
+        '--block_size',
+        type=int,
+        default=32,
+        help='with --rle, the block size in bytes of the caches that will simulate the trace')
+
+    parser.add_argument(
+        '--word_size',
+        type=int,
+        default=4,
+        help='with --rle, the word size in bytes of the caches that will simulate the trace')
+
+    return parser.parse_args()
+
+# Main function to convert a text trace to a binary trace
+def main():
+    cli_args = parse_cli_args()
+    count = convert(cli_args.testfile, cli_args.outfile, cli_args.zstd, cli_args.addr_bytes, cli_args.value_bytes,
+                    (cli_args.block_size, cli_args.word_size) if cli_args.rle else None)
+    print(f"Converted {count} records from {cli_args.testfile} to {cli_args.outfile}")
+
+# Entry point of the script
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+from collections import OrderedDict
+import os
+
+import numpy as np
+
+from traces import open_trace, is_binary_trace, read_header, FLAG_ZSTD, FLAG_WEIGHTED, TRACE_HEADER, DEFAULT_ADDR_BITS, OP_WRITE, OP_INVALID
+
+def record_dtype(addr_bytes, value_bytes):
+    # NumPy layout of a binary trace record with the given address and value widths (see `traces.record_format`)
+    return np.dtype([('op', 'u1'), ('addr', f'<u{addr_bytes}'), ('value', f'<i{value_bytes}')])
+
+# Layout used when a trace has to be parsed record by record
+PARSED_DTYPE = np.dtype([('op', 'u1'), ('addr', '<i8')])
+
+# With at least this many non-empty sets, all sets are stepped in lock-step with array operations,
+# otherwise each set is simulated in a plain loop over its (run-collapsed) accesses
+LOCKSTEP_MIN_SETS = 64
+
+class MemoryStats():
+    '''
+    Main memory counters computed by the vectorized engine, named like those of `Memory`.
+    '''
+
+    def __init__(self, read_queries, write_queries):
+        self.read_queries = int(read_queries)
+        self.write_queries = int(write_queries)
+
+class CacheStats():
+    '''
+    Cache counters computed by the vectorized engine.
+    They are named like the counters of the cache classes, so `CacheRunner.print_stats` can report them.
+    '''
+
+    def __init__(self, write_queries, read_queries, write_misses, read_misses, mm_reads, mm_writes):
+        self.cache_write_queries = int(write_queries)
+        self.cache_read_queries = int(read_queries)
+        self.cache_write_misses = int(write_misses)
+        self.cache_read_misses = int(read_misses)
+        self.mm = MemoryStats(mm_reads, mm_writes)
+
+def load_trace(path, addr_bits=DEFAULT_ADDR_BITS):
+    '''
+    Loads a text or binary trace as NumPy arrays of operations and addresses.
+    Uncompressed binary traces are memory-mapped instead of being parsed.
+    '''
+    if is_binary_trace(path):
+        with open(path, "rb") as t:
+            flags, addr_bytes, value_bytes = read_header(t)
+        if not flags & (FLAG_ZSTD | FLAG_WEIGHTED):  # Weighted traces are rejected by `open_trace`
+            if os.path.getsize(path) == TRACE_HEADER.size:
+                return np.empty(0, np.uint8), np.empty(0, np.int64)
+            records = np.memmap(path, dtype=record_dtype(addr_bytes, value_bytes), mode='r', offset=TRACE_HEADER.size)
+            return records['op'], records['addr']
+    records = np.fromiter(((op, addr) for op, addr, _ in open_trace(path, addr_bits)), dtype=PARSED_DTYPE)
+    return records['op'], records['addr']
+
+def split_trace(ops, addrs, num_sets, block_size):
+    '''
+    Drops invalid records and returns the write flags, block numbers and set indices of the accesses,
+    stably sorted by set so every set's accesses are contiguous and in trace order.
+    '''
+    valid = ops != OP_INVALID
+    is_write = ops[valid] == OP_WRITE
+    blocks = np.asarray(addrs)[valid].astype(np.int64) // block_size
+    sets = blocks % num_sets
+    order = np.argsort(sets, kind='stable')
+    return is_write[order], blocks[order], sets[order]
+
+def collapse_runs(is_write, blocks, sets):
+    '''
+    Finds the runs of consecutive accesses to the same block within a set.
+    Only the first access of a run can miss, the rest are guaranteed hits that leave the recency order unchanged.
+    Returns the run starts, whether each run starts a new set, and whether each run wrote its block.
+    '''
+    n = len(blocks)
+    first_in_set = np.ones(n, dtype=bool)
+    first_in_set[1:] = sets[1:] != sets[:-1]
+    run_start = first_in_set.copy()
+    run_start[1:] |= blocks[1:] != blocks[:-1]
+    starts = np.flatnonzero(run_start)
+    run_dirty = np.logical_or.reduceat(is_write, starts) if n else np.zeros(0, dtype=bool)
+    return starts, first_in_set[starts], run_dirty
+
+def simulate_simple(ops, addrs, block_size=32):
+    # Every access of the simple cache misses, reads its block and, for writes, writes it back
+    is_write, _, _ = split_trace(ops, addrs, 1, block_size)
+    writes = np.count_nonzero(is_write)
+    reads = len(is_write) - writes
+    return CacheStats(writes, reads, writes, reads, writes + reads, writes)
+
+def simulate_dmc(ops, addrs, num_sets, block_size=32):
+    '''
+    Computes the `DirectMappedCache` counters of a whole trace without a per-access loop.
+    Within a set, an access hits exactly when it touches the same block as the set's previous access.
+    '''
+    is_write, blocks, sets = split_trace(ops, addrs, num_sets, block_size)
+    writes = np.count_nonzero(is_write)
+    reads = len(is_write) - writes
+
+    # Each miss starts a residency (run) of a block in its line
+    starts, new_set, run_dirty = collapse_runs(is_write, blocks, sets)
+    write_misses = np.count_nonzero(is_write[starts])
+    read_misses = len(starts) - write_misses
+
+    # A residency is evicted, and written back if dirty, when the next residency is in the same set
+    writebacks = np.count_nonzero(run_dirty[:-1] & ~new_set[1:])
+    return CacheStats(writes, reads, write_misses, read_misses, len(starts), writebacks)
+
+def simulate_lru(ops, addrs, num_sets, num_ways, block_size=32):
+    '''
+    Computes the counters of an LRU `SetAssociativeCache` (or `FullyAssociativeCache` with one set) of a whole trace.
+    Runs of repeated accesses to a block are collapsed first. The remaining accesses are replayed either
+    for all sets at once, one column of per-set accesses at a time, or set by set in a plain loop when there are few sets.
+    '''
+    is_write, blocks, sets = split_trace(ops, addrs, num_sets, block_size)
+    writes = np.count_nonzero(is_write)
+    reads = len(is_write) - writes
+
+    starts, new_set, run_dirty = collapse_runs(is_write, blocks, sets)
+    run_blocks = blocks[starts]
+    run_writes = is_write[starts]
+
+    # Runs of each set are contiguous: find where each set's runs begin and how many there are
+    set_starts = np.flatnonzero(new_set)
+    set_lengths = np.diff(np.append(set_starts, len(starts)))
+
+    if len(set_starts) >= LOCKSTEP_MIN_SETS:
+        miss, writebacks = replay_lockstep(run_blocks, run_dirty, set_starts, set_lengths, num_ways)
+    else:
+        miss, writebacks = replay_per_set(run_blocks, run_dirty, set_starts, set_lengths, num_ways)
+
+    write_misses = np.count_nonzero(miss & run_writes)
+    read_misses = np.count_nonzero(miss) - write_misses
+    return CacheStats(writes, reads, write_misses, read_misses, write_misses + read_misses, writebacks)
+
+def replay_lockstep(run_blocks, run_dirty, set_starts, set_lengths, num_ways):
+    '''
+    Replays the runs of every set in lock-step, keeping the tags, last-use times and dirty bits of all sets in 2D arrays.
+    Returns a miss flag per run and the number of dirty evictions.
+    '''
+    # Order the sets by decreasing length, so the sets still active at each column are a prefix of the rows
+    order = np.argsort(-set_lengths, kind='stable')
+    set_starts = set_starts[order]
+    set_lengths = set_lengths[order]
+
+    tags = np.full((len(set_starts), num_ways), -1, dtype=np.int64)
+    last_used = np.zeros((len(set_starts), num_ways), dtype=np.int64)
+    dirty = np.zeros((len(set_starts), num_ways), dtype=bool)
+    miss = np.zeros(len(run_blocks), dtype=bool)
+    writebacks = 0
+
+    active = len(set_starts)
+    for column in range(int(set_lengths[0]) if len(set_lengths) else 0):
+        while set_lengths[active - 1] <= column:
+            active -= 1
+        rows = np.arange(active)
+        runs = set_starts[:active] + column
+        block = run_blocks[runs]
+
+        # A hit reuses the matching way, a miss takes the least recently used (or first invalid) way
+        match = tags[:active] == block[:, None]
+        hit = match.any(axis=1)
+        way = np.where(hit, match.argmax(axis=1), last_used[:active].argmin(axis=1))
+
+        evicted = ~hit & (tags[rows, way] != -1)
+        writebacks += np.count_nonzero(evicted & dirty[rows, way])
+        miss[runs] = ~hit
+
+        tags[rows, way] = block
+        last_used[rows, way] = column + 1
+        dirty[rows, way] = run_dirty[runs] | (hit & dirty[rows, way])
+
+    return miss, writebacks
+
+def replay_per_set(run_blocks, run_dirty, set_starts, set_lengths, num_ways):
+    '''
+    Replays the runs of each set in turn with an ordered dict of block -> dirty bit as the LRU stack.
+    Returns a miss flag per run and the number of dirty evictions.
+    '''
+    run_blocks = run_blocks.tolist()
+    run_dirty = run_dirty.tolist()
+    miss = [False] * len(run_blocks)
+    writebacks = 0
+
+    for start, length in zip(set_starts.tolist(), set_lengths.tolist()):
+        lru = OrderedDict()
+        for run in range(start, start + length):
+            block = run_blocks[run]
+            if block in lru:
+                lru.move_to_end(block)
+                if run_dirty[run]:
+                    lru[block] = True
+            else:
+                miss[run] = True
+                if len(lru) >= num_ways:
+                    writebacks += lru.popitem(last=False)[1]
+                lru[block] = run_dirty[run]
+
+    return np.array(miss, dtype=bool), writebacks
+
+def simulate(cache_type, ops, addrs, num_sets, num_ways, block_size=32):
+    '''
+    Computes the counters of the given cache configuration, as reported by `CacheRunner.print_stats`.
+    '''
+    if cache_type == "simple":
+        return simulate_simple(ops, addrs, block_size)
+    elif cache_type == "dmc":
+        return simulate_dmc(ops, addrs, num_sets, block_size)
+    elif cache_type == "fac":
+        return simulate_lru(ops, addrs, 1, num_ways, block_size)
+    elif cache_type == "sac":
+        return simulate_lru(ops, addrs, num_sets, num_ways, block_size)
+    raise Exception(f"UNKNOWN CACHE TYPE: {cache_type}")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+from collections import OrderedDict
+
+# Policies on write hits and on write misses
+WRITE_POLICIES = ('write-back', 'write-through')
+WRITE_MISS_POLICIES = ('write-allocate', 'no-write-allocate')
+
+class WriteBuffer():
+    '''
+    A bounded buffer of pending writes between a cache and the memory (or level) below it, which it stands in for.
+    Each entry holds the words written to one block, or a whole block written back, and writes to a block that
+    already has an entry coalesce into it, so they cost a single write below.
+
+    Time is counted in accesses of the cache that owns the buffer, plus the time it stalled: the memory below retires
+    the oldest entry every `drain_interval` accesses while the buffer is not empty, and a write of a new block into
+    a full buffer stalls the cache until the oldest entry has retired. Reads of a block with a pending entry see its words (forwarding).
+    '''
+
+    def __init__(self, mm, entries, drain_interval, owner):
+        if entries < 1 or drain_interval < 1:
+            raise Exception("WRITE BUFFER NEEDS AT LEAST 1 ENTRY AND A DRAIN INTERVAL OF AT LEAST 1")
+        self.mm = mm
+        self.entries = entries
+        self.drain_interval = drain_interval
+        self.owner = owner  # The cache writing to the buffer, whose accesses are the clock
+
+        # Pending entries from oldest to newest, keyed by block address: a whole block (array) or a dict of word indexes to words
+        self.pending = OrderedDict()
+        self.retired_at = 0  # The time the memory below last retired an entry, or went idle
+
+        # Counters of the write requests, the ones merged into an entry, the stalls and the accesses they waited for,
+        # the reads served from an entry, and the sum and maximum of the occupancy seen by the write requests
+        self.writes = 0
+        self.coalesced = 0
+        self.stalls = 0
+        self.stall_time = 0
+        self.forwarded = 0
+        self.occupancy = 0
+        self.max_occupancy = 0
+
+    def __getattr__(self, name):
+        # The buffer stands in for the memory below, so its geometry and counters are read through the buffer
+        # (looked up on each use, as a lower level of a hierarchy only gets its geometry once it is attached)
+        if name.startswith("MAIN_MEMORY_") or name in ("read_queries", "write_queries"):
+            return getattr(self.mm, name)
+        raise AttributeError(name)
+
+    def now(self):
+        return self.owner.cache_read_queries + self.owner.cache_write_queries + self.stall_time
+
+    def retire(self):
+        # Write the oldest entry below, as one write
+        addr, entry = self.pending.popitem(last=False)
+        if isinstance(entry, dict):
+            self.mm.mm_write_words(addr, entry)
+        else:
+            self.mm.mm_write(addr, entry)
+
+    def drain(self, now):
+        # Retire the entries the memory below had the time to write since the last call; an idle memory banks no time
+        if not self.pending:
+            self.retired_at = now
+            return
+        due = (now - self.retired_at) // self.drain_interval
+        while due > 0 and self.pending:
+            self.retire()
+            self.retired_at += self.drain_interval
+            due -= 1
+
+    def put(self, addr, words, block=None):
+        # Buffer a write of `words` (a dict of word indexes to words) or of a whole `block`, stalling if the buffer is full
+        now = self.now()
+        self.drain(now)
+        self.writes += 1
+
+        entry = self.pending.get(addr)
+        if entry is not None:
+            self.coalesced += 1
+            if block is not None:
+                self.pending[addr] = block[:]
+            else:
+                for index, word in words.items():
+                    entry[index] = word
+        else:
+            if len(self.pending) >= self.entries:
+                # The cache waits until the oldest entry has retired
+                self.stalls += 1
+                self.retired_at += self.drain_interval
+                self.stall_time += self.retired_at - now
+                self.retire()
+            self.pending[addr] = block[:] if block is not None else dict(words)
+
+        self.occupancy += len(self.pending)
+        self.max_occupancy = max(self.max_occupancy, len(self.pending))
+
+    def forward(self, addr, read):
+        # Read a block with `read`, with the words of its pending entry (if any) forwarded
+        self.drain(self.now())
+        entry = self.pending.get(addr)
+        if entry is None:
+            return read(addr)
+        self.forwarded += 1
+        if not isinstance(entry, dict):
+            return entry[:]
+        block = read(addr)
+        for index, word in entry.items():
+            block[index] = word
+        return block
+
+    # Methods to read a block for the cache, on a miss or for a prefetcher
+    def mm_read(self, addr):
+        return self.forward(addr, self.mm.mm_read)
+
+    def mm_prefetch(self, addr):
+        return self.forward(addr, self.mm.mm_prefetch)
+
+    # Method to buffer a whole block evicted from the cache
+    def mm_write(self, addr, block):
+        self.put(addr, None, block)
+
+    # Method to buffer some words of a block written through the cache
+    def mm_write_words(self, addr, words):
+        self.put(addr, words)
+
+class WritePolicy():
+    '''
+    Write policy of a cache, on write hits and on write misses, with an optional `WriteBuffer` below it:
+      write-back:        a store only updates the cache, and dirty blocks are written below when they are evicted
+      write-through:     a store also writes its word below right away, so blocks are never dirty
+      write-allocate:    a store that misses loads its block, like a read
+      no-write-allocate: a store that misses only writes its word below, and leaves the cache unchanged
+
+    The caches mixing this in call `set_write_policy` once their `mm` is set. The specialized loops of `access_words`
+    model the default write-back, write-allocate cache without a buffer; other configurations are simulated access
+    by access (`word_by_word`), so the buffer's clock is always up to date, as are the caches a prefetcher or
+    a timing model is attached to.
+    '''
+
+    # Defaults of a write-back, write-allocate cache without a write buffer
+    write_through = False
+    write_allocate = True
+    write_buffer = None
+    word_by_word = False
+
+    def set_write_policy(self, write_policy='write-back', write_miss='write-allocate', write_buffer=0, drain_interval=10):
+        if write_policy not in WRITE_POLICIES:
+            raise Exception(f"UNKNOWN WRITE POLICY: {write_policy}")
+        if write_miss not in WRITE_MISS_POLICIES:
+            raise Exception(f"UNKNOWN WRITE MISS POLICY: {write_miss}")
+        self.write_through = write_policy == 'write-through'
+        self.write_allocate = write_miss == 'write-allocate'
+        if write_buffer:
+            self.write_buffer = self.mm = WriteBuffer(self.mm, write_buffer, drain_interval, self)
+        self.word_by_word = self.write_through or not self.write_allocate or self.write_buffer is not None
+
+    def write_word_below(self, tag, block_offset, word):
+        # Write a single word of block `tag` below the cache (write-through, or a store that does not allocate)
+        self.mm.mm_write_words(tag * self.mm.MAIN_MEMORY_BLOCK_SIZE, {block_offset: word})